@@ -3,23 +3,59 @@ Flask API Server for Route Optimization
 Provides REST API endpoints for the frontend to optimize delivery routes
 """
 
+import logging
 import os
-from flask import Flask, request, jsonify
+from datetime import date, datetime, timezone
+from zoneinfo import ZoneInfo
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
-from route_optimizer import optimize_routes, geocode_addresses
+import db
+import metrics
+from matrix_providers import MATRIX_BACKENDS, SERVICE_TIMEZONE, departure_slices
+from batch_planner import optimize_days
+from bulk_geocode import BULK_FORMATS, detect_format, format_results, geocode_rows, read_rows
+from optimization_jobs import get_runner
+from response_encoding import RESPONSE_FORMATS, FastJSONProvider, apply_response_format, compress_response
+from result_cache import get_default_result_cache, request_key
+from route_templates import get_default_template_store
+from route_optimizer import (DEFAULT_QUALITY, INCREMENTAL_TIME_LIMIT_SECONDS, SOLVER_PROFILES, geocode_addresses,
+                             optimize_routes, reoptimize_routes, solver_settings)
+from solver_queue import SolverBusy, get_solver_queue, solver_slot
+from geocoder import get_default_geocode_cache
+from travel_cache import get_default_cache
 
 # Load environment variables
 load_dotenv()
 
+logging.basicConfig(
+    level=os.getenv('LOG_LEVEL', 'INFO').upper(),
+    format='%(asctime)s %(levelname)s %(name)s: %(message)s'
+)
+logger = logging.getLogger(__name__)
+
 app = Flask(__name__)
+app.json = FastJSONProvider(app)  # orjson when installed
 CORS(app)  # Enable CORS for frontend requests
 
 # Configuration
 GOOGLE_API_KEY = os.getenv('GOOGLE_MAPS_API_KEY')
 
+# Geocoding / matrix time on top of the solver budget, for Retry-After estimates
+QUEUE_OVERHEAD_SECONDS = 2
+# Queued optimizations (/api/optimize-routes/jobs) wait this long for a solver slot
+JOB_QUEUE_WAIT_SECONDS = 600
+# Retry-After when every job event stream slot is taken
+STREAM_RETRY_SECONDS = 5
+
 if not GOOGLE_API_KEY:
-    print("WARNING: GOOGLE_MAPS_API_KEY not found in environment variables")
+    logger.warning("GOOGLE_MAPS_API_KEY not found in environment variables")
+
+
+@app.after_request
+def compress(response):
+    """gzip / brotli response bodies for clients that accept it"""
+    return compress_response(response, request.accept_encodings)
 
 
 @app.route('/health', methods=['GET'])
@@ -32,6 +68,28 @@ def health_check():
     })
 
 
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """Travel time, geocode, optimization result cache and route template statistics"""
+    cache = get_default_cache()
+    geocode_cache = get_default_geocode_cache()
+    result_cache = get_default_result_cache()
+    templates = get_default_template_store()
+    return jsonify({
+        'success': True,
+        'travel_times': cache.stats() if cache else None,
+        'geocodes': geocode_cache.stats() if geocode_cache else None,
+        'optimize_results': result_cache.stats() if result_cache else None,
+        'route_templates': templates.stats() if templates else None
+    })
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus metrics of this worker process (text exposition format)"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
 @app.route('/api/geocode', methods=['POST'])
 def geocode():
     """
@@ -69,7 +127,8 @@ def geocode():
             }), 400
 
         # Geocode addresses
-        coords = geocode_addresses(addresses, GOOGLE_API_KEY)
+        with metrics.stage('geocode'):
+            coords = geocode_addresses(addresses, GOOGLE_API_KEY)
 
         # Format response
         result = []
@@ -81,18 +140,84 @@ def geocode():
                 'success': lat is not None and lng is not None
             })
 
+        metrics.REQUESTS.inc(endpoint='geocode', outcome='success')
         return jsonify({
             'success': True,
             'coordinates': result
         })
 
     except Exception as e:
+        metrics.REQUESTS.inc(endpoint='geocode', outcome='error')
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
 
+@app.route('/api/geocode/bulk', methods=['POST'])
+def geocode_bulk():
+    """
+    Geocode an address book of any size, streaming results as they resolve
+
+    Send NDJSON (Content-Type: application/x-ndjson) or CSV (text/csv) as the
+    request body, or upload a .ndjson / .csv file as multipart field "file".
+
+    NDJSON rows: {"id": "p-1", "address": "123 Main St, Boston, MA"} (or a bare string)
+    CSV: header row with an "address" column and optionally "id"
+
+    Rows are geocoded in batches of 50 (bulk_geocode.BATCH_SIZE), two at a
+    time, and each batch's results are streamed as soon as it finishes, so
+    results arrive 50 at a time and not necessarily in input order: use
+    "line" (1-based input line) to match them to the upload.
+
+    Response (streamed, same format as the upload; ?format=ndjson|csv overrides):
+    {"line": 1, "id": "p-1", "address": "123 Main St, Boston, MA", "lat": 42.123, "lng": -71.456,
+     "success": true, "error": null}
+    {"line": 2, "id": "p-2", "address": "", "lat": null, "lng": null, "success": false,
+     "error": "Missing address"}
+    {"summary": {"rows": 2, "succeeded": 1, "failed": 1}}  // NDJSON only
+    """
+    upload = request.files.get('file')
+    if upload is not None:
+        stream, input_format = upload.stream, detect_format(upload.mimetype, upload.filename)
+    else:
+        stream, input_format = request.stream, detect_format(request.mimetype)
+
+    if input_format is None:
+        metrics.REQUESTS.inc(endpoint='geocode_bulk', outcome='invalid')
+        return jsonify({
+            'success': False,
+            'error': 'Upload NDJSON (application/x-ndjson) or CSV (text/csv)'
+        }), 400
+
+    output_format = request.args.get('format', input_format)
+    if output_format not in BULK_FORMATS:
+        metrics.REQUESTS.inc(endpoint='geocode_bulk', outcome='invalid')
+        return jsonify({
+            'success': False,
+            'error': f"format must be one of: {', '.join(BULK_FORMATS)}"
+        }), 400
+
+    try:
+        rows = read_rows(stream, input_format)
+    except ValueError as e:
+        metrics.REQUESTS.inc(endpoint='geocode_bulk', outcome='invalid')
+        return jsonify({
+            'success': False,
+            'error': f'Validation error: {str(e)}'
+        }), 400
+
+    metrics.REQUESTS.inc(endpoint='geocode_bulk', outcome='success')
+    return Response(
+        stream_with_context(format_results(geocode_rows(rows, GOOGLE_API_KEY), output_format)),
+        mimetype='text/csv' if output_format == 'csv' else 'application/x-ndjson',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Disable proxy buffering (nginx)
+        }
+    )
+
+
 @app.route('/api/optimize-routes', methods=['POST'])
 def optimize_routes_endpoint():
     """
@@ -105,7 +230,12 @@ def optimize_routes_endpoint():
                 "id": "job-1",
                 "address": "123 Main St, Boston, MA",
                 "latitude": 42.123,  // optional if address provided
-                "longitude": -71.456  // optional if address provided
+                "longitude": -71.456,  // optional if address provided
+                "service_minutes": 45,         // optional: time on site
+                "time_window_start": "09:00",  // optional: "HH:MM" or minutes after midnight
+                "time_window_end": "12:00",    // optional
+                "priority": 1,                 // optional: higher = dropped last
+                "demand": 1                    // optional: crew capacity units used
             }
         ],
         "workers": [
@@ -114,9 +244,37 @@ def optimize_routes_endpoint():
                 "name": "John Doe",
                 "depot_address": "1 City Hall Square, Boston, MA",
                 "depot_lat": 42.123,  // optional if depot_address provided
-                "depot_lng": -71.456  // optional if depot_address provided
+                "depot_lng": -71.456,  // optional if depot_address provided
+                "shift_start": "08:00",  // optional
+                "shift_end": "17:00",    // optional
+                "capacity": 12           // optional: total demand per day
             }
-        ]
+        ],
+        "matrix_backend": "google",  // optional: google | haversine | road_graph
+        "decompose": null,           // optional: force/disable cluster-first mode for large days
+        "quality": "balanced",       // optional: fast | balanced | quality (latency vs. plan quality)
+        "time_limit_seconds": null,  // optional: fixed solver time limit instead of the scaled budget
+        "include_metrics": false,    // optional: add stage timings / API usage to metadata
+        "route_date": "2026-03-02",  // optional: load that day's open jobs from the database
+                                     // when "jobs" is omitted (needs DATABASE_URL)
+        "job_ids": ["..."],          // optional: load these jobs from the database instead
+        "worker_ids": ["..."],       // optional: load these workers when "workers" is omitted
+                                     // (default: every worker)
+        "save": false,               // optional: write the routes for route_date back to the
+                                     // database in one transaction
+        "store_geocoded": false,     // optional: write coordinates geocoded from addresses back
+                                     // to the jobs / workers rows (always on for rows loaded
+                                     // from the database)
+        "response_format": "full",   // optional: full | compact (shared location list, encoded
+                                     // polyline paths; see response_encoding.py)
+        "cache": true,               // optional: false to re-solve even if an identical request
+                                     // was answered recently
+        "templates": true,           // optional: false to ignore past plans of recurring stops
+                                     // (see route_templates.py)
+        "time_dependent": false,     // optional: true to cost each leg with the traffic of the
+                                     // time it is driven (google backend; DEPARTURE_SLICES)
+        "departure_slices": ["08:00", "12:00", "16:00"]  // optional: times of day to fetch
+                                     // travel times for (implies time_dependent)
     }
 
     Response:
@@ -130,82 +288,687 @@ def optimize_routes_endpoint():
                     {
                         "job_id": "job-1",
                         "order": 1,
-                        "location": [42.123, -71.456]
+                        "location": [42.123, -71.456],
+                        "arrival_time": "09:12"  // with time windows or shifts
                     }
                 ],
-                "total_duration_seconds": 1800,
+                "total_duration_seconds": 1800,  // driving plus service time
                 "total_distance_meters": 15000,
-                "optimized_path": [[42.123, -71.456], [42.234, -71.567]]
+                "optimized_path": [[42.123, -71.456], [42.234, -71.567]],
+                "start_time": "08:40",  // with time windows or shifts
+                "end_time": "10:30"
             }
+        },
+        "dropped_jobs": [],  // ids of jobs no crew could fit in (also listed in warnings)
+        "geocoded": {  // coordinates resolved from addresses, to store on the rows
+            "jobs": [{"job_id": "job-1", "latitude": 42.123, "longitude": -71.456}],
+            "workers": [{"worker_id": "worker-1", "depot_latitude": 42.123, "depot_longitude": -71.456}]
+        },
+        "saved_routes": {"worker-1": "<route uuid>"},  // with "save": true (geocoded is stored too,
+                                                       // as with "store_geocoded")
+        "metadata": {
+            "num_jobs": 1,
+            "num_workers": 1,
+            "matrix_backend": "google",
+            "timestamp": "2026-03-02T13:05:00+00:00",
+            "cached": false,  // true when an identical request's result was reused
+            "template": {"id": 12, "coverage": 0.95, "reused": false}  // past plan the solver started
+                                                                       // from (reused: returned as is)
         }
     }
+
+    When the host is already running and queueing as many optimizations as
+    it may (see solver_queue.py), the response is 429 with a Retry-After
+    header and "retry_after" seconds in the body.
+    """
+    try:
+        params, error = _parse_optimize_request(request.get_json())
+        if error:
+            metrics.REQUESTS.inc(endpoint='optimize', outcome='invalid')
+            return error
+
+        response = _run_optimization(**params)
+        metrics.REQUESTS.inc(endpoint='optimize', outcome='success')
+        return jsonify(response)
+
+    except SolverBusy as e:
+        return _busy_response('optimize', e)
+
+    except ValueError as e:
+        metrics.REQUESTS.inc(endpoint='optimize', outcome='invalid')
+        return jsonify({
+            'success': False,
+            'error': f'Validation error: {str(e)}'
+        }), 400
+
+    except Exception as e:
+        metrics.REQUESTS.inc(endpoint='optimize', outcome='error')
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/optimize-routes/incremental', methods=['POST'])
+def reoptimize_routes_endpoint():
+    """
+    Re-optimize a previous plan after jobs were added, cancelled or moved
+
+    Starts the solver from the previous routes, so it returns in a fraction
+    of the time of a full /api/optimize-routes call.
+
+    Request body:
+    {
+        "previous_routes": { ... },  // "routes" from a previous optimize response
+        "add_jobs": [                // optional; an existing id replaces that job (moved)
+            {"id": "job-7", "address": "9 Elm St, Boston, MA"}
+        ],
+        "remove_job_ids": ["job-3"], // optional
+        "update_workers": [          // optional: changed depots or new workers
+            {"id": "worker-1", "depot_address": "100 Cambridge St, Boston, MA"}
+        ],
+        "matrix_backend": "google",  // optional
+        "time_limit_seconds": 1,     // optional
+        "quality": "balanced",       // optional
+        "include_metrics": false,    // optional
+        "response_format": "full"    // optional: full | compact
+    }
+
+    Response: same as /api/optimize-routes (429 when the solver queue is full)
     """
     try:
         data = request.get_json()
 
-        # Validate request
-        if not data:
+        if not data or not isinstance(data.get('previous_routes'), dict) or not data['previous_routes']:
+            metrics.REQUESTS.inc(endpoint='incremental', outcome='invalid')
             return jsonify({
                 'success': False,
-                'error': 'Request body is required'
+                'error': 'previous_routes is required'
             }), 400
 
-        if 'jobs' not in data or 'workers' not in data:
+        matrix_backend = data.get('matrix_backend', 'google')
+
+        if matrix_backend not in MATRIX_BACKENDS:
             return jsonify({
                 'success': False,
-                'error': 'Both jobs and workers are required'
+                'error': f"matrix_backend must be one of: {', '.join(MATRIX_BACKENDS)}"
             }), 400
 
-        jobs = data['jobs']
-        workers = data['workers']
-
-        if len(jobs) == 0:
+        if matrix_backend == 'google' and not GOOGLE_API_KEY:
             return jsonify({
                 'success': False,
-                'error': 'At least one job is required'
-            }), 400
+                'error': 'Google Maps API key not configured'
+            }), 500
 
-        if len(workers) == 0:
+        if data.get('quality') is not None and data['quality'] not in SOLVER_PROFILES:
+            metrics.REQUESTS.inc(endpoint='incremental', outcome='invalid')
             return jsonify({
                 'success': False,
-                'error': 'At least one worker is required'
+                'error': f"quality must be one of: {', '.join(SOLVER_PROFILES)}"
             }), 400
 
-        if not GOOGLE_API_KEY:
+        if data.get('response_format', 'full') not in RESPONSE_FORMATS:
+            metrics.REQUESTS.inc(endpoint='incremental', outcome='invalid')
             return jsonify({
                 'success': False,
-                'error': 'Google Maps API key not configured'
-            }), 500
+                'error': f"response_format must be one of: {', '.join(RESPONSE_FORMATS)}"
+            }), 400
 
-        # Optimize routes
-        optimization_result = optimize_routes(jobs, workers, GOOGLE_API_KEY)
+        options = {'quality': data.get('quality')}
+        time_limit_seconds = _parse_time_limit(data.get('time_limit_seconds'))
+        if time_limit_seconds is not None:
+            options['time_limit_seconds'] = time_limit_seconds
+
+        num_jobs = sum(len(route.get('jobs', [])) for route in data['previous_routes'].values())
+        expected_seconds = _expected_seconds(num_jobs + len(data.get('add_jobs') or []), options['quality'],
+                                             options.get('time_limit_seconds', INCREMENTAL_TIME_LIMIT_SECONDS))
+        with metrics.collect() as request_metrics, metrics.stage('total'), solver_slot(expected_seconds):
+            optimization_result = reoptimize_routes(
+                data['previous_routes'],
+                GOOGLE_API_KEY,
+                add_jobs=data.get('add_jobs'),
+                remove_job_ids=data.get('remove_job_ids'),
+                update_workers=data.get('update_workers'),
+                matrix_backend=matrix_backend,
+                offload_solve=True,
+                **options
+            )
         routes = optimization_result['routes']
-        warnings = optimization_result.get('warnings', [])
 
-        return jsonify({
+        metadata = {
+            'num_jobs': sum(len(route['jobs']) for route in routes.values()),
+            'num_workers': len(routes),
+            'matrix_backend': matrix_backend,
+            'incremental': True,
+            'timestamp': datetime.now(timezone.utc).isoformat()
+        }
+        if data.get('include_metrics'):
+            metadata['metrics'] = request_metrics
+
+        metrics.REQUESTS.inc(endpoint='incremental', outcome='success')
+        return jsonify(apply_response_format({
             'success': True,
             'routes': routes,
-            'warnings': warnings,
-            'metadata': {
-                'num_jobs': len(jobs),
-                'num_workers': len(workers),
-                'timestamp': None  # Could add timestamp if needed
+            'warnings': optimization_result.get('warnings', []),
+            'dropped_jobs': optimization_result.get('dropped_jobs', []),
+            'geocoded': optimization_result.get('geocoded'),
+            'metadata': metadata
+        }, data.get('response_format', 'full')))
+
+    except SolverBusy as e:
+        return _busy_response('incremental', e)
+
+    except ValueError as e:
+        metrics.REQUESTS.inc(endpoint='incremental', outcome='invalid')
+        return jsonify({
+            'success': False,
+            'error': f'Validation error: {str(e)}'
+        }), 400
+
+    except Exception as e:
+        metrics.REQUESTS.inc(endpoint='incremental', outcome='error')
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/optimize-routes/batch', methods=['POST'])
+def optimize_batch_endpoint():
+    """
+    Plan every day of a date range (e.g. a week) in one request
+
+    Request body: same as /api/optimize-routes, plus
+    {
+        "start_date": "2026-03-02",  // optional: default earliest scheduled_date
+        "end_date": "2026-03-06",    // optional: default latest scheduled_date
+                                     // (with "jobs" omitted, open jobs of start_date..end_date
+                                     // are loaded from the database; "save" writes every day)
+        "jobs": [
+            {
+                "id": "job-1",
+                "address": "123 Main St, Boston, MA",
+                "scheduled_date": "2026-03-02",  // fixed day, or:
+                "earliest_date": "2026-03-02",   // flexible: any day in the window
+                "latest_date": "2026-03-04"
             }
-        })
+        ],
+        "workers": [
+            {
+                "id": "worker-1",
+                "depot_address": "1 City Hall Square, Boston, MA",
+                "available_dates": ["2026-03-02", "2026-03-03"]  // optional: default every day
+            }
+        ]
+    }
+
+    Response:
+    {
+        "success": true,
+        "days": {
+            "2026-03-02": {"routes": {...}, "warnings": [], "dropped_jobs": [], "template": null}
+                                                                       // as /api/optimize-routes
+        },
+        "assigned_dates": {"job-1": "2026-03-03"},  // days chosen for flexible jobs
+        "unscheduled": [],  // jobs with no day in the range or no crew on their days
+        "geocoded": {...},
+        "saved_routes": {"2026-03-02": {"worker-1": "<route uuid>"}},  // with "save": true
+        "metadata": {...}
+    }
+    """
+    try:
+        data = request.get_json()
+        params, error = _parse_optimize_request(data)
+        if error:
+            metrics.REQUESTS.inc(endpoint='batch', outcome='invalid')
+            return error
+
+        expected_seconds = _expected_seconds(len(params['jobs']), params['quality'], params['time_limit_seconds'])
+        with metrics.collect() as request_metrics, metrics.stage('total'), solver_slot(expected_seconds):
+            batch_result = optimize_days(
+                params['jobs'],
+                params['workers'],
+                GOOGLE_API_KEY,
+                start_date=data.get('start_date'),
+                end_date=data.get('end_date'),
+                matrix_backend=params['matrix_backend'],
+                time_limit_seconds=params['time_limit_seconds'],
+                quality=params['quality'],
+                decompose=params['decompose'],
+                templates=get_default_template_store() if params['use_templates'] else None,
+                departure_times=None if params['departure_slices'] is None else [
+                    f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}" for seconds, _ in params['departure_slices']
+                ]
+            )
+            if params['save']:
+                batch_result['saved_routes'] = db.save_days(batch_result['days'], batch_result['geocoded'])
+            elif params['store_geocoded']:
+                _store_geocoded(batch_result['geocoded'])
+
+        metadata = {
+            'num_jobs': len(params['jobs']),
+            'num_workers': len(params['workers']),
+            'num_days': len(batch_result['days']),
+            'matrix_backend': params['matrix_backend'],
+            'timestamp': datetime.now(timezone.utc).isoformat()
+        }
+        if params['include_metrics']:
+            metadata['metrics'] = request_metrics
+
+        metrics.REQUESTS.inc(endpoint='batch', outcome='success')
+        return jsonify(apply_response_format({'success': True, **batch_result, 'metadata': metadata},
+                                             params['response_format']))
+
+    except SolverBusy as e:
+        return _busy_response('batch', e)
+
+    except ValueError as e:
+        metrics.REQUESTS.inc(endpoint='batch', outcome='invalid')
+        return jsonify({
+            'success': False,
+            'error': f'Validation error: {str(e)}'
+        }), 400
+
+    except Exception as e:
+        metrics.REQUESTS.inc(endpoint='batch', outcome='error')
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/optimize-routes/jobs', methods=['POST'])
+def submit_optimization_job():
+    """
+    Queue a route optimization and return immediately
+
+    Request body: same as /api/optimize-routes
+
+    Response (202; 429 with Retry-After when the solver queue is full):
+    {
+        "success": true,
+        "job_id": "3f2c...",
+        "status_url": "/api/optimize-routes/jobs/3f2c...",
+        "events_url": "/api/optimize-routes/jobs/3f2c.../events"
+    }
+    """
+    try:
+        params, error = _parse_optimize_request(request.get_json())
+        if error:
+            metrics.REQUESTS.inc(endpoint='optimize_jobs', outcome='invalid')
+            return error
+
+        queue = get_solver_queue()
+        if queue is not None:
+            queue.check()
+
+        # Queued jobs wait for a solver slot as long as they have to
+        job_id = get_runner().submit(_run_optimization, queue_wait_seconds=JOB_QUEUE_WAIT_SECONDS, **params)
+        metrics.REQUESTS.inc(endpoint='optimize_jobs', outcome='accepted')
+
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status_url': f'/api/optimize-routes/jobs/{job_id}',
+            'events_url': f'/api/optimize-routes/jobs/{job_id}/events'
+        }), 202
+
+    except SolverBusy as e:
+        return _busy_response('optimize_jobs', e)
 
     except ValueError as e:
+        metrics.REQUESTS.inc(endpoint='optimize_jobs', outcome='invalid')
         return jsonify({
             'success': False,
             'error': f'Validation error: {str(e)}'
         }), 400
 
     except Exception as e:
+        metrics.REQUESTS.inc(endpoint='optimize_jobs', outcome='error')
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
 
+@app.route('/api/optimize-routes/jobs/<job_id>', methods=['GET'])
+def get_optimization_job(job_id):
+    """
+    Poll an optimization job
+
+    Response:
+    {
+        "success": true,
+        "job_id": "3f2c...",
+        "status": "running",          // queued | running | succeeded | failed
+        "stage": "solve",             // geocode | matrix | solve
+        "events": [{"seq": 4, "stage": "solve", "objective": 1234500, "elapsed": 2.1}],
+        "result": null,               // /api/optimize-routes response once succeeded
+        "error": null
+    }
+    """
+    job = get_runner().store.get(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': 'Job not found'
+        }), 404
+
+    return jsonify({'success': True, **job})
+
+
+@app.route('/api/optimize-routes/jobs/<job_id>/events', methods=['GET'])
+def stream_optimization_job(job_id):
+    """
+    Server-sent events stream of an optimization job's progress
+
+    Emits "progress" events (stage changes and improving solver objectives)
+    followed by a final "succeeded" or "failed" event carrying the result.
+
+    Each stream holds a request thread, so a process serves at most
+    OPTIMIZE_STREAMS_MAX of them and closes each after OPTIMIZE_STREAM_SECONDS
+    with a "reconnect" event. EventSource reconnects by itself and sends the
+    Last-Event-ID header (or pass ?last_event_id=) to resume without repeats.
+    When every stream slot is taken the endpoint answers 429; poll the job's
+    status URL instead.
+    """
+    last_event_id = request.headers.get('Last-Event-ID', request.args.get('last_event_id'))
+    try:
+        last_event_id = int(last_event_id) if last_event_id not in (None, '') else None
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'error': 'Validation error: last_event_id must be an integer'
+        }), 400
+
+    events = get_runner().stream(job_id, last_event_id)
+    if events is None:
+        metrics.REQUESTS.inc(endpoint='optimize_job_events', outcome='busy')
+        response = jsonify({
+            'success': False,
+            'error': 'Too many open event streams; poll the status URL instead',
+            'status_url': f'/api/optimize-routes/jobs/{job_id}',
+            'retry_after': STREAM_RETRY_SECONDS
+        })
+        response.headers['Retry-After'] = str(STREAM_RETRY_SECONDS)
+        return response, 429
+
+    return Response(
+        events,
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Disable proxy buffering (nginx)
+        }
+    )
+
+
+def _parse_time_limit(value):
+    """
+    Parse an optional time_limit_seconds
+
+    Returns:
+        Whole seconds, at least 1, or None when not given
+
+    Raises:
+        ValueError: value is not a number
+    """
+    if value is None:
+        return None
+    try:
+        return max(1, int(value))
+    except (TypeError, ValueError):
+        raise ValueError('time_limit_seconds must be a number') from None
+
+
+def _parse_optimize_request(data):
+    """
+    Validate an optimize request body
+
+    Returns:
+        Tuple of (params, error)
+        - params: kwargs for _run_optimization, or None if invalid
+        - error: (response, status) to return to the client, or None
+    """
+    # Validate request
+    if not data:
+        return None, (jsonify({
+            'success': False,
+            'error': 'Request body is required'
+        }), 400)
+
+    route_date = data.get('route_date') or data.get('start_date')
+    load_jobs = 'jobs' not in data and (route_date or data.get('job_ids') is not None)
+    load_workers = 'workers' not in data and (load_jobs or data.get('worker_ids') is not None)
+    save = bool(data.get('save'))
+    store_geocoded = bool(data.get('store_geocoded'))
+
+    if (load_jobs or load_workers or save or store_geocoded) and not db.is_configured():
+        return None, (jsonify({
+            'success': False,
+            'error': 'Database not configured (DATABASE_URL)'
+        }), 500)
+
+    if ('jobs' not in data and not load_jobs) or ('workers' not in data and not load_workers):
+        return None, (jsonify({
+            'success': False,
+            'error': 'Both jobs and workers are required (or route_date / job_ids to load them from the database)'
+        }), 400)
+
+    if save and not route_date:
+        return None, (jsonify({
+            'success': False,
+            'error': 'route_date is required to save routes'
+        }), 400)
+
+    jobs = db.load_jobs(route_date, data.get('end_date'), data.get('job_ids')) if load_jobs else data['jobs']
+    workers = db.load_workers(data.get('worker_ids')) if load_workers else data['workers']
+
+    if len(jobs) == 0:
+        return None, (jsonify({
+            'success': False,
+            'error': 'At least one job is required'
+        }), 400)
+
+    if len(workers) == 0:
+        return None, (jsonify({
+            'success': False,
+            'error': 'At least one worker is required'
+        }), 400)
+
+    matrix_backend = data.get('matrix_backend', 'google')
+
+    if matrix_backend not in MATRIX_BACKENDS:
+        return None, (jsonify({
+            'success': False,
+            'error': f"matrix_backend must be one of: {', '.join(MATRIX_BACKENDS)}"
+        }), 400)
+
+    if matrix_backend == 'google' and not GOOGLE_API_KEY:
+        return None, (jsonify({
+            'success': False,
+            'error': 'Google Maps API key not configured'
+        }), 500)
+
+    decompose = data.get('decompose')
+
+    if decompose is not None and not isinstance(decompose, bool):
+        return None, (jsonify({
+            'success': False,
+            'error': 'decompose must be true or false'
+        }), 400)
+
+    quality = data.get('quality')
+
+    if quality is not None and quality not in SOLVER_PROFILES:
+        return None, (jsonify({
+            'success': False,
+            'error': f"quality must be one of: {', '.join(SOLVER_PROFILES)}"
+        }), 400)
+
+    response_format = data.get('response_format', 'full')
+
+    if response_format not in RESPONSE_FORMATS:
+        return None, (jsonify({
+            'success': False,
+            'error': f"response_format must be one of: {', '.join(RESPONSE_FORMATS)}"
+        }), 400)
+
+    time_limit_seconds = _parse_time_limit(data.get('time_limit_seconds'))
+
+    slice_times = data.get('departure_slices')
+    if slice_times is not None and (not isinstance(slice_times, list) or not slice_times):
+        return None, (jsonify({
+            'success': False,
+            'error': 'departure_slices must be a non-empty list of "HH:MM" times'
+        }), 400)
+
+    # Raises ValueError (400) on a malformed time
+    slices = None
+    if slice_times is not None or data.get('time_dependent'):
+        slices = departure_slices(_departure_day(route_date, jobs), slice_times)
+
+    return {
+        'jobs': jobs,
+        'workers': workers,
+        'matrix_backend': matrix_backend,
+        'decompose': decompose,
+        'quality': quality,
+        'time_limit_seconds': time_limit_seconds,
+        'include_metrics': bool(data.get('include_metrics')),
+        'route_date': route_date,
+        'save': save,
+        'store_geocoded': not save and (store_geocoded or load_jobs or load_workers),
+        'response_format': response_format,
+        'use_cache': data.get('cache', True) is not False,
+        'use_templates': data.get('templates', True) is not False,
+        'departure_slices': slices
+    }, None
+
+
+def _departure_day(route_date, jobs):
+    """Day the routes are driven: route_date, else the jobs' common scheduled_date, else today"""
+    if route_date:
+        return date.fromisoformat(route_date)
+    scheduled = {job.get('scheduled_date') for job in jobs}
+    if len(scheduled) == 1 and None not in scheduled:
+        return date.fromisoformat(str(scheduled.pop())[:10])
+    return datetime.now(ZoneInfo(SERVICE_TIMEZONE)).date()
+
+
+def _run_optimization(jobs, workers, matrix_backend, decompose=None, quality=None, time_limit_seconds=None,
+                      include_metrics=False, route_date=None, save=False, store_geocoded=False,
+                      response_format='full', use_cache=True, use_templates=True, departure_slices=None,
+                      queue_wait_seconds=None, progress=None):
+    """
+    /api/optimize-routes response body, reused from the result cache when an
+    identical request was answered recently (see result_cache.py)
+
+    Requests that save to the database always run. With store_geocoded,
+    coordinates geocoded from addresses are written back to the rows.
+    """
+    options = {
+        'matrix_backend': matrix_backend,
+        'decompose': decompose,
+        'quality': quality,
+        'time_limit_seconds': time_limit_seconds,
+        'include_metrics': include_metrics,
+        'response_format': response_format,
+        'use_templates': use_templates,
+        'departure_slices': departure_slices
+    }
+    cache = get_default_result_cache() if use_cache and not save else None
+    if cache is None:
+        body = _optimize(jobs, workers, route_date=route_date, save=save, queue_wait_seconds=queue_wait_seconds,
+                         progress=progress, **options)
+    else:
+        key = request_key(jobs, workers, {**options, 'quality': quality or DEFAULT_QUALITY})
+        body, source = cache.get_or_compute(key, lambda: _optimize(jobs, workers, queue_wait_seconds=queue_wait_seconds,
+                                                                   progress=progress, **options))
+        body = {**body, 'metadata': {**body['metadata'], 'cached': source != 'computed'}}
+
+    if store_geocoded:
+        _store_geocoded(body.get('geocoded'))
+    return body
+
+
+def _store_geocoded(geocoded):
+    """Write geocoded coordinates back to the jobs / workers rows in one statement each"""
+    if not geocoded or not (geocoded.get('jobs') or geocoded.get('workers')):
+        return
+    try:
+        db.save_geocoded(geocoded)
+    except Exception:
+        # Coordinates are only a cache; a failed write must not fail the optimization
+        logger.exception("Failed to store geocoded coordinates")
+
+
+def _optimize(jobs, workers, matrix_backend, decompose=None, quality=None, time_limit_seconds=None,
+              include_metrics=False, route_date=None, save=False, response_format='full', use_templates=True,
+              departure_slices=None, queue_wait_seconds=None, progress=None):
+    """
+    Run optimize_routes in a solver slot and build the /api/optimize-routes response body
+
+    The searches run in the solver processes, so this worker's threads
+    (and cheap endpoints like /health) stay responsive meanwhile.
+    """
+    expected_seconds = _expected_seconds(len(jobs), quality, time_limit_seconds)
+    with metrics.collect() as request_metrics, metrics.stage('total'), \
+            solver_slot(expected_seconds, wait_seconds=queue_wait_seconds, progress=progress):
+        optimization_result = optimize_routes(jobs, workers, GOOGLE_API_KEY, matrix_backend=matrix_backend,
+                                              progress=progress, decompose=decompose, quality=quality,
+                                              time_limit_seconds=time_limit_seconds, offload_solve=True,
+                                              templates=get_default_template_store() if use_templates else None,
+                                              departure_slices=departure_slices)
+        saved_routes = None
+        if save:
+            if progress:
+                progress('save', routes=len(optimization_result['routes']))
+            saved_routes = db.save_routes(optimization_result['routes'], route_date,
+                                          optimization_result.get('dropped_jobs', ()),
+                                          optimization_result.get('geocoded'))
+    routes = optimization_result['routes']
+    warnings = optimization_result.get('warnings', [])
+
+    metadata = {
+        'num_jobs': len(jobs),
+        'num_workers': len(workers),
+        'matrix_backend': matrix_backend,
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'cached': False,
+        'template': optimization_result.get('template')
+    }
+    if include_metrics:
+        metadata['metrics'] = request_metrics
+
+    return apply_response_format({
+        'success': True,
+        'routes': routes,
+        'warnings': warnings,
+        'dropped_jobs': optimization_result.get('dropped_jobs', []),
+        'geocoded': optimization_result.get('geocoded'),
+        'saved_routes': saved_routes,
+        'metadata': metadata
+    }, response_format)
+
+
+def _expected_seconds(num_jobs, quality, time_limit_seconds):
+    """Rough run time of an optimization, for the solver queue's Retry-After estimates"""
+    return solver_settings(num_jobs, quality, time_limit_seconds)['time_limit_seconds'] + QUEUE_OVERHEAD_SECONDS
+
+
+def _busy_response(endpoint, error):
+    """429 for an optimization the solver queue turned away"""
+    metrics.REQUESTS.inc(endpoint=endpoint, outcome='busy')
+    response = jsonify({
+        'success': False,
+        'error': str(error),
+        'retry_after': error.retry_after
+    })
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 429
+
+
 @app.errorhandler(404)
 def not_found(error):
     return jsonify({
@@ -226,7 +989,6 @@ if __name__ == '__main__':
     port = int(os.getenv('PORT', 5001))
     debug = os.getenv('FLASK_ENV') == 'development'
 
-    print(f"Starting Route Optimization API on port {port}")
-    print(f"Debug mode: {debug}")
+    logger.info("Starting Route Optimization API on port %d (debug mode: %s)", port, debug)
 
     app.run(host='0.0.0.0', port=port, debug=debug)
@@ -0,0 +1,254 @@
+"""
+Multi-Day Batch Planning
+Plans every day of a date range in one pass: jobs and depots are geocoded
+once, the travel times of every day are fetched in one pass over the union
+of their locations (so depot legs and recurring addresses are fetched once,
+not per day; see matrix_providers.SharedMatrixProvider), and the days
+search in parallel in the solver process pool, each on its slice of those
+matrices. Jobs with a date window instead of a fixed date are given the day
+that suits them best before the days are solved.
+
+Job fields:
+    scheduled_date       Day the job is planned on ("YYYY-MM-DD" or an ISO timestamp)
+    earliest_date        First acceptable day for a flexible job
+    latest_date          Last acceptable day for a flexible job
+
+Worker fields:
+    available_dates      Days the crew works (default: every day of the range)
+"""
+
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import numpy as np
+
+import metrics
+from geo import haversine_matrix_km
+from matrix_providers import SharedMatrixProvider, departure_slices, get_matrix_provider
+from route_optimizer import DECOMPOSE_MIN_JOBS, optimize_routes, prepare_coordinates
+
+
+# Longest date range one request may plan
+MAX_BATCH_DAYS = 31
+
+logger = logging.getLogger(__name__)
+
+
+def parse_date(value, field):
+    """
+    Date of a "YYYY-MM-DD" string or ISO timestamp
+
+    Raises:
+        ValueError: If the value is not a date
+    """
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        raise ValueError(f"{field} must be a date (YYYY-MM-DD), got {value!r}")
+
+
+def date_range(start_date, end_date):
+    """Every day from start_date to end_date inclusive"""
+    return [start_date + timedelta(days=n) for n in range((end_date - start_date).days + 1)]
+
+
+def job_days(job, days):
+    """
+    Days of the range a job may be planned on
+
+    A job with earliest_date / latest_date may go on any day of that window,
+    otherwise only on its scheduled_date.
+    """
+    label = f"Job {job.get('id')}"
+    if job.get('earliest_date') or job.get('latest_date'):
+        earliest = parse_date(job['earliest_date'], f"{label}: earliest_date") if job.get('earliest_date') else days[0]
+        latest = parse_date(job['latest_date'], f"{label}: latest_date") if job.get('latest_date') else days[-1]
+        return [day for day in days if earliest <= day <= latest]
+    if not job.get('scheduled_date'):
+        raise ValueError(f"{label} needs a scheduled_date or an earliest_date / latest_date window")
+    scheduled = parse_date(job['scheduled_date'], f"{label}: scheduled_date")
+    return [scheduled] if days[0] <= scheduled <= days[-1] else []
+
+
+def assign_days(job_coords, candidates, fixed, day_capacity):
+    """
+    Pick a day for each flexible job
+
+    Flexible jobs, most constrained first, go to the candidate day with the
+    nearest job already planned (so they join an existing cluster of work),
+    skipping days that are over their share of the workload while another
+    candidate still has room.
+
+    Args:
+        job_coords: (lat, lng) per job
+        candidates: {job index: [day, ...]} for the flexible jobs
+        fixed: {day: [job index, ...]} jobs that already have their day
+        day_capacity: {day: number of available crews}
+
+    Returns:
+        Dict {job index: day}
+    """
+    planned = {day: list(jobs) for day, jobs in fixed.items()}
+    total_jobs = sum(len(jobs) for jobs in planned.values()) + len(candidates)
+    total_crews = sum(day_capacity.values()) or 1
+    target = {day: total_jobs * crews / total_crews for day, crews in day_capacity.items()}
+
+    coords = np.asarray(job_coords, dtype=np.float64)
+    assigned = {}
+    for i in sorted(candidates, key=lambda i: len(candidates[i])):
+        days = candidates[i]
+        open_days = [day for day in days if len(planned.get(day, [])) < target.get(day, 0)] or days
+
+        def nearest_km(day):
+            jobs = planned.get(day)
+            if not jobs:
+                return float('inf')
+            return float(haversine_matrix_km(coords[i:i + 1], coords[jobs]).min())
+
+        day = min(open_days, key=lambda day: (nearest_km(day), len(planned.get(day, []))))
+        assigned[i] = day
+        planned.setdefault(day, []).append(i)
+    return assigned
+
+
+def optimize_days(jobs, workers, api_key, start_date=None, end_date=None, matrix_backend='google', progress=None,
+                  time_limit_seconds=None, quality=None, decompose=None, matrix_options=None, templates=None,
+                  departure_times=None):
+    """
+    Plan every day of a date range in one pass
+
+    Args:
+        jobs: Job dicts as for optimize_routes, plus scheduled_date or an
+              earliest_date / latest_date window
+        workers: Worker dicts as for optimize_routes, plus optional available_dates
+        api_key: Google Maps API key
+        start_date: First day to plan (default: earliest scheduled_date)
+        end_date: Last day to plan (default: latest scheduled_date)
+        matrix_backend: Travel time source, one of matrix_providers.MATRIX_BACKENDS
+        progress: Optional callback progress(stage, **details); day stages
+                  carry a 'date' detail
+        time_limit_seconds: Solver time limit per day (default: scaled budget)
+        quality: Latency vs. quality target, see optimize_routes
+        decompose: Force or disable cluster-first mode for large days, see optimize_routes
+        matrix_options: Extra keyword arguments for the matrix provider
+        templates: Optional RouteTemplateStore seeding each day, see optimize_routes
+        departure_times: Optional "HH:MM" departure slices; each day is then
+                         planned with time-dependent travel times for its own
+                         date, see optimize_routes
+
+    Returns:
+        Dict with
+        - days: {"YYYY-MM-DD": {'routes', 'warnings', 'dropped_jobs', 'template'}} per day
+        - assigned_dates: {job_id: "YYYY-MM-DD"} chosen for flexible jobs
+        - unscheduled: ids of jobs with no day in the range or no crew on their days
+        - geocoded: coordinates geocoded during this run (see prepare_coordinates)
+
+    Raises:
+        ValueError: On a bad date range or job dates
+    """
+    dated = [parse_date(job['scheduled_date'], f"Job {job.get('id')}: scheduled_date")
+             for job in jobs if job.get('scheduled_date')]
+    start = parse_date(start_date, 'start_date') if start_date else min(dated, default=None)
+    end = parse_date(end_date, 'end_date') if end_date else max(dated, default=None)
+    if start is None or end is None:
+        raise ValueError("start_date and end_date are required when no job has a scheduled_date")
+    if end < start:
+        raise ValueError("end_date is before start_date")
+    days = date_range(start, end)
+    if len(days) > MAX_BATCH_DAYS:
+        raise ValueError(f"At most {MAX_BATCH_DAYS} days can be planned at once")
+
+    logger.info("Batch planning %s to %s: %d jobs, %d workers", start, end, len(jobs), len(workers))
+    matrix_provider = get_matrix_provider(matrix_backend, api_key, **(matrix_options or {}))
+
+    # Crews per day (worker indices)
+    crews = {day: [] for day in days}
+    for v, worker in enumerate(workers):
+        available = worker.get('available_dates')
+        available = ({parse_date(value, f"Worker {worker.get('id')}: available_dates") for value in available}
+                     if available is not None else set(days))
+        for day in days:
+            if day in available:
+                crews[day].append(v)
+
+    # Day of every job: fixed, chosen among its window, or none
+    fixed = {day: [] for day in days}
+    flexible = {}
+    unscheduled = []
+    for i, job in enumerate(jobs):
+        options = [day for day in job_days(job, days) if crews[day]]
+        if not options:
+            unscheduled.append(job['id'])
+        elif len(options) == 1 and not (job.get('earliest_date') or job.get('latest_date')):
+            fixed[options[0]].append(i)
+        else:
+            flexible[i] = options
+
+    if unscheduled:
+        logger.warning("%d job(s) have no day with an available crew: %s", len(unscheduled), unscheduled)
+
+    # Geocode everything once; the day plans reuse the coordinates
+    if progress:
+        progress('geocode', jobs=len(jobs), workers=len(workers))
+    with metrics.stage('geocode'):
+        depot_coords, job_coords, geocoded = prepare_coordinates(jobs, workers, api_key)
+    jobs = [{**job, 'latitude': lat, 'longitude': lng} for job, (lat, lng) in zip(jobs, job_coords)]
+    workers = [{**worker, 'depot_lat': lat, 'depot_lng': lng} for worker, (lat, lng) in zip(workers, depot_coords)]
+
+    assigned = assign_days(job_coords, flexible, fixed, {day: len(crews[day]) for day in days})
+    day_jobs = {day: list(indices) for day, indices in fixed.items()}
+    for i, day in assigned.items():
+        day_jobs[day].append(i)
+
+    planned_days = [day for day in days if day_jobs[day]]
+    day_slices = {day: departure_slices(day, departure_times) if departure_times is not None else None
+                  for day in planned_days}
+
+    # Travel times of all days in one fetch; cluster-first days fetch per
+    # cluster instead (see solve_vrp_decomposed)
+    plans = []
+    for day in planned_days:
+        if decompose or (decompose is None and len(day_jobs[day]) >= DECOMPOSE_MIN_JOBS and len(crews[day]) >= 2):
+            continue
+        locations = [depot_coords[v] for v in crews[day]] + [job_coords[i] for i in sorted(day_jobs[day])]
+        departures = None if day_slices[day] is None else [when for _, when in day_slices[day]]
+        plans.append((locations, len(crews[day]), departures))
+    if plans:
+        if progress:
+            progress('matrix', days=len(plans))
+        with metrics.stage('matrix'):
+            matrix_provider = SharedMatrixProvider(matrix_provider, plans)
+
+    def plan_day(day):
+        def day_progress(stage, **details):
+            if progress:
+                progress(stage, date=day.isoformat(), **details)
+
+        result = optimize_routes(
+            [jobs[i] for i in sorted(day_jobs[day])], [workers[v] for v in crews[day]], api_key,
+            matrix_backend=matrix_backend, progress=day_progress, time_limit_seconds=time_limit_seconds,
+            quality=quality, decompose=decompose, matrix_provider=matrix_provider, offload_solve=True,
+            templates=templates, departure_slices=day_slices[day]
+        )
+        return {'routes': result['routes'], 'warnings': result['warnings'], 'dropped_jobs': result['dropped_jobs'],
+                'template': result['template']}
+
+    # Days search in parallel in the solver processes; each thread carries
+    # the request's metrics context
+    results = {}
+    if planned_days:
+        with ThreadPoolExecutor(max_workers=len(planned_days), thread_name_prefix='plan-day') as executor:
+            futures = {day: executor.submit(contextvars.copy_context().run, plan_day, day) for day in planned_days}
+            results = {day: future.result() for day, future in futures.items()}
+
+    return {
+        'days': {
+            day.isoformat(): results.get(day, {'routes': {}, 'warnings': [], 'dropped_jobs': [], 'template': None})
+            for day in days
+        },
+        'assigned_dates': {jobs[i]['id']: day.isoformat() for i, day in assigned.items()},
+        'unscheduled': unscheduled,
+        'geocoded': geocoded
+    }
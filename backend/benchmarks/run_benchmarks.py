@@ -0,0 +1,283 @@
+"""
+Optimization Pipeline Benchmark
+Runs optimize_routes end to end on a fixed set of instances and writes
+machine-readable results, so changes to search parameters, the balance
+weight or the matrix pipeline can be compared between commits.
+
+Runs offline: the google matrix backend is served by a stub Distance Matrix
+client (recorded travel times when the instance has them, otherwise a
+deterministic synthetic road network) with a fresh in-memory travel cache
+per run, so "elements" is what a cold run would be billed by Google.
+
+Reported per instance:
+- wall time per pipeline stage (geocode/matrix/solve/verify/repair) and total
+- objective (total duration + balance weight x longest route), the longest
+  and shortest route, total distance
+- Distance Matrix requests and elements
+
+    python benchmarks/run_benchmarks.py [--instances synthetic-100 ...] [--quality balanced]
+        [--seconds 5] [--neighbors 0] [--output results.json] [--compare baseline.json]
+
+Recorded instances are JSON files in benchmarks/instances/:
+    {
+        "name": "tuesday-peak",
+        "source": "...",               // optional: where the travel times came from
+        "depots": [[lat, lng], ...],
+        "jobs": [[lat, lng], ...],
+        "travel_times": {              // optional, full matrix over depots + jobs
+            "duration": [[...], ...],
+            "distance": [[...], ...]
+        }
+    }
+Add travel_times to an instance with real Google data once (needs
+GOOGLE_MAPS_API_KEY):
+    python benchmarks/run_benchmarks.py --record benchmarks/instances/tuesday-peak.json
+
+boston-am-inbound (60 stops, 4 depots) ships with derived travel times that
+have what the synthetic suite lacks: asymmetric legs (inbound morning
+traffic) and a river whose crossings cost a detour. Re-record it to
+benchmark on real Google data.
+"""
+
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+import ortools  # noqa: E402
+
+import google_client  # noqa: E402
+from geo import haversine_matrix_km  # noqa: E402
+from matrix_providers import HaversineMatrixProvider, google_distance_matrix  # noqa: E402
+from route_optimizer import BALANCE_COEFFICIENT, SOLVER_PROFILES, optimize_routes  # noqa: E402
+from travel_cache import TravelTimeCache, coord_key  # noqa: E402
+
+
+INSTANCES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instances')
+
+# (stops, depots) of the synthetic suite
+SYNTHETIC_SIZES = [(10, 1), (50, 3), (100, 5), (300, 10), (800, 20)]
+
+STUB_API_KEY = 'benchmark-stub'
+
+
+def synthetic_instance(num_stops, num_depots, seed=42):
+    """Random depots and stops around Boston, the same for a given seed"""
+    rng = random.Random(seed)
+    depots = [(round(42.30 + rng.random() * 0.12, 6), round(-71.15 + rng.random() * 0.15, 6))
+              for _ in range(num_depots)]
+    jobs = [(round(42.20 + rng.random() * 0.35, 6), round(-71.30 + rng.random() * 0.45, 6))
+            for _ in range(num_stops)]
+    return {'name': f'synthetic-{num_stops}', 'depots': depots, 'jobs': jobs}
+
+
+def load_instances(names=None):
+    """Synthetic suite plus every recorded instance, optionally filtered by name"""
+    instances = [synthetic_instance(stops, depots) for stops, depots in SYNTHETIC_SIZES]
+    for path in sorted(glob.glob(os.path.join(INSTANCES_DIR, '*.json'))):
+        with open(path) as f:
+            instances.append(json.load(f))
+    if names:
+        instances = [inst for inst in instances if inst['name'] in names]
+    return instances
+
+
+class StubDistanceMatrixClient:
+    """
+    Offline stand-in for googlemaps.Client.distance_matrix
+
+    Travel times come from a recorded matrix when one is given, otherwise
+    from the haversine speed profile with a deterministic +-15% per-pair
+    deviation, so estimates and "real" travel times differ like they would
+    against Google.
+
+    Args:
+        locations: Locations of the recorded matrix (optional)
+        travel_times: {'duration': [[...]], 'distance': [[...]]} (optional)
+    """
+
+    def __init__(self, locations=None, travel_times=None):
+        self.requests = 0
+        self.elements = 0
+        self._profile = HaversineMatrixProvider()
+        self._recorded = None
+        if travel_times:
+            self._recorded = (
+                {coord_key(loc): i for i, loc in enumerate(locations)},
+                np.asarray(travel_times['duration']),
+                np.asarray(travel_times['distance'])
+            )
+
+    def distance_matrix(self, origins, destinations, **kwargs):
+        self.requests += 1
+        self.elements += len(origins) * len(destinations)
+        o = [tuple(map(float, s.split(','))) for s in origins]
+        d = [tuple(map(float, s.split(','))) for s in destinations]
+
+        if self._recorded:
+            index, durations, distances = self._recorded
+            rows = [index[coord_key(c)] for c in o]
+            cols = [index[coord_key(c)] for c in d]
+            duration = durations[np.ix_(rows, cols)]
+            distance = distances[np.ix_(rows, cols)]
+        else:
+            o_arr, d_arr = np.asarray(o), np.asarray(d)
+            # Cheap deterministic hash of the pair -> deviation in [-0.15, 0.15)
+            seed = np.sin(o_arr[:, None, 0] * 12.9898 + o_arr[:, None, 1] * 78.233
+                          + d_arr[None, :, 0] * 37.719 + d_arr[None, :, 1] * 4.581) * 43758.5453
+            deviation = 1 + 0.3 * (seed - np.floor(seed) - 0.5)
+            road_km = haversine_matrix_km(o, d) * self._profile.circuity * deviation
+            duration = np.rint(self._profile.travel_seconds(road_km) * deviation)
+            distance = np.rint(road_km * 1000)
+
+        return {'rows': [
+            {'elements': [
+                {'status': 'OK', 'duration': {'value': int(duration[i, j])},
+                 'distance': {'value': int(distance[i, j])}}
+                for j in range(len(d))
+            ]}
+            for i in range(len(o))
+        ]}
+
+
+def run_instance(instance, seconds, neighbors, quality=None):
+    """Run optimize_routes on one instance and collect its measurements"""
+    depots, jobs = instance['depots'], instance['jobs']
+    stub = StubDistanceMatrixClient(depots + jobs, instance.get('travel_times'))
+    google_client._clients[STUB_API_KEY] = stub
+
+    workers = [{'id': f'worker-{i}', 'name': f'Crew {i}', 'depot_lat': lat, 'depot_lng': lng}
+               for i, (lat, lng) in enumerate(depots)]
+    job_dicts = [{'id': f'job-{i}', 'latitude': lat, 'longitude': lng} for i, (lat, lng) in enumerate(jobs)]
+
+    stages = []  # (stage, started)
+
+    def progress(stage, **details):
+        if not stages or stages[-1][0] != stage:
+            stages.append((stage, time.perf_counter()))
+
+    started = time.perf_counter()
+    # Keep the pipeline's debug output out of the results table
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = optimize_routes(
+            job_dicts, workers, STUB_API_KEY, matrix_backend='google', progress=progress,
+            time_limit_seconds=seconds, quality=quality,
+            matrix_options={'cache': TravelTimeCache(':memory:'), 'neighbors': neighbors}
+        )
+    finished = time.perf_counter()
+
+    stage_seconds = {}
+    for (stage, begin), (_, end) in zip(stages, stages[1:] + [(None, finished)]):
+        stage_seconds[stage] = round(stage_seconds.get(stage, 0.0) + end - begin, 3)
+
+    durations = [route['total_duration_seconds'] for route in result['routes'].values()]
+    return {
+        'stops': len(jobs),
+        'depots': len(depots),
+        'recorded': bool(instance.get('travel_times')),
+        'wall_seconds': round(finished - started, 3),
+        'stage_seconds': stage_seconds,
+        'objective': sum(durations) + BALANCE_COEFFICIENT * max(durations),
+        'max_route_seconds': max(durations),
+        'min_route_seconds': min(durations),
+        'total_distance_meters': sum(route['total_distance_meters'] for route in result['routes'].values()),
+        'jobs_assigned': sum(len(route['jobs']) for route in result['routes'].values()),
+        'api_requests': stub.requests,
+        'api_elements': stub.elements,
+    }
+
+
+def record_instance(path, api_key):
+    """Fetch the full Google matrix for a recorded instance and store it in the file"""
+    with open(path) as f:
+        instance = json.load(f)
+    locations = [tuple(c) for c in instance['depots'] + instance['jobs']]
+    duration, distance = google_distance_matrix(locations, api_key)
+    instance['travel_times'] = {'duration': duration.tolist(), 'distance': distance.tolist()}
+    with open(path, 'w') as f:
+        json.dump(instance, f)
+    print(f"Recorded {len(locations)}x{len(locations)} travel times into {path}")
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    """Print objective / wall time / elements changes against an earlier results file"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_path} (commit {baseline.get('commit')}):")
+    print(f"{'instance':>16} {'objective':>12} {'wall':>9} {'elements':>10}")
+    for name, current in results['instances'].items():
+        before = baseline.get('instances', {}).get(name)
+        if not before:
+            continue
+
+        def change(key):
+            return (current[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+
+        print(f"{name:>16} {change('objective'):>+11.1f}% {change('wall_seconds'):>+8.1f}% "
+              f"{change('api_elements'):>+9.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--instances', nargs='+', help='Instance names to run (default: all)')
+    parser.add_argument('--quality', choices=sorted(SOLVER_PROFILES), help='Solver latency vs. quality target')
+    parser.add_argument('--seconds', type=int, help='Fixed solver time limit (default: scaled budget)')
+    parser.add_argument('--neighbors', type=int, default=0, help='Sparse matrix neighbors (0 = full matrix)')
+    parser.add_argument('--output', default='benchmark_results.json', help='Results JSON file')
+    parser.add_argument('--compare', help='Earlier results JSON to compare against')
+    parser.add_argument('--record', help='Add real Google travel times to a recorded instance file and exit')
+    args = parser.parse_args()
+
+    if args.record:
+        record_instance(args.record, os.getenv('GOOGLE_MAPS_API_KEY'))
+        return
+
+    results = {
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'ortools': ortools.__version__,
+        'cpu_count': os.cpu_count(),
+        'quality': args.quality,
+        'seconds': args.seconds,
+        'neighbors': args.neighbors,
+        'instances': {}
+    }
+
+    print(f"{'instance':>16} {'wall (s)':>9} {'matrix':>7} {'solve':>7} {'objective':>12} "
+          f"{'max route':>10} {'min route':>10} {'elements':>10}")
+    for instance in load_instances(args.instances):
+        stats = run_instance(instance, args.seconds, args.neighbors, args.quality)
+        results['instances'][instance['name']] = stats
+        stage = stats['stage_seconds']
+        print(f"{instance['name']:>16} {stats['wall_seconds']:>9.2f} {stage.get('matrix', 0):>7.2f} "
+              f"{stage.get('solve', 0):>7.2f} {stats['objective']:>12,} {stats['max_route_seconds']:>10,} "
+              f"{stats['min_route_seconds']:>10,} {stats['api_elements']:>10,}")
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print(f"\nWrote {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""
+Solver Transit Benchmark
+Compares search throughput of build_routing_model, whose arc costs are a
+native transit matrix, against a Python transit callback for every arc
+(the model it replaced). A third model shares the cached matrix with the
+Duration dimension at any size; build_routing_model only does that up to
+route_optimizer.SHARED_TRANSIT_MAX_NODES, above which OR-Tools' per-path
+copies of the dimension's evaluator make it slower.
+
+Two measurements per model, on synthetic instances with haversine travel
+times (no network):
+- iterations/s: local search neighbors evaluated per second while running
+  greedy descent to the first local optimum. Both models explore exactly
+  the same neighbors, so this isolates evaluation cost.
+- objective: production search (PATH_CHEAPEST_ARC + GUIDED_LOCAL_SEARCH)
+  after --seconds.
+
+    python benchmarks/solver_transit.py [--seconds 5] [--sizes 50 100 150 200]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ortools.constraint_solver import pywrapcp, routing_enums_pb2  # noqa: E402
+
+from matrix_providers import HaversineMatrixProvider  # noqa: E402
+import route_optimizer  # noqa: E402
+
+
+def synthetic_instance(num_stops, seed=42):
+    """Random depots and stops around Boston (one depot per 20 stops, at least 2)"""
+    rng = random.Random(seed)
+    num_depots = max(2, num_stops // 20)
+    points = [(42.25 + rng.random() * 0.25, -71.25 + rng.random() * 0.35)
+              for _ in range(num_depots + num_stops)]
+    return points, num_depots
+
+
+def build_model(duration_matrix, num_drivers, model_parameters):
+    """build_routing_model as the optimizer uses it"""
+    return route_optimizer.build_routing_model(duration_matrix, num_drivers, model_parameters)
+
+
+def build_shared_model(duration_matrix, num_drivers, model_parameters):
+    """build_routing_model with the cached matrix shared by the dimension at any size"""
+    threshold = route_optimizer.SHARED_TRANSIT_MAX_NODES
+    route_optimizer.SHARED_TRANSIT_MAX_NODES = len(duration_matrix)
+    try:
+        return route_optimizer.build_routing_model(duration_matrix, num_drivers, model_parameters)
+    finally:
+        route_optimizer.SHARED_TRANSIT_MAX_NODES = threshold
+
+
+def build_callback_model(duration_matrix, num_drivers, model_parameters):
+    """Model with a Python closure evaluated for every arc"""
+    manager = pywrapcp.RoutingIndexManager(
+        len(duration_matrix), num_drivers, list(range(num_drivers)), list(range(num_drivers))
+    )
+    routing = pywrapcp.RoutingModel(manager, model_parameters)
+    matrix = duration_matrix.tolist()
+
+    def duration_callback(from_idx, to_idx):
+        f = manager.IndexToNode(from_idx)
+        t = manager.IndexToNode(to_idx)
+        return matrix[f][t]
+
+    transit_idx = routing.RegisterTransitCallback(duration_callback)
+    routing.SetArcCostEvaluatorOfAllVehicles(transit_idx)
+    routing.AddDimension(transit_idx, 0, 99999999, True, "Duration")
+    routing.GetDimensionOrDie("Duration").SetGlobalSpanCostCoefficient(100)
+    return manager, routing
+
+
+def count_neighbors(profile):
+    """Total of the Neighbors column in the operator table of OR-Tools' local search profile"""
+    lines = iter(profile.splitlines())
+    for line in lines:
+        if line.startswith('Local search operator statistics'):
+            break
+    for line in lines:
+        cells = [c.strip() for c in line.split('|')]
+        if cells[0] == 'Total':
+            return int(cells[1])
+    return 0
+
+
+def search_parameters(metaheuristic, seconds=None):
+    params = pywrapcp.DefaultRoutingSearchParameters()
+    params.first_solution_strategy = routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC
+    params.local_search_metaheuristic = metaheuristic
+    if seconds:
+        params.time_limit.FromSeconds(seconds)
+    return params
+
+
+def run(build, duration_matrix, num_drivers, seconds):
+    """Measure descent throughput and time-limited objective for one model builder"""
+    model_parameters = pywrapcp.DefaultRoutingModelParameters()
+    model_parameters.solver_parameters.profile_local_search = True
+    _, routing = build(duration_matrix, num_drivers, model_parameters)
+
+    started = time.perf_counter()
+    routing.SolveWithParameters(
+        search_parameters(routing_enums_pb2.LocalSearchMetaheuristic.GREEDY_DESCENT)
+    )
+    elapsed = time.perf_counter() - started
+    neighbors = count_neighbors(routing.solver().LocalSearchProfile())
+
+    _, routing = build(duration_matrix, num_drivers, pywrapcp.DefaultRoutingModelParameters())
+    solution = routing.SolveWithParameters(
+        search_parameters(routing_enums_pb2.LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH, seconds)
+    )
+
+    return {
+        # Every neighbor the local search evaluates is one solver iteration
+        'iterations_per_s': neighbors / elapsed,
+        'descent_seconds': elapsed,
+        'objective': solution.ObjectiveValue() if solution else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seconds', type=int, default=5, help='Solver time limit per run')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[50, 100, 150, 200], help='Number of stops')
+    args = parser.parse_args()
+
+    provider = HaversineMatrixProvider()
+    print(f"{'stops':>6} {'model':>9} {'iterations/s':>14} {'descent (s)':>12} {'objective':>12}")
+    for size in args.sizes:
+        points, num_depots = synthetic_instance(size)
+        duration_matrix, _ = provider.build(points)
+        results = {}
+        for name, build in (('callback', build_callback_model), ('shared', build_shared_model),
+                            ('model', build_model)):
+            stats = run(build, duration_matrix, num_depots, args.seconds)
+            results[name] = stats
+            print(f"{size:>6} {name:>9} {stats['iterations_per_s']:>14,.0f} "
+                  f"{stats['descent_seconds']:>12.2f} {stats['objective']:>12,}")
+        speedup = results['model']['iterations_per_s'] / max(results['callback']['iterations_per_s'], 1e-9)
+        shared = len(duration_matrix) <= route_optimizer.SHARED_TRANSIT_MAX_NODES
+        print(f"{size:>6} {'speedup':>9} {speedup:>13.2f}x  (model vs callback; dimension "
+              f"{'shares the cached matrix' if shared else 'has its own callback'})")
+
+
+if __name__ == '__main__':
+    main()
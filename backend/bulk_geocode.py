@@ -0,0 +1,221 @@
+"""
+Bulk Geocoding
+Geocodes address books of any size (e.g. a new client's property list) from
+an NDJSON or CSV upload and streams one result per input row back as the
+batches resolve. Rows are read, geocoded and written a batch at a time with
+at most MAX_PENDING_BATCHES in flight, so memory stays flat however long the
+input is. Batches are written in the order they finish, so a batch of cache
+hits is not held up behind one waiting on Google; each result carries its
+input line number. Rows that cannot be read or geocoded are reported inline.
+
+Input rows:
+    NDJSON    {"id": "p-1", "address": "123 Main St, Boston, MA"} or a bare JSON string per line
+    CSV       header row with an "address" column and optionally an "id" column
+
+Output rows (NDJSON, or CSV with these columns):
+    line, id, address, lat, lng, success, error
+"""
+
+import csv
+import io
+import json
+import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+
+import metrics
+from geocoder import geocode_many
+
+
+BULK_FORMATS = ('ndjson', 'csv')
+RESULT_FIELDS = ('line', 'id', 'address', 'lat', 'lng', 'success', 'error')
+
+# Rows geocoded per geocode_many call (deduplicated and cached as one batch)
+BATCH_SIZE = 50
+# Batches geocoding while the previous one is being written out
+MAX_PENDING_BATCHES = 2
+
+logger = logging.getLogger(__name__)
+
+
+def detect_format(mimetype, filename=None):
+    """
+    Bulk format of an upload from its content type or file name
+
+    Returns:
+        'ndjson', 'csv' or None
+    """
+    if filename:
+        extension = filename.rsplit('.', 1)[-1].lower()
+        if extension in ('ndjson', 'jsonl'):
+            return 'ndjson'
+        if extension == 'csv':
+            return 'csv'
+    if mimetype in ('application/x-ndjson', 'application/ndjson', 'application/jsonl', 'application/json-lines'):
+        return 'ndjson'
+    if mimetype in ('text/csv', 'application/csv'):
+        return 'csv'
+    return None
+
+
+def read_rows(stream, input_format):
+    """
+    Rows of an NDJSON or CSV byte stream, read lazily
+
+    A CSV header is read and checked right away, so a bad upload fails
+    before the response starts streaming.
+
+    Args:
+        stream: Binary file-like object
+        input_format: 'ndjson' or 'csv'
+
+    Returns:
+        Iterator of {'line', 'id', 'address'} dicts, or {'line', 'error'}
+        for rows that cannot be read
+
+    Raises:
+        ValueError: If a CSV upload has no "address" column
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', errors='replace', newline='')
+    if input_format == 'ndjson':
+        return _ndjson_rows(text)
+
+    reader = csv.DictReader(text)
+    columns = {name.strip().lower(): name for name in reader.fieldnames or []}
+    if 'address' not in columns:
+        raise ValueError('CSV upload needs a header row with an "address" column')
+    return _csv_rows(reader, columns['address'], columns.get('id'))
+
+
+def _ndjson_rows(text):
+    for line_number, line in enumerate(text, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            value = json.loads(line)
+        except ValueError:
+            yield {'line': line_number, 'error': 'Invalid JSON'}
+            continue
+        if isinstance(value, str):
+            value = {'address': value}
+        if not isinstance(value, dict):
+            yield {'line': line_number, 'error': 'Expected an object with an address or an address string'}
+        elif not isinstance(value.get('address'), str) or not value['address'].strip():
+            yield {'line': line_number, 'id': value.get('id'), 'error': 'Missing address'}
+        else:
+            yield {'line': line_number, 'id': value.get('id'), 'address': value['address']}
+
+
+def _csv_rows(reader, address_column, id_column):
+    for row in reader:
+        row_id = row.get(id_column) if id_column else None
+        address = (row.get(address_column) or '').strip()
+        if not address:
+            yield {'line': reader.line_num, 'id': row_id, 'error': 'Missing address'}
+        else:
+            yield {'line': reader.line_num, 'id': row_id, 'address': address}
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _geocode_batch(batch, api_key):
+    """Coordinates for the readable rows of a batch, or the error that failed the whole batch"""
+    addresses = [row['address'] for row in batch if 'error' not in row]
+    if not addresses:
+        return [], None
+    try:
+        with metrics.stage('geocode'):
+            return geocode_many(addresses, api_key), None
+    except Exception as e:
+        logger.error("Bulk geocoding batch of %d addresses failed: %s", len(addresses), e)
+        return None, str(e)
+
+
+def _batch_results(batch, outcome):
+    coords, batch_error = outcome
+    coords = iter(coords or [])
+    for row in batch:
+        result = {'line': row['line'], 'id': row.get('id'), 'address': row.get('address'),
+                  'lat': None, 'lng': None, 'success': False, 'error': row.get('error')}
+        if result['error'] is None:
+            if batch_error is not None:
+                result['error'] = batch_error
+            else:
+                result['lat'], result['lng'] = next(coords)
+                result['success'] = result['lat'] is not None
+                if not result['success']:
+                    result['error'] = 'Address not found'
+        yield result
+
+
+def geocode_rows(rows, api_key, batch_size=BATCH_SIZE, max_pending=MAX_PENDING_BATCHES):
+    """
+    Geocode rows from read_rows, yielding each batch's results as it finishes
+
+    Results within a batch are in input order, batches in completion order;
+    match results to rows by 'line'. The next batches geocode while a
+    finished one is being consumed; no more than max_pending batches are
+    read ahead.
+
+    Args:
+        rows: Iterator from read_rows
+        api_key: Google Maps API key
+        batch_size: Rows per geocode_many call
+        max_pending: Batches in flight at once
+
+    Yields:
+        Result dicts with RESULT_FIELDS
+    """
+    pending = {}
+    with ThreadPoolExecutor(max_workers=max_pending, thread_name_prefix='bulk-geocode') as pool:
+        for batch in _batches(rows, batch_size):
+            pending[pool.submit(_geocode_batch, batch, api_key)] = batch
+            if len(pending) >= max_pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from _batch_results(pending.pop(future), future.result())
+        for future in as_completed(list(pending)):
+            yield from _batch_results(pending.pop(future), future.result())
+
+
+def format_results(results, output_format):
+    """
+    Serialize results as NDJSON lines or CSV rows
+
+    NDJSON output ends with a {"summary": {"rows", "succeeded", "failed"}} line.
+
+    Yields:
+        Strings to stream to the client
+    """
+    succeeded = failed = 0
+    if output_format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=RESULT_FIELDS, lineterminator='\n')
+        writer.writeheader()
+        yield buffer.getvalue()
+
+    for result in results:
+        if result['success']:
+            succeeded += 1
+        else:
+            failed += 1
+        if output_format == 'csv':
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerow(result)
+            yield buffer.getvalue()
+        else:
+            yield json.dumps(result) + '\n'
+
+    logger.info("Bulk geocoding done: %d rows, %d failed", succeeded + failed, failed)
+    if output_format != 'csv':
+        yield json.dumps({'summary': {'rows': succeeded + failed, 'succeeded': succeeded, 'failed': failed}}) + '\n'
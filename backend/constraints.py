@@ -0,0 +1,198 @@
+"""
+Job and Crew Constraints
+Turns the optional scheduling fields of jobs and workers (service time,
+time windows, priority, shifts, capacity) into per-node arrays for the
+routing model. Node order is the solver's: depots (one per worker) first,
+then jobs.
+
+Job fields:
+    service_minutes      Time spent on site (default 0)
+    time_window_start    Earliest arrival, "HH:MM" or minutes after midnight
+    time_window_end      Latest arrival
+    priority             Weight of the penalty for leaving the job unserved (default 1)
+    demand               Units of crew capacity the job uses (default 1)
+
+Worker fields:
+    shift_start          Earliest departure from the depot, "HH:MM" or minutes after midnight
+    shift_end            Latest return to the depot
+    capacity             Total demand the crew can serve in a day (default unlimited)
+"""
+
+import numpy as np
+
+
+JOB_FIELDS = ('service_minutes', 'time_window_start', 'time_window_end', 'priority', 'demand')
+WORKER_FIELDS = ('shift_start', 'shift_end', 'capacity')
+
+# Times of day are modelled in seconds after midnight
+DAY_SECONDS = 24 * 3600
+
+# Objective penalty for an unserved job of priority 1. Serving a job can
+# never cost this much (it is ~1 day of travel on the longest route, with
+# the balance weight), so jobs are only dropped when no route can take them.
+DROP_PENALTY = 10_000_000
+
+
+def parse_time_of_day(value, field):
+    """
+    Seconds after midnight of a "HH:MM" string or a number of minutes
+
+    Args:
+        value: "HH:MM" (or "HH:MM:SS") string, or minutes after midnight
+        field: Field name for the error message
+
+    Returns:
+        Seconds after midnight (0..DAY_SECONDS)
+
+    Raises:
+        ValueError: If the value is not a time of day
+    """
+    try:
+        if isinstance(value, str):
+            parts = [int(part) for part in value.strip().split(':')]
+            if not 2 <= len(parts) <= 3:
+                raise ValueError
+            seconds = parts[0] * 3600 + parts[1] * 60 + (parts[2] if len(parts) == 3 else 0)
+        else:
+            seconds = int(round(float(value) * 60))
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} must be a time of day (\"HH:MM\" or minutes after midnight), got {value!r}")
+    if not 0 <= seconds <= DAY_SECONDS:
+        raise ValueError(f"{field} must be between 00:00 and 24:00, got {value!r}")
+    return seconds
+
+
+def format_time_of_day(seconds):
+    """"HH:MM" for seconds after midnight"""
+    minutes = int(seconds) // 60
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def _window(item, start_field, end_field, label):
+    start = item.get(start_field)
+    end = item.get(end_field)
+    start = parse_time_of_day(start, start_field) if start is not None else 0
+    end = parse_time_of_day(end, end_field) if end is not None else DAY_SECONDS
+    if start > end:
+        raise ValueError(f"{label}: {start_field} is after {end_field}")
+    return start, end
+
+
+def build_constraints(jobs, workers):
+    """
+    Per-node constraint arrays for a set of jobs and workers
+
+    Args:
+        jobs: Job dicts (optionally with JOB_FIELDS)
+        workers: Worker dicts (optionally with WORKER_FIELDS)
+
+    Returns:
+        None when no job or worker sets any of the fields (plain balanced
+        VRP), otherwise a dict:
+        - service: (N,) int64 seconds on site, 0 for depots
+        - windows: (N, 2) int64 [earliest, latest] arrival, the shift for
+          depot nodes; None when nobody has a time window or shift
+        - demand: (N,) int64, 0 for depots
+        - capacity: (V,) int64 per worker; None when nobody has a capacity
+        - penalty: (N,) int64 cost of dropping each job, 0 for depots
+
+    Raises:
+        ValueError: On malformed values
+    """
+    if not any(job.get(field) is not None for job in jobs for field in JOB_FIELDS) and \
+            not any(worker.get(field) is not None for worker in workers for field in WORKER_FIELDS):
+        return None
+
+    num_drivers = len(workers)
+    num_nodes = num_drivers + len(jobs)
+
+    service = np.zeros(num_nodes, dtype=np.int64)
+    demand = np.zeros(num_nodes, dtype=np.int64)
+    penalty = np.zeros(num_nodes, dtype=np.int64)
+    windows = np.tile(np.array([0, DAY_SECONDS], dtype=np.int64), (num_nodes, 1))
+
+    timed = False
+    for v, worker in enumerate(workers):
+        if worker.get('shift_start') is not None or worker.get('shift_end') is not None:
+            timed = True
+            windows[v] = _window(worker, 'shift_start', 'shift_end', f"Worker {worker.get('id')}")
+
+    for i, job in enumerate(jobs):
+        node = num_drivers + i
+        label = f"Job {job.get('id')}"
+        try:
+            service[node] = int(round(float(job.get('service_minutes') or 0) * 60))
+            demand[node] = int(job['demand']) if job.get('demand') is not None else 1
+            priority = float(job['priority']) if job.get('priority') is not None else 1.0
+        except (TypeError, ValueError):
+            raise ValueError(f"{label}: service_minutes, demand and priority must be numbers")
+        if service[node] < 0 or demand[node] < 0 or priority <= 0:
+            raise ValueError(f"{label}: service_minutes and demand must be >= 0 and priority > 0")
+        penalty[node] = int(DROP_PENALTY * priority)
+
+        if job.get('time_window_start') is not None or job.get('time_window_end') is not None:
+            timed = True
+            windows[node] = _window(job, 'time_window_start', 'time_window_end', label)
+
+    capacity = None
+    if any(worker.get('capacity') is not None for worker in workers):
+        unlimited = int(demand.sum())
+        try:
+            capacity = np.array([
+                int(worker['capacity']) if worker.get('capacity') is not None else unlimited
+                for worker in workers
+            ], dtype=np.int64)
+        except (TypeError, ValueError):
+            raise ValueError("Worker capacity must be a whole number")
+
+    return {
+        'service': service,
+        'windows': windows if timed else None,
+        'demand': demand,
+        'capacity': capacity,
+        'penalty': penalty
+    }
+
+
+def subset_constraints(constraints, nodes, drivers):
+    """
+    Constraints of a sub-problem (see decomposition.py)
+
+    Args:
+        constraints: Result of build_constraints (or None)
+        nodes: Global node indices of the sub-problem, its depots first
+        drivers: Global driver indices of the sub-problem's depots
+
+    Returns:
+        Constraint dict indexed like the sub-problem's nodes, or None
+    """
+    if constraints is None:
+        return None
+    nodes = np.asarray(nodes)
+    return {
+        'service': constraints['service'][nodes],
+        'windows': constraints['windows'][nodes] if constraints['windows'] is not None else None,
+        'demand': constraints['demand'][nodes],
+        'capacity': constraints['capacity'][list(drivers)] if constraints['capacity'] is not None else None,
+        'penalty': constraints['penalty'][nodes]
+    }
+
+
+def add_service_times(duration_matrix, constraints):
+    """
+    Travel matrix -> transit matrix: leaving node i takes its service time first
+
+    Route durations, insertion costs and the balance term then all count
+    time on site as well as driving.
+    """
+    if constraints is None or not constraints['service'].any():
+        return duration_matrix
+    return (duration_matrix + constraints['service'][:, None]).astype(duration_matrix.dtype)
+
+
+def dropped_penalty(constraints, routes):
+    """Total penalty of the jobs that no route visits"""
+    if constraints is None:
+        return 0
+    visited = {node for route in routes.values() for node in route['path']}
+    return int(sum(p for node, p in enumerate(constraints['penalty']) if p and node not in visited))
@@ -0,0 +1,288 @@
+"""
+Cluster-First Decomposition
+Large days are split into geographic clusters that each get a share of the
+drivers. Clusters are solved in parallel worker processes, then neighboring
+clusters are re-solved in pairs so jobs near a boundary can change sides.
+Only the matrices of the clusters and of neighboring pairs are built, never
+the full N x N matrix.
+"""
+
+import logging
+import math
+
+import numpy as np
+
+import metrics
+from constraints import add_service_times, subset_constraints
+from route_optimizer import BALANCE_COEFFICIENT, solver_settings
+from solver_pool import get_solver_pool, solve_in_worker
+
+
+# Target number of jobs per cluster
+MAX_CLUSTER_JOBS = 150
+
+# Each cluster is repaired together with this many nearest clusters
+REPAIR_NEIGHBORS = 2
+
+logger = logging.getLogger(__name__)
+
+
+def kmeans(points, k, iterations=25, seed=0):
+    """
+    Lloyd's k-means with k-means++ seeding (deterministic for a given seed)
+
+    Args:
+        points: (N, 2) array of (lat, lng)
+        k: Number of clusters
+        iterations: Maximum number of refinement passes
+        seed: RNG seed
+
+    Returns:
+        Tuple of (labels, centroids); empty clusters are dropped and labels
+        renumbered, so there may be fewer than k clusters
+    """
+    points = np.asarray(points, dtype=np.float64)
+    # Equirectangular projection so a degree of longitude is not as long as one of latitude
+    scaled = points * np.array([1.0, math.cos(math.radians(points[:, 0].mean()))])
+
+    rng = np.random.default_rng(seed)
+    centroids = [scaled[rng.integers(len(scaled))]]
+    for _ in range(1, k):
+        d2 = ((scaled[:, None, :] - np.array(centroids)[None, :, :]) ** 2).sum(axis=2).min(axis=1)
+        if d2.sum() == 0:
+            break
+        centroids.append(scaled[rng.choice(len(scaled), p=d2 / d2.sum())])
+    centroids = np.array(centroids)
+
+    labels = np.zeros(len(scaled), dtype=int)
+    for iteration in range(iterations):
+        d2 = ((scaled[:, None, :] - centroids[None, :, :]) ** 2).sum(axis=2)
+        new_labels = d2.argmin(axis=1)
+        if iteration > 0 and np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        for c in range(len(centroids)):
+            members = scaled[labels == c]
+            if len(members):
+                centroids[c] = members.mean(axis=0)
+
+    used = np.unique(labels)
+    labels = np.searchsorted(used, labels)
+    centroids = np.array([points[labels == c].mean(axis=0) for c in range(len(used))])
+    return labels, centroids
+
+
+def partition(depot_coords, job_coords, max_cluster_jobs=MAX_CLUSTER_JOBS):
+    """
+    Split jobs into geographic clusters and give each cluster its drivers
+
+    Drivers are shared out in proportion to each cluster's job count (at
+    least one each) and assigned to the closest cluster with room left.
+
+    Args:
+        depot_coords: List of (lat, lng), one per driver
+        job_coords: List of (lat, lng), one per job
+        max_cluster_jobs: Target cluster size
+
+    Returns:
+        Tuple of (clusters, centroids)
+        - clusters: List of (driver_indices, job_indices)
+        - centroids: (K, 2) array of cluster centers
+    """
+    num_drivers = len(depot_coords)
+    k = min(num_drivers, max(1, math.ceil(len(job_coords) / max_cluster_jobs)))
+    labels, centroids = kmeans(job_coords, k)
+    k = len(centroids)
+
+    # Largest-remainder share of drivers, at least one per cluster
+    counts = np.bincount(labels, minlength=k)
+    share = counts / counts.sum() * num_drivers
+    quota = np.maximum(1, np.floor(share).astype(int))
+    while quota.sum() > num_drivers:
+        quota[np.argmax(np.where(quota > 1, quota - share, -np.inf))] -= 1
+    while quota.sum() < num_drivers:
+        quota[np.argmax(share - quota)] += 1
+
+    # Closest (driver, cluster) pairs first
+    depots = np.asarray(depot_coords, dtype=np.float64)
+    d2 = ((depots[:, None, :] - centroids[None, :, :]) ** 2).sum(axis=2)
+    cluster_drivers = [[] for _ in range(k)]
+    assigned = set()
+    for flat in np.argsort(d2, axis=None, kind='stable'):
+        driver, cluster = divmod(int(flat), k)
+        if driver not in assigned and len(cluster_drivers[cluster]) < quota[cluster]:
+            cluster_drivers[cluster].append(driver)
+            assigned.add(driver)
+
+    clusters = [
+        (sorted(cluster_drivers[c]), [int(j) for j in np.flatnonzero(labels == c)])
+        for c in range(k)
+    ]
+    return clusters, centroids
+
+
+def _neighbor_rounds(centroids, neighbors=REPAIR_NEIGHBORS):
+    """
+    Pairs of neighboring clusters, grouped into rounds of disjoint pairs
+
+    Pairs within a round share no cluster, so they can be repaired in parallel.
+    """
+    d2 = ((centroids[:, None, :] - centroids[None, :, :]) ** 2).sum(axis=2)
+    np.fill_diagonal(d2, np.inf)
+    pairs = set()
+    for a in range(len(centroids)):
+        for b in np.argsort(d2[a])[:neighbors]:
+            if np.isfinite(d2[a, b]):
+                pairs.add((min(a, int(b)), max(a, int(b))))
+
+    rounds = []
+    for pair in sorted(pairs, key=lambda p: d2[p]):
+        for current in rounds:
+            if not any(set(pair) & set(other) for other in current):
+                current.append(pair)
+                break
+        else:
+            rounds.append([pair])
+    return rounds
+
+
+def _objective(route_durations):
+    """Objective of a group of routes: total duration plus the weighted longest route"""
+    if not route_durations:
+        return 0
+    return sum(route_durations) + BALANCE_COEFFICIENT * max(route_durations)
+
+
+def solve_vrp_decomposed(depot_coords, job_coords, matrix_provider, time_limit_seconds=None, progress=None,
+                         max_cluster_jobs=MAX_CLUSTER_JOBS, quality=None, constraints=None):
+    """
+    Large-instance solve: cluster, solve clusters in parallel, repair boundaries
+
+    Each cluster gets the time budget of its size (or time_limit_seconds);
+    each boundary repair gets half the budget of its pair.
+
+    Args:
+        depot_coords: List of (lat, lng), one per driver
+        job_coords: List of (lat, lng), one per job
+        matrix_provider: MatrixProvider for travel times
+        time_limit_seconds: Fixed solver time limit per cluster (default:
+                            scaled with the cluster size, see solver_settings)
+        progress: Optional callback progress(stage, **details)
+        max_cluster_jobs: Target cluster size
+        quality: Latency vs. quality target, see route_optimizer.SOLVER_PROFILES
+        constraints: Optional per-node constraints (constraints.build_constraints).
+                     Jobs a cluster drops are offered again to each boundary
+                     repair of that cluster.
+
+    Returns:
+        routes_dict in the solve_vrp_matrix format, with node indices into
+        depot_coords + job_coords
+    """
+    num_drivers = len(depot_coords)
+    all_locations = depot_coords + job_coords
+    clusters, centroids = partition(depot_coords, job_coords, max_cluster_jobs)
+
+    logger.info("Decomposed into %d clusters (drivers, jobs): %s",
+                len(clusters), [(len(drivers), len(jobs)) for drivers, jobs in clusters])
+
+    pool = get_solver_pool()
+    routes = {}
+
+    def build(drivers, jobs, paths=None):
+        """Sub-problem for drivers and job nodes, warm-started from {driver: path} if given"""
+        nodes = list(drivers) + list(jobs)
+        with metrics.stage('matrix'):
+            duration, distance = matrix_provider.build([all_locations[n] for n in nodes])
+        sub_constraints = subset_constraints(constraints, nodes, drivers)
+        duration = add_service_times(duration, sub_constraints)
+        initial = None
+        if paths is not None:
+            local = {node: i for i, node in enumerate(nodes)}
+            initial = [[local[node] for node in paths[v]] for v in drivers]
+        return nodes, duration, distance, initial, sub_constraints
+
+    def penalty(jobs, visited):
+        """Drop penalties of the job nodes that are not visited"""
+        if constraints is None:
+            return 0
+        return int(sum(constraints['penalty'][node] for node in jobs if node not in visited))
+
+    def collect(nodes, drivers, sub_routes):
+        """Map a sub-problem's routes back to global node indices"""
+        result = {}
+        for i, v in enumerate(drivers):
+            route = sub_routes[f"driver_{i}"]
+            result[v] = {**route, 'path': [nodes[n] for n in route['path']]}
+        return result
+
+    # Solve every cluster in parallel
+    if progress:
+        progress('matrix', locations=len(all_locations), clusters=len(clusters))
+    subproblems = []
+    budgets = []
+    for drivers, jobs in clusters:
+        settings = solver_settings(len(jobs), quality, time_limit_seconds)
+        budgets.append(settings['time_limit_seconds'])
+        nodes, duration, distance, _, sub_constraints = build(drivers, [num_drivers + j for j in jobs])
+        subproblems.append((drivers, nodes, pool.submit(
+            solve_in_worker, duration, distance, len(drivers), settings['time_limit_seconds'],
+            plateau_seconds=settings['plateau_seconds'], constraints=sub_constraints
+        )))
+
+    if progress:
+        progress('solve', clusters=len(clusters), time_limit_seconds=max(budgets))
+    with metrics.stage('solve'):
+        for drivers, nodes, future in subproblems:
+            sub_routes, solver_stats = future.result()
+            metrics.record_solver(**solver_stats)
+            routes.update(collect(nodes, drivers, sub_routes))
+
+    # Jobs the cluster solves could not fit in (only with constraints)
+    visited = {node for route in routes.values() for node in route['path']}
+    dropped = {num_drivers + j for j in range(len(job_coords))} - visited
+
+    # Boundary repair between neighboring clusters, warm-started from the current routes
+    rounds = _neighbor_rounds(centroids)
+    improved = 0
+    for pairs in rounds:
+        pending = []
+        budgets = []
+        for a, b in pairs:
+            drivers = clusters[a][0] + clusters[b][0]
+            paths = {v: routes[v]['path'][1:-1] for v in drivers}
+            unassigned = sorted(dropped & {num_drivers + j for j in clusters[a][1] + clusters[b][1]})
+            jobs = [node for v in drivers for node in paths[v]] + unassigned
+            settings = solver_settings(len(jobs), quality, time_limit_seconds)
+            repair_seconds = max(1, settings['time_limit_seconds'] / 2)
+            budgets.append(repair_seconds)
+            nodes, duration, distance, initial, sub_constraints = build(drivers, jobs, paths)
+            pending.append((drivers, jobs, nodes, pool.submit(
+                solve_in_worker, duration, distance, len(drivers), repair_seconds,
+                initial_routes=initial, plateau_seconds=settings['plateau_seconds'], constraints=sub_constraints
+            )))
+
+        if progress:
+            progress('repair', pairs=len(pairs), time_limit_seconds=max(budgets))
+        for drivers, jobs, nodes, future in pending:
+            with metrics.stage('repair'):
+                sub_routes, solver_stats = future.result()
+            metrics.record_solver(**solver_stats)
+            repaired = collect(nodes, drivers, sub_routes)
+            repaired_visited = {node for v in drivers for node in repaired[v]['path']}
+            before_penalty = penalty(jobs, {node for v in drivers for node in routes[v]['path']})
+            after_penalty = penalty(jobs, repaired_visited)
+            before = _objective([routes[v]['duration_seconds'] for v in drivers]) + before_penalty
+            after = _objective([repaired[v]['duration_seconds'] for v in drivers]) + after_penalty
+            # The pair must not push up the longest route of the whole plan,
+            # unless that buys serving a job that was dropped
+            longest = max(route['duration_seconds'] for route in routes.values())
+            if after < before and (max(repaired[v]['duration_seconds'] for v in drivers) <= longest
+                                   or after_penalty < before_penalty):
+                routes.update(repaired)
+                dropped.difference_update(repaired_visited)
+                dropped.update(node for node in jobs if node not in repaired_visited)
+                improved += 1
+
+    logger.info("Boundary repair: %d of %d cluster pairs improved", improved, sum(len(p) for p in rounds))
+
+    return {f"driver_{v}": routes[v] for v in range(num_drivers)}
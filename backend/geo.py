@@ -0,0 +1,49 @@
+"""
+Geographic Helpers
+Great-circle distance utilities shared by the optimizer and matrix providers
+"""
+
+from math import atan2, cos, radians, sin, sqrt
+
+import numpy as np
+
+
+EARTH_RADIUS_KM = 6371
+
+
+def haversine_km(coord1, coord2):
+    """
+    Calculate distance between two lat/lng points in km
+
+    Args:
+        coord1: (lat, lng) tuple
+        coord2: (lat, lng) tuple
+
+    Returns:
+        Great-circle distance in kilometers
+    """
+    lat1, lon1 = radians(coord1[0]), radians(coord1[1])
+    lat2, lon2 = radians(coord2[0]), radians(coord2[1])
+    dlat, dlon = lat2 - lat1, lon2 - lon1
+    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
+    return EARTH_RADIUS_KM * 2 * atan2(sqrt(a), sqrt(1-a))
+
+
+def haversine_matrix_km(origins, destinations):
+    """
+    Great-circle distances between every origin and every destination in one pass
+
+    Args:
+        origins: Sequence (or Nx2 array) of (lat, lng)
+        destinations: Sequence (or Mx2 array) of (lat, lng)
+
+    Returns:
+        NxM float64 NumPy array of distances in kilometers
+    """
+    a = np.radians(np.asarray(origins, dtype=np.float64).reshape(-1, 2))
+    b = np.radians(np.asarray(destinations, dtype=np.float64).reshape(-1, 2))
+
+    lat1, lon1 = a[:, 0:1], a[:, 1:2]
+    lat2, lon2 = b[:, 0], b[:, 1]
+    h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(h), np.sqrt(np.clip(1 - h, 0, None)))
@@ -0,0 +1,228 @@
+"""
+Geocoding Pipeline
+Normalizes and deduplicates addresses, serves repeats from a persistent
+cache and geocodes the misses concurrently over the shared Google client.
+"""
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from google_client import DEFAULT_MAX_WORKERS, get_client, request_limiter
+
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'geocodes.sqlite3')
+# Addresses rarely move; keep results for 90 days
+DEFAULT_TTL_SECONDS = 90 * 24 * 3600
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_address(address):
+    """
+    Canonical form of an address used as the cache / dedup key
+
+    Case, repeated whitespace, periods and spacing around commas are
+    ignored, so "1 City Hall Sq.,  Boston, MA" and "1 city hall sq, boston, ma"
+    share one lookup.
+
+    Args:
+        address: Address string
+
+    Returns:
+        Normalized string ("" for empty input)
+    """
+    if not address:
+        return ''
+    key = address.casefold().replace('.', ' ')
+    key = re.sub(r'\s*,\s*', ', ', key)
+    key = re.sub(r'\s+', ' ', key)
+    return key.strip(' ,')
+
+
+class GeocodeCache:
+    """
+    SQLite-backed address -> (lat, lng) cache shared by all worker processes
+
+    Only successful lookups are stored, so a typo fixed in the address book
+    is retried on the next request.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS geocodes (
+                    address TEXT PRIMARY KEY,
+                    lat REAL NOT NULL,
+                    lng REAL NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            self._conn.commit()
+
+    def get_many(self, keys):
+        """
+        Look up normalized addresses
+
+        Args:
+            keys: Iterable of normalized addresses
+
+        Returns:
+            Dict {key: (lat, lng)} for the keys that are cached
+        """
+        keys = list(keys)
+        found = {}
+        min_created = time.time() - self.ttl_seconds
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT address, lat, lng FROM geocodes "
+                    f"WHERE created_at >= ? AND address IN ({','.join('?' * len(batch))})",
+                    [min_created, *batch]
+                ).fetchall()
+                for address, lat, lng in rows:
+                    found[address] = (lat, lng)
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        metrics.CACHE_LOOKUPS.inc(len(found), cache='geocodes', result='hit')
+        metrics.CACHE_LOOKUPS.inc(len(keys) - len(found), cache='geocodes', result='miss')
+        return found
+
+    def put_many(self, entries):
+        """
+        Store successful lookups
+
+        Args:
+            entries: Dict {key: (lat, lng)}
+        """
+        now = time.time()
+        rows = [(key, lat, lng, now) for key, (lat, lng) in entries.items() if lat is not None]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO geocodes VALUES (?, ?, ?, ?)", rows)
+            self._conn.execute("DELETE FROM geocodes WHERE created_at < ?", (now - self.ttl_seconds,))
+            self._conn.commit()
+
+    def stats(self):
+        """Hit/miss counters and number of stored addresses"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM geocodes").fetchone()[0]
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else None,
+                'entries': entries,
+                'ttl_seconds': self.ttl_seconds
+            }
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_geocode_cache():
+    """
+    Process-wide geocode cache configured from environment variables
+
+    GEOCODE_CACHE_ENABLED (default "true"), GEOCODE_CACHE_PATH and
+    GEOCODE_CACHE_TTL_SECONDS.
+
+    Returns:
+        GeocodeCache instance, or None when caching is disabled
+    """
+    global _default_cache
+
+    if os.getenv('GEOCODE_CACHE_ENABLED', 'true').lower() in ('0', 'false', 'no'):
+        return None
+
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = GeocodeCache(
+                path=os.getenv('GEOCODE_CACHE_PATH', DEFAULT_CACHE_PATH),
+                ttl_seconds=int(os.getenv('GEOCODE_CACHE_TTL_SECONDS', DEFAULT_TTL_SECONDS))
+            )
+        return _default_cache
+
+
+def _geocode_one(gmaps, address):
+    """Geocode a single address, returning (lat, lng) or (None, None)"""
+    request_limiter.acquire()
+    try:
+        result = gmaps.geocode(address)
+        if result:
+            metrics.GEOCODE_REQUESTS.inc(status='ok')
+            loc = result[0]["geometry"]["location"]
+            return (loc["lat"], loc["lng"])
+        metrics.GEOCODE_REQUESTS.inc(status='not_found')
+        return (None, None)
+    except Exception as e:
+        metrics.GEOCODE_REQUESTS.inc(status='error')
+        logger.error("Error geocoding %s: %s", address, e)
+        return (None, None)
+
+
+def geocode_many(address_list, api_key, cache=None, max_workers=DEFAULT_MAX_WORKERS):
+    """
+    Geocode a list of addresses with dedup, caching and bounded concurrency
+
+    Args:
+        address_list: List of address strings
+        api_key: Google Maps API key (only needed if something is not cached)
+        cache: GeocodeCache to use (default: process-wide cache)
+        max_workers: Maximum number of concurrent Geocoding API requests
+
+    Returns:
+        List of (lat, lng) tuples aligned with address_list; (None, None)
+        for addresses that could not be geocoded
+    """
+    if cache is None:
+        cache = get_default_geocode_cache()
+
+    keys = [normalize_address(address) for address in address_list]
+
+    # First original spelling per normalized key is what we send to Google
+    unique = {}
+    for key, address in zip(keys, address_list):
+        if key and key not in unique:
+            unique[key] = address
+
+    resolved = cache.get_many(unique) if cache else {}
+    missing = [key for key in unique if key not in resolved]
+
+    logger.debug("Geocoding %d addresses (%d unique, %d cached, %d to fetch)",
+                 len(address_list), len(unique), len(unique) - len(missing), len(missing))
+    metrics.count('geocode_cache_hits', len(unique) - len(missing))
+    metrics.count('geocode_requests', len(missing))
+
+    if missing:
+        if not api_key:
+            raise ValueError("Google Maps API key is required for geocoding")
+
+        gmaps = get_client(api_key, pool_size=max_workers)
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(missing)))) as pool:
+            fetched = dict(zip(missing, pool.map(lambda key: _geocode_one(gmaps, unique[key]), missing)))
+
+        if cache:
+            cache.put_many(fetched)
+        resolved.update(fetched)
+
+    return [resolved.get(key, (None, None)) if key else (None, None) for key in keys]
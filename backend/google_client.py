@@ -0,0 +1,89 @@
+"""
+Shared Google Maps Client
+One pooled googlemaps.Client per API key plus client-side rate limiting,
+so concurrent Distance Matrix / Geocoding calls reuse HTTP connections and
+stay under the provider's quotas.
+"""
+
+import os
+import threading
+import time
+
+
+# Google's documented limits for the Distance Matrix API
+DISTANCE_MATRIX_MAX_ORIGINS = 25
+DISTANCE_MATRIX_MAX_DESTINATIONS = 25
+DISTANCE_MATRIX_ELEMENTS_PER_SECOND = 1000
+
+DEFAULT_MAX_WORKERS = int(os.getenv('GOOGLE_MAX_WORKERS', 8))
+DEFAULT_QPS = float(os.getenv('GOOGLE_QPS', 50))
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket
+
+    Args:
+        rate: Tokens added per second
+        burst: Bucket size (defaults to one second worth of tokens)
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst if burst is not None else max(rate, 1))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """Block until `tokens` tokens are available, then consume them"""
+        # A single request larger than the bucket is allowed once the bucket is full
+        tokens = min(float(tokens), self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+# Shared by every request in this process
+request_limiter = RateLimiter(DEFAULT_QPS)
+element_limiter = RateLimiter(DISTANCE_MATRIX_ELEMENTS_PER_SECOND)
+
+
+def get_client(api_key, pool_size=DEFAULT_MAX_WORKERS):
+    """
+    Return the shared googlemaps.Client for an API key
+
+    The client's HTTP session is mounted with a connection pool large enough
+    for `pool_size` concurrent requests. googlemaps' own rate limiter is not
+    thread-safe, so it is effectively disabled in favour of request_limiter.
+
+    Args:
+        api_key: Google Maps API key
+        pool_size: Number of pooled HTTP connections
+
+    Returns:
+        googlemaps.Client
+    """
+    # Imported on first use: keeps worker startup (and the preloading
+    # gunicorn master) from paying for googlemaps / requests
+    import googlemaps
+    from requests.adapters import HTTPAdapter
+
+    with _clients_lock:
+        client = _clients.get(api_key)
+        if client is None:
+            client = googlemaps.Client(key=api_key, queries_per_second=10000, queries_per_minute=600000)
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            client.session.mount('https://', adapter)
+            _clients[api_key] = client
+        return client
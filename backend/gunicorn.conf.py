@@ -0,0 +1,53 @@
+"""
+Gunicorn configuration for the Route Optimization API
+
+    gunicorn -c gunicorn.conf.py app:app
+
+The app is imported once in the master and forked into the workers
+(preload_app), so workers start in milliseconds and share the imported code
+pages. OR-Tools and googlemaps are not imported by the web workers at all:
+searches run in the solver processes (solver_pool.py) and the Google client
+is created on first use. Everything the workers share lives on disk (the
+SQLite caches and job store under .cache/, or Redis for optimization
+results), and the host-wide solver queue (solver_queue.py) keeps the number
+of optimizations bounded, answering 429 when it is full. Each worker's
+threads only wait on solver processes, so /health and /api/geocode keep
+being served while solves run.
+
+Environment:
+    PORT               Listen port (default 5000)
+    WEB_CONCURRENCY    Worker processes (default 4)
+    GUNICORN_THREADS   Threads per worker (default 8)
+    GUNICORN_TIMEOUT   Seconds before a silent worker is restarted (default 120)
+"""
+
+import os
+
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', 4))
+# Read by solver_pool.py (imported after this file) to split the cores between the workers' pools
+os.environ['WEB_CONCURRENCY'] = str(workers)
+
+# gthread workers keep /health, polling and SSE streams responsive while
+# optimizations wait on the solver processes
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+
+preload_app = True
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.getenv('LOG_LEVEL', 'info').lower()
+
+
+def when_ready(server):
+    # Nothing opened in the master may be shared by the forked workers:
+    # caches, database and solver pools are all created lazily per process
+    import sys
+    loaded = [name for name in ('ortools', 'googlemaps') if name in sys.modules]
+    if loaded:
+        server.log.warning("Preloaded app imported %s in the master process", ', '.join(loaded))
@@ -0,0 +1,66 @@
+-- Stand-in for the Supabase database when developing the backend locally
+-- (docker compose up): the tables db.py reads and writes, as defined in
+-- supabase/migrations. Keep in step with the migrations.
+
+CREATE TABLE IF NOT EXISTS workers (
+    id uuid DEFAULT gen_random_uuid() PRIMARY KEY,
+    name text NOT NULL,
+    email text,
+    phone text,
+    status text DEFAULT 'available' CHECK (status IN ('available', 'on_route', 'busy')),
+    created_at timestamptz DEFAULT now(),
+    depot_address text DEFAULT '1 City Hall Square, Boston, MA 02201',
+    depot_latitude numeric(10,8),
+    depot_longitude numeric(11,8)
+);
+
+CREATE TABLE IF NOT EXISTS routes (
+    id uuid DEFAULT gen_random_uuid() PRIMARY KEY,
+    created_at timestamptz DEFAULT now() NOT NULL,
+    updated_at timestamptz DEFAULT now() NOT NULL,
+    route_date date NOT NULL,
+    worker_id uuid NOT NULL REFERENCES workers(id) ON DELETE CASCADE,
+    status text DEFAULT 'pending' NOT NULL CHECK (status IN ('pending', 'in_progress', 'completed', 'cancelled')),
+    total_distance_meters numeric(12,2),
+    total_duration_seconds integer,
+    optimized_path jsonb,
+    notes text,
+    UNIQUE (worker_id, route_date)
+);
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id uuid DEFAULT gen_random_uuid() PRIMARY KEY,
+    title text NOT NULL,
+    description text,
+    status text DEFAULT 'pending' CHECK (status IN ('pending', 'in_progress', 'completed', 'overdue')),
+    client_id uuid,
+    worker_id uuid REFERENCES workers(id),
+    address text,
+    scheduled_date timestamptz,
+    created_at timestamptz DEFAULT now(),
+    latitude numeric(10,8),
+    longitude numeric(11,8),
+    route_id uuid REFERENCES routes(id) ON DELETE SET NULL,
+    route_order integer
+);
+
+CREATE TABLE IF NOT EXISTS route_jobs (
+    id uuid DEFAULT gen_random_uuid() PRIMARY KEY,
+    route_id uuid NOT NULL REFERENCES routes(id) ON DELETE CASCADE,
+    job_id uuid NOT NULL REFERENCES jobs(id) ON DELETE CASCADE,
+    job_order integer NOT NULL,
+    location_lat numeric(10,8),
+    location_lng numeric(11,8),
+    completed_at timestamptz,
+    created_at timestamptz DEFAULT now() NOT NULL,
+    UNIQUE (route_id, job_id),
+    UNIQUE (route_id, job_order)
+);
+
+CREATE INDEX IF NOT EXISTS idx_jobs_route_id ON jobs (route_id);
+CREATE INDEX IF NOT EXISTS idx_jobs_scheduled_date ON jobs (scheduled_date);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status);
+CREATE INDEX IF NOT EXISTS idx_route_jobs_job_id ON route_jobs (job_id);
+CREATE INDEX IF NOT EXISTS idx_route_jobs_route_id ON route_jobs (route_id);
+CREATE INDEX IF NOT EXISTS idx_routes_date ON routes (route_date);
+CREATE INDEX IF NOT EXISTS idx_routes_worker_id ON routes (worker_id);
@@ -0,0 +1,1057 @@
+"""
+Distance Matrix Providers
+Pluggable sources of the NxN travel time / distance matrices used by the VRP:
+- google: Google Maps Distance Matrix API (traffic-aware, cached)
+- haversine: straight-line distance times a speed profile, no network needed
+- road_graph: shortest paths over a local OSM-derived road graph
+"""
+
+import logging
+import math
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+import metrics
+from constraints import parse_time_of_day
+from geo import haversine_matrix_km
+from google_client import (
+    DEFAULT_MAX_WORKERS,
+    DISTANCE_MATRIX_MAX_DESTINATIONS,
+    DISTANCE_MATRIX_MAX_ORIGINS,
+    element_limiter,
+    get_client,
+    request_limiter,
+)
+from road_graph import ACCESS_SPEED_KMH, load_road_graph
+from travel_cache import SERVICE_TIMEZONE, coord_key, get_default_cache, time_bucket
+
+
+logger = logging.getLogger(__name__)
+
+
+# Sparse mode: real travel times only for this many nearest neighbors of each
+# location (plus depot links); 0 requests the full matrix
+DEFAULT_NEIGHBORS = int(os.getenv('GOOGLE_MATRIX_NEIGHBORS') or 0)
+
+# Estimated cells are inflated so the solver prefers verified arcs
+ESTIMATE_PENALTY = 1.2
+
+# Failed Distance Matrix requests: retries per chunk, backoff before retry n
+# is random between 0 and min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2^(n-1)),
+# and a chunk that still fails is halved up to MAX_SPLIT_DEPTH times
+CHUNK_RETRIES = int(os.getenv('GOOGLE_MATRIX_RETRIES', 3))
+BACKOFF_BASE_SECONDS = float(os.getenv('GOOGLE_MATRIX_BACKOFF_SECONDS', 0.5))
+BACKOFF_MAX_SECONDS = 8
+MAX_SPLIT_DEPTH = 4
+# Failed requests one fetch tolerates before it gives up on failing chunks:
+# this many, or two per chunk if more
+MIN_FAILURE_BUDGET = 20
+
+# Time-dependent mode: departure times of day a matrix is fetched for, in the
+# service area's time zone (SERVICE_TIMEZONE, see departure_slices)
+DEFAULT_DEPARTURE_SLICES = os.getenv('DEPARTURE_SLICES', '08:00,10:00,12:00,14:00,16:00')
+
+# API statuses that retrying cannot fix; the first kind is not worth splitting either
+PERMANENT_STATUSES = ('REQUEST_DENIED',)
+SPLIT_STATUSES = ('INVALID_REQUEST', 'MAX_ELEMENTS_EXCEEDED', 'MAX_DIMENSIONS_EXCEEDED')
+
+
+def _parse_rows(response, traffic=True):
+    """(duration_seconds, distance_meters) rows of a response; pairs without a route are (999999, 999999)"""
+    values = []
+    for row in response["rows"]:
+        row_values = []
+        for element in row["elements"]:
+            if element["status"] == "OK":
+                # Get duration - prefer traffic-aware, fallback to regular
+                if traffic and "duration_in_traffic" in element:
+                    duration = element["duration_in_traffic"]["value"]
+                else:
+                    duration = element["duration"]["value"]
+                # Get distance in meters
+                row_values.append((duration, element["distance"]["value"]))
+            else:
+                logger.warning("Route not available: %s", element['status'])
+                row_values.append((999999, 999999))
+        values.append(row_values)
+    return values
+
+
+def _request_chunk(gmaps, origins, destinations, departure_time="now"):
+    """
+    One rate-limited Distance Matrix request, repeated without traffic if needed
+
+    Raises:
+        Whatever the client raises (timeouts, transport and API errors)
+    """
+    request_limiter.acquire()
+    element_limiter.acquire(len(origins) * len(destinations))
+    started = time.perf_counter()
+    try:
+        try:
+            # Try with traffic data first
+            response = gmaps.distance_matrix(
+                origins=origins,
+                destinations=destinations,
+                mode="driving",
+                departure_time=departure_time,
+                traffic_model="best_guess"
+            )
+            values = _parse_rows(response)
+        except KeyError as e:
+            logger.warning("Traffic data not available (%s), trying without traffic...", e)
+            metrics.MATRIX_REQUESTS.inc(status='no_traffic_retry')
+            response = gmaps.distance_matrix(
+                origins=origins,
+                destinations=destinations,
+                mode="driving"
+            )
+            values = _parse_rows(response, traffic=False)
+    finally:
+        metrics.MATRIX_CHUNK_SECONDS.observe(time.perf_counter() - started)
+
+    metrics.MATRIX_REQUESTS.inc(status='ok')
+    metrics.MATRIX_ELEMENTS.inc(len(origins) * len(destinations))
+    return values
+
+
+class _FailureBudget:
+    """
+    Failed requests one matrix fetch tolerates before it stops retrying and splitting
+
+    Keeps a provider outage from multiplying the request count: once the
+    budget is spent, failing chunks are estimated right away. Also counts
+    the retries and splits for the request's metrics, which the fetching
+    threads cannot record themselves.
+    """
+
+    def __init__(self, failures):
+        self.remaining = failures
+        self.retries = 0
+        self.splits = 0
+        self._lock = threading.Lock()
+
+    def spend(self):
+        """Account for one failed request; False once the budget is used up"""
+        with self._lock:
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            return True
+
+    def record(self, retries=0, splits=0):
+        with self._lock:
+            self.retries += retries
+            self.splits += splits
+
+
+def _backoff_seconds(attempt):
+    """Full-jitter exponential backoff before retry number attempt (1-based)"""
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempt - 1)))
+
+
+def _fetch_chunk(gmaps, origins, destinations, budget=None, depth=0, departure_time="now"):
+    """
+    Fetch one Distance Matrix chunk, retrying and splitting it on failure
+
+    A failing request is retried up to CHUNK_RETRIES times with exponential
+    backoff and jitter. If it still fails, the chunk is split in half along
+    its longer side (down to MAX_SPLIT_DEPTH) and each half fetched the same
+    way, so one bad location or an oversized request only loses its own
+    cells. Requests Google rejects as invalid are split without retrying;
+    REQUEST_DENIED (bad key or billing) is neither retried nor split.
+
+    Args:
+        gmaps: googlemaps.Client
+        origins: List of "lat,lng" strings
+        destinations: List of "lat,lng" strings
+        budget: _FailureBudget shared by the chunks of one fetch
+                (default: MIN_FAILURE_BUDGET for this chunk)
+        depth: Times this chunk has been split already
+        departure_time: "now" or a future datetime for traffic-aware durations
+
+    Returns:
+        List of rows, each a list of (duration_seconds, distance_meters)
+        tuples, or None for cells that could not be fetched. Pairs Google
+        has no route for are (999999, 999999).
+    """
+    if budget is None:
+        budget = _FailureBudget(MIN_FAILURE_BUDGET)
+
+    split = True
+    for attempt in range(CHUNK_RETRIES + 1):
+        try:
+            return _request_chunk(gmaps, origins, destinations, departure_time)
+        except Exception as e:
+            status = getattr(e, 'status', None)
+            logger.warning("Distance matrix chunk %dx%d failed (attempt %d): %s",
+                           len(origins), len(destinations), attempt + 1, e)
+            metrics.MATRIX_REQUESTS.inc(status='error')
+            if not budget.spend() or status in PERMANENT_STATUSES:
+                split = False
+                break
+            if status in SPLIT_STATUSES:
+                break
+        if attempt < CHUNK_RETRIES:
+            budget.record(retries=1)
+            time.sleep(_backoff_seconds(attempt + 1))
+
+    size = len(origins) * len(destinations)
+    if split and size > 1 and depth < MAX_SPLIT_DEPTH:
+        budget.record(splits=1)
+        if len(origins) >= len(destinations):
+            mid = len(origins) // 2
+            return (_fetch_chunk(gmaps, origins[:mid], destinations, budget, depth + 1, departure_time)
+                    + _fetch_chunk(gmaps, origins[mid:], destinations, budget, depth + 1, departure_time))
+        mid = len(destinations) // 2
+        left = _fetch_chunk(gmaps, origins, destinations[:mid], budget, depth + 1, departure_time)
+        right = _fetch_chunk(gmaps, origins, destinations[mid:], budget, depth + 1, departure_time)
+        return [left_row + right_row for left_row, right_row in zip(left, right)]
+
+    logger.error("Giving up on %d distance matrix cells; they will be estimated", size)
+    return [[None] * len(destinations) for _ in origins]
+
+
+def best_chunk_shape(num_rows, num_cols, max_elements=100):
+    """
+    Pick the (origins, destinations) chunk shape that needs the fewest requests
+
+    A square sqrt(max_elements) chunk wastes requests on ragged edges, e.g. a
+    12x12 matrix takes 4 requests with 10x10 chunks but only 2 with 12x8.
+
+    Args:
+        num_rows: Number of origins to cover
+        num_cols: Number of destinations to cover
+        max_elements: Maximum API elements per request
+
+    Returns:
+        Tuple of (rows_per_chunk, cols_per_chunk)
+    """
+    best = None
+    for rows in range(1, min(DISTANCE_MATRIX_MAX_ORIGINS, max_elements, max(num_rows, 1)) + 1):
+        cols = min(DISTANCE_MATRIX_MAX_DESTINATIONS, max_elements // rows, max(num_cols, 1))
+        requests = math.ceil(num_rows / rows) * math.ceil(num_cols / cols)
+        # Prefer fewer requests, then the squarest shape (fewest wasted cells)
+        score = (requests, abs(rows - cols))
+        if best is None or score < best[0]:
+            best = (score, (rows, cols))
+    return best[1]
+
+
+def _spatial_order(locations):
+    """
+    Order locations along a Z-order (Morton) curve
+
+    Nearby points get nearby positions, so the neighbor pairs of a sparse
+    matrix fall into few Distance Matrix chunks.
+
+    Args:
+        locations: List of (lat, lng) tuples
+
+    Returns:
+        Array of indices into locations
+    """
+    coords = np.asarray(locations, dtype=np.float64).reshape(-1, 2)
+    span = np.ptp(coords, axis=0)
+    span[span == 0] = 1.0
+    cells = ((coords - coords.min(axis=0)) / span * 65535).astype(np.uint64)
+    codes = np.zeros(len(coords), dtype=np.uint64)
+    for bit in range(16):
+        codes |= ((cells[:, 0] >> np.uint64(bit)) & np.uint64(1)) << np.uint64(2 * bit + 1)
+        codes |= ((cells[:, 1] >> np.uint64(bit)) & np.uint64(1)) << np.uint64(2 * bit)
+    return np.argsort(codes, kind='stable')
+
+
+def plan_requests(locations, missing, max_elements=100, chunk_shape=None, spatial=True):
+    """
+    Distance Matrix requests covering the missing cells of a matrix
+
+    The matrix is cut into chunks of chunk_shape; each chunk requests only
+    the rows and columns with missing cells, and a chunk where those are
+    mostly cached is split into one request per pattern of missing columns
+    so cached cells are not paid for again.
+
+    Args:
+        locations: List of (lat, lng) tuples, unique
+        missing: NxN bool array of the cells to fetch
+        max_elements: Maximum API elements per request
+        chunk_shape: (origins, destinations) per request (default: best_chunk_shape)
+        spatial: Chunk in spatial order, so a sparse neighborhood lands near the diagonal
+
+    Returns:
+        List of (origin indices, destination indices), one per request; the
+        elements billed are the sum of len(origins) * len(destinations)
+    """
+    M = len(locations)
+    # Determine chunk shape to respect API limits
+    rows_per_chunk, cols_per_chunk = chunk_shape or best_chunk_shape(M, M, max_elements)
+
+    order = _spatial_order(locations) if spatial else np.arange(M)
+    ordered_missing = missing[np.ix_(order, order)]
+
+    # Only request the rows/columns of each block that have missing cells
+    blocks = []
+    for i_start in range(0, M, rows_per_chunk):
+        for j_start in range(0, M, cols_per_chunk):
+            block = ordered_missing[i_start:i_start + rows_per_chunk, j_start:j_start + cols_per_chunk]
+            row_offsets = np.flatnonzero(block.any(axis=1))
+            if not len(row_offsets):
+                continue
+            col_offsets = np.flatnonzero(block[row_offsets].any(axis=0))
+            sub = block[np.ix_(row_offsets, col_offsets)]
+            rows = order[row_offsets + i_start].tolist()
+            cols = order[col_offsets + j_start].tolist()
+            if sub.sum() * 2 >= sub.size:
+                blocks.append((rows, cols))
+                continue
+            # Sparse block (e.g. one new stop's row and column): group rows
+            # with the same missing columns so we don't pay for cached cells
+            patterns = {}
+            for r, i in enumerate(rows):
+                pattern = tuple(np.asarray(cols)[sub[r]].tolist())
+                patterns.setdefault(pattern, []).append(i)
+            for pattern, pattern_rows in patterns.items():
+                blocks.append((pattern_rows, list(pattern)))
+    return blocks
+
+
+def fetch_travel_times(locations, api_key, required=None, max_elements=100, cache=None,
+                       chunk_shape=None, max_workers=DEFAULT_MAX_WORKERS, departure_time="now"):
+    """
+    Fill NxN duration/distance matrices with real travel times from Google
+
+    Cells present in the travel time cache are served from it and only the
+    required origin -> destination pairs that are still missing are sent to
+    the API. Chunks are fetched concurrently over a shared, pooled client
+    and rate limited to stay under Google's QPS and elements-per-second quotas.
+
+    Args:
+        locations: List of (lat, lng) tuples
+        api_key: Google Maps API key
+        required: Optional NxN bool array of the pairs to fetch (default: all)
+        max_elements: Maximum API elements per request (default 100)
+        cache: TravelTimeCache to use (default: process-wide cache, see travel_cache.py)
+        chunk_shape: (origins, destinations) per request (default: best_chunk_shape)
+        max_workers: Maximum number of concurrent API requests
+        departure_time: "now" or a future datetime; travel times are cached
+                        per time_bucket of the departure
+
+    Returns:
+        Tuple of (duration_matrix, distance_matrix, known) as NxN NumPy arrays
+        - duration_matrix: int32 durations in seconds (0 where not known)
+        - distance_matrix: int32 distances in meters (0 where not known)
+        - known: bool, True where the cell holds a real value (cached or
+          fetched, including the diagonal). Cells whose requests still
+          failed after retries and splitting (see _fetch_chunk) are left
+          unknown and are not cached.
+    """
+    if cache is None:
+        cache = get_default_cache()
+
+    N = len(locations)
+
+    # Work on unique points only; duplicates (two jobs at one address) are
+    # expanded back to the full NxN matrix at the end
+    keys = [coord_key(loc) for loc in locations]
+    position = {}
+    unique_locations = []
+    for key, loc in zip(keys, locations):
+        if key not in position:
+            position[key] = len(unique_locations)
+            unique_locations.append(loc)
+    node_to_unique = np.array([position[key] for key in keys], dtype=np.intp)
+    M = len(unique_locations)
+
+    duration_matrix = np.zeros((M, M), dtype=np.int32)
+    distance_matrix = np.zeros((M, M), dtype=np.int32)
+    known = np.eye(M, dtype=bool)
+
+    if required is None:
+        wanted = ~known
+    else:
+        wanted = np.zeros((M, M), dtype=bool)
+        rows, cols = np.nonzero(required)
+        wanted[node_to_unique[rows], node_to_unique[cols]] = True
+        np.fill_diagonal(wanted, False)
+
+    bucket = time_bucket(departure_time)
+
+    # Serve what we can from the cache and remember which cells are missing
+    cached = cache.get_many(unique_locations, unique_locations, bucket) if cache else {}
+    for (origin, destination), (duration, distance) in cached.items():
+        i, j = position[origin], position[destination]
+        if i != j:
+            duration_matrix[i, j] = duration
+            distance_matrix[i, j] = distance
+            known[i, j] = True
+
+    missing = wanted & ~known
+    num_missing = int(missing.sum())
+    num_pairs = int(wanted.sum())
+    if cache:
+        cache.record(num_pairs - num_missing, num_missing)
+        metrics.count('travel_cache_hits', num_pairs - num_missing)
+        metrics.count('travel_cache_misses', num_missing)
+
+    logger.debug("Building distance matrix for %d locations (%d unique, %d pairs wanted, %d cached, %d to fetch)",
+                 N, M, num_pairs, num_pairs - num_missing, num_missing)
+
+    if num_missing:
+        gmaps = get_client(api_key, pool_size=max_workers)
+
+        # Convert to strings for API
+        loc_strings = [f"{lat},{lng}" for (lat, lng) in unique_locations]
+
+        rows_per_chunk, cols_per_chunk = chunk_shape or best_chunk_shape(M, M, max_elements)
+        blocks = plan_requests(unique_locations, missing, max_elements, chunk_shape,
+                               spatial=required is not None)
+
+        budget = _FailureBudget(max(MIN_FAILURE_BUDGET, 2 * len(blocks)))
+
+        def fetch_block(block):
+            rows, cols = block
+            return _fetch_chunk(
+                gmaps,
+                [loc_strings[i] for i in rows],
+                [loc_strings[j] for j in cols],
+                budget,
+                departure_time=departure_time
+            )
+
+        logger.debug("Fetching %d chunks of up to %dx%d with %d workers",
+                     len(blocks), rows_per_chunk, cols_per_chunk, max_workers)
+        metrics.count('api_requests', len(blocks))
+        metrics.count('api_elements', sum(len(rows) * len(cols) for rows, cols in blocks))
+
+        new_entries = []
+        failed = 0
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(blocks)))) as pool:
+            for (rows, cols), values in zip(blocks, pool.map(fetch_block, blocks)):
+                # Fill the matrices (any cell we did not know yet, wanted or not);
+                # cells that could not be fetched stay unknown
+                fetched = np.array([[value is not None for value in row] for row in values], dtype=bool)
+                values = np.array([[value or (0, 0) for value in row] for row in values], dtype=np.int32)
+                cells = np.ix_(rows, cols)
+                fill = ~known[cells] & fetched
+                failed += int((~known[cells] & ~fetched).sum())
+                duration_matrix[cells] = np.where(fill, values[..., 0], duration_matrix[cells])
+                distance_matrix[cells] = np.where(fill, values[..., 1], distance_matrix[cells])
+                known[cells] |= fetched
+
+                for r, c in zip(*np.nonzero(fill & (values[..., 0] != 999999))):
+                    new_entries.append((unique_locations[rows[r]], unique_locations[cols[c]],
+                                        int(values[r, c, 0]), int(values[r, c, 1])))
+
+        if cache:
+            cache.put_many(new_entries, bucket)
+        if budget.retries or budget.splits:
+            metrics.count('matrix_retries', budget.retries)
+            metrics.count('matrix_splits', budget.splits)
+        if failed:
+            logger.warning("%d travel times could not be fetched", failed)
+            metrics.count('matrix_failed_cells', failed)
+
+    # Expand back to one row/column per input location
+    if M != N:
+        cells = np.ix_(node_to_unique, node_to_unique)
+        duration_matrix = duration_matrix[cells]
+        distance_matrix = distance_matrix[cells]
+        known = known[cells]
+
+    return duration_matrix, distance_matrix, known
+
+
+def google_distance_matrix(locations, api_key, max_elements=100, cache=None,
+                           chunk_shape=None, max_workers=DEFAULT_MAX_WORKERS, departure_time="now"):
+    """
+    Build FULL NxN distance AND duration matrices using Google Maps.
+    Falls back gracefully if traffic data is not available.
+
+    Only pairs missing from the travel time cache are requested, see
+    fetch_travel_times. Pairs that could not be fetched are estimated
+    (estimate_travel_times).
+
+    Args:
+        locations: List of (lat, lng) tuples
+        api_key: Google Maps API key
+        max_elements: Maximum API elements per request (default 100)
+        cache: TravelTimeCache to use (default: process-wide cache, see travel_cache.py)
+        chunk_shape: (origins, destinations) per request (default: best_chunk_shape)
+        max_workers: Maximum number of concurrent API requests
+        departure_time: "now" or a future datetime (see departure_slices)
+
+    Returns:
+        Tuple of (duration_matrix, distance_matrix) as NxN int32 NumPy arrays
+        - duration_matrix: NxN matrix of durations in seconds
+        - distance_matrix: NxN matrix of distances in meters
+    """
+    duration_matrix, distance_matrix, known = fetch_travel_times(
+        locations, api_key, max_elements=max_elements, cache=cache,
+        chunk_shape=chunk_shape, max_workers=max_workers, departure_time=departure_time
+    )
+    if not known.all():
+        estimate_travel_times(locations, duration_matrix, distance_matrix, known)
+
+    # Log sample distances for debugging
+    if len(locations) > 1:
+        logger.debug("Sample duration [0][1]: %d seconds, distance [0][1]: %d meters",
+                     duration_matrix[0, 1], distance_matrix[0, 1])
+
+    return duration_matrix, distance_matrix
+
+
+def departure_slices(day, times=None, timezone=None):
+    """
+    Departure times to fetch time-dependent matrices for
+
+    Google only predicts traffic for departures from now on, so a slice
+    that has already passed is moved on by whole weeks: the prediction is
+    for the same weekday and hour, which is also how travel times are
+    cached (travel_cache.time_bucket).
+
+    Args:
+        day: date the routes are driven
+        times: "HH:MM" strings (default: DEPARTURE_SLICES)
+        timezone: IANA time zone of the service area (default: SERVICE_TIMEZONE)
+
+    Returns:
+        List of (seconds_after_midnight, departure datetime), by time of day
+
+    Raises:
+        ValueError: On a malformed time of day
+    """
+    if times is None:
+        times = DEFAULT_DEPARTURE_SLICES.split(',')
+    zone = ZoneInfo(timezone or SERVICE_TIMEZONE)
+    now = datetime.now(zone)
+
+    slices = []
+    for value in times:
+        seconds = parse_time_of_day(value, 'departure_slices')
+        when = datetime(day.year, day.month, day.day, tzinfo=zone) + timedelta(seconds=seconds)
+        while when < now:
+            when += timedelta(days=7)
+        slices.append((seconds, when))
+    return sorted(slices, key=lambda item: item[0])
+
+
+def neighborhood_mask(locations, num_depots=0, neighbors=DEFAULT_NEIGHBORS):
+    """
+    Pairs worth real travel times: each location's nearest neighbors plus depot links
+
+    Args:
+        locations: List of (lat, lng) tuples, depots first
+        num_depots: Number of depots at the start of locations
+        neighbors: Nearest neighbors (by haversine) per location
+
+    Returns:
+        NxN bool array, symmetric, False on the diagonal
+    """
+    N = len(locations)
+    km = haversine_matrix_km(locations, locations)
+    np.fill_diagonal(km, np.inf)
+    required = np.zeros((N, N), dtype=bool)
+
+    k = min(neighbors, N - 1)
+    if k > 0:
+        nearest = np.argpartition(km, k - 1, axis=1)[:, :k]
+        required[np.repeat(np.arange(N), k), nearest.ravel()] = True
+
+    # Every job to and from its nearest depot
+    if 0 < num_depots < N:
+        jobs = np.arange(num_depots, N)
+        nearest_depot = km[:num_depots, num_depots:].argmin(axis=0)
+        required[nearest_depot, jobs] = True
+
+    required |= required.T
+    np.fill_diagonal(required, False)
+    return required
+
+
+def estimate_travel_times(locations, duration_matrix, distance_matrix, known):
+    """
+    Fill unknown cells with a haversine estimate calibrated on the known ones
+
+    Circuity (road / straight-line distance) and a time factor over the
+    default speed profile are taken as medians of the known cells, then the
+    duration estimate is inflated by ESTIMATE_PENALTY so the solver prefers
+    arcs with real travel times.
+
+    Args:
+        locations: List of (lat, lng) tuples
+        duration_matrix: NxN int32 array, updated in place
+        distance_matrix: NxN int32 array, updated in place
+        known: NxN bool array of cells holding real values
+    """
+    km = haversine_matrix_km(locations, locations)
+    profile = HaversineMatrixProvider()
+
+    sample = known & (km > 0.1) & (duration_matrix < 999999)
+    circuity, time_factor = DEFAULT_CIRCUITY, 1.0
+    if sample.sum() >= 10:
+        circuity = float(np.median(distance_matrix[sample] / (km[sample] * 1000)))
+        time_factor = float(np.median(
+            duration_matrix[sample] / np.maximum(profile.travel_seconds(distance_matrix[sample] / 1000), 1)
+        ))
+
+    unknown = ~known
+    road_km = km[unknown] * circuity
+    duration_matrix[unknown] = np.rint(profile.travel_seconds(road_km) * time_factor * ESTIMATE_PENALTY)
+    distance_matrix[unknown] = np.rint(road_km * 1000)
+
+    logger.debug("Estimated %d cells (circuity %.2f, time factor %.2f)", unknown.sum(), circuity, time_factor)
+    metrics.count('estimated_cells', int(unknown.sum()))
+
+
+class MatrixProvider:
+    """
+    Base class for matrix providers
+
+    Subclasses implement build(locations) and return
+    (duration_matrix, distance_matrix) in seconds / meters as NxN int32
+    NumPy arrays.
+    """
+
+    name = None
+
+    # Travel times depend on the departure time (see build_at)
+    time_dependent = False
+
+    def build(self, locations):
+        raise NotImplementedError
+
+    def build_at(self, locations, departure_time):
+        """
+        Matrices for trips leaving at departure_time
+
+        Providers without traffic data return build(locations).
+
+        Args:
+            locations: List of (lat, lng) tuples
+            departure_time: Future datetime (see departure_slices)
+
+        Returns:
+            Tuple of (duration_matrix, distance_matrix)
+        """
+        return self.build(locations)
+
+    def build_sparse(self, locations, num_depots=0):
+        """
+        Matrices that may contain estimated cells
+
+        Args:
+            locations: List of (lat, lng) tuples, depots first
+            num_depots: Number of depots at the start of locations
+
+        Returns:
+            Tuple of (duration_matrix, distance_matrix, estimated) where
+            estimated is an NxN bool array of cells that are not real travel
+            times. Dense providers estimate nothing.
+        """
+        duration_matrix, distance_matrix = self.build(locations)
+        return duration_matrix, distance_matrix, np.zeros(duration_matrix.shape, dtype=bool)
+
+    def sparse_pairs(self, locations, num_depots=0):
+        """
+        Pairs build_sparse fetches real travel times for
+
+        Returns:
+            NxN bool array, or None for every pair
+        """
+        return None
+
+    def build_pairs(self, locations, required=None, departure_time=None):
+        """
+        Real travel times for the required pairs, without estimating the rest
+
+        Providers that cannot fetch single pairs build the whole matrix.
+
+        Args:
+            locations: List of (lat, lng) tuples, unique
+            required: Optional NxN bool array of the pairs wanted (default: all)
+            departure_time: Optional departure datetime (see build_at)
+
+        Returns:
+            Tuple of (duration_matrix, distance_matrix, known) where known is
+            an NxN bool array of the cells holding real travel times
+        """
+        if departure_time is not None:
+            duration_matrix, distance_matrix = self.build_at(locations, departure_time)
+            return duration_matrix, distance_matrix, np.ones(duration_matrix.shape, dtype=bool)
+        duration_matrix, distance_matrix, estimated = self.build_sparse(locations)
+        return duration_matrix, distance_matrix, ~estimated
+
+    def verify(self, locations, arcs):
+        """
+        Real travel times for estimated arcs
+
+        Args:
+            locations: List of (lat, lng) tuples
+            arcs: List of (i, j) index pairs
+
+        Returns:
+            List of (duration_seconds, distance_meters), one per arc, or
+            None for an arc that could not be fetched
+        """
+        raise NotImplementedError
+
+    def fallback_pairs(self):
+        """
+        Location pairs that should have had real travel times but are estimated
+
+        E.g. Distance Matrix requests that failed after retries. Pairs are
+        ((lat, lng), (lat, lng)) as passed to build / build_sparse.
+        """
+        return set()
+
+
+class GoogleMatrixProvider(MatrixProvider):
+    """
+    Google Maps Distance Matrix API (see google_distance_matrix)
+
+    With neighbors set, build_sparse() only requests each location's nearest
+    neighbors and depot links and estimates the rest, cutting API elements
+    from O(N^2) to about O(N * neighbors). Pairs whose requests failed are
+    estimated as well and reported by fallback_pairs() until a later fetch
+    (e.g. verify) gets them. build_at() fetches the full matrix for a
+    departure time (see departure_slices), cached per weekday and hour.
+
+    Args:
+        api_key: Google Maps API key
+        neighbors: Nearest neighbors per location in sparse mode (0 = full matrix)
+        **options: Extra keyword arguments for google_distance_matrix
+    """
+
+    name = 'google'
+    time_dependent = True
+
+    def __init__(self, api_key, neighbors=DEFAULT_NEIGHBORS, **options):
+        self.api_key = api_key
+        self.neighbors = neighbors
+        self.options = options
+        self._fallback = set()
+        self._lock = threading.Lock()
+
+    def build(self, locations):
+        duration_matrix, distance_matrix, known = self._fetch(locations)
+        if not known.all():
+            estimate_travel_times(locations, duration_matrix, distance_matrix, known)
+        return duration_matrix, distance_matrix
+
+    def build_at(self, locations, departure_time):
+        duration_matrix, distance_matrix, known = self._fetch(locations, departure_time=departure_time)
+        if not known.all():
+            estimate_travel_times(locations, duration_matrix, distance_matrix, known)
+        return duration_matrix, distance_matrix
+
+    def build_sparse(self, locations, num_depots=0):
+        duration_matrix, distance_matrix, known = self._fetch(locations, self.sparse_pairs(locations, num_depots))
+        if not known.all():
+            estimate_travel_times(locations, duration_matrix, distance_matrix, known)
+        return duration_matrix, distance_matrix, ~known
+
+    def sparse_pairs(self, locations, num_depots=0):
+        # Small instances: the neighborhood would cover (almost) everything anyway
+        if self.neighbors and len(locations) > 2 * self.neighbors + num_depots:
+            return neighborhood_mask(locations, num_depots, self.neighbors)
+        return None
+
+    def build_pairs(self, locations, required=None, departure_time=None):
+        return self._fetch(locations, required, departure_time or "now")
+
+    def verify(self, locations, arcs):
+        nodes = sorted({n for arc in arcs for n in arc})
+        local = {node: i for i, node in enumerate(nodes)}
+        required = np.zeros((len(nodes), len(nodes)), dtype=bool)
+        for i, j in arcs:
+            required[local[i], local[j]] = True
+
+        duration_matrix, distance_matrix, known = self._fetch([locations[n] for n in nodes], required)
+        return [(int(duration_matrix[local[i], local[j]]), int(distance_matrix[local[i], local[j]]))
+                if known[local[i], local[j]] else None
+                for i, j in arcs]
+
+    def fallback_pairs(self):
+        with self._lock:
+            return set(self._fallback)
+
+    def _fetch(self, locations, required=None, departure_time="now"):
+        """fetch_travel_times, keeping track of the wanted pairs that could not be fetched"""
+        duration_matrix, distance_matrix, known = fetch_travel_times(
+            locations, self.api_key, required, departure_time=departure_time, **self.options
+        )
+        wanted = ~np.eye(len(locations), dtype=bool) if required is None else required
+        with self._lock:
+            if self._fallback:
+                index = {tuple(loc): i for i, loc in enumerate(locations)}
+                for pair in list(self._fallback):
+                    i, j = index.get(pair[0]), index.get(pair[1])
+                    if i is not None and j is not None and wanted[i, j] and known[i, j]:
+                        self._fallback.discard(pair)
+            for i, j in zip(*np.nonzero(wanted & ~known)):
+                self._fallback.add((tuple(locations[i]), tuple(locations[j])))
+        return duration_matrix, distance_matrix, known
+
+
+# Cumulative speed profile: (up to km, km/h). The first 2 km of a trip are
+# slow city streets, the next 8 km arterials, anything beyond is highway.
+DEFAULT_SPEED_PROFILE = [(2, 20), (10, 40), (None, 75)]
+
+# Road distance is longer than the straight line; 1.3 is typical for US suburbs
+DEFAULT_CIRCUITY = 1.3
+
+
+class HaversineMatrixProvider(MatrixProvider):
+    """
+    Straight-line estimate: haversine distance x circuity, timed with a speed profile
+
+    Deterministic and free, good for drafts, CI and benchmarking.
+
+    Args:
+        speed_profile: List of (up_to_km, kmh) bands, last band's limit is None
+        circuity: Road distance / straight-line distance ratio
+    """
+
+    name = 'haversine'
+
+    def __init__(self, speed_profile=None, circuity=DEFAULT_CIRCUITY):
+        self.speed_profile = speed_profile or DEFAULT_SPEED_PROFILE
+        self.circuity = circuity
+
+    def travel_seconds(self, road_km):
+        """Drive time in seconds for road distance(s) in km using the speed profile"""
+        road_km = np.asarray(road_km, dtype=np.float64)
+        seconds = np.zeros_like(road_km)
+        covered = 0.0
+        for limit, kmh in self.speed_profile:
+            upper = road_km if limit is None else np.minimum(road_km, limit)
+            seconds += np.clip(upper - covered, 0, None) / kmh * 3600
+            if limit is None:
+                break
+            covered = limit
+        return seconds
+
+    def build(self, locations):
+        road_km = haversine_matrix_km(locations, locations) * self.circuity
+        duration_matrix = np.rint(self.travel_seconds(road_km)).astype(np.int32)
+        distance_matrix = np.rint(road_km * 1000).astype(np.int32)
+        return duration_matrix, distance_matrix
+
+
+class RoadGraphMatrixProvider(MatrixProvider):
+    """
+    All-pairs shortest travel times over a local road graph (see road_graph.py)
+
+    Each location is snapped to its nearest graph node; the snap distance is
+    added at ACCESS_SPEED_KMH. Pairs in disconnected parts of the graph have
+    no route; they are estimated like failed Google cells
+    (estimate_travel_times), marked as estimated by build_sparse() and
+    reported by fallback_pairs().
+
+    Args:
+        graph_path: Path to a .json road graph or .osm extract
+    """
+
+    name = 'road_graph'
+
+    def __init__(self, graph_path):
+        self.graph = load_road_graph(graph_path)
+        self._fallback = set()
+        self._lock = threading.Lock()
+
+    def build(self, locations):
+        duration_matrix, distance_matrix, _ = self.build_sparse(locations)
+        return duration_matrix, distance_matrix
+
+    def build_sparse(self, locations, num_depots=0):
+        N = len(locations)
+        duration_matrix = np.zeros((N, N), dtype=np.int32)
+        distance_matrix = np.zeros((N, N), dtype=np.int32)
+        known = np.eye(N, dtype=bool)
+
+        snapped = []
+        for loc in locations:
+            node, snap_km = self.graph.nearest_node(loc)
+            if node is None:
+                raise ValueError(f"Location {loc} is not covered by the road graph")
+            snapped.append((node, snap_km))
+
+        targets = {node for node, _ in snapped}
+        for i, (source, source_km) in enumerate(snapped):
+            paths = self.graph.shortest_paths(source, targets)
+            for j, (target, target_km) in enumerate(snapped):
+                if i == j or target not in paths:
+                    continue
+                seconds, meters = paths[target]
+                access_km = source_km + target_km
+                duration_matrix[i, j] = round(seconds + access_km / ACCESS_SPEED_KMH * 3600)
+                distance_matrix[i, j] = round(meters + access_km * 1000)
+                known[i, j] = True
+
+        if not known.all():
+            unreachable = list(zip(*np.nonzero(~known)))
+            logger.warning("%d of %d location pairs have no route in the road graph; estimating them",
+                           len(unreachable), N * (N - 1))
+            estimate_travel_times(locations, duration_matrix, distance_matrix, known)
+            with self._lock:
+                self._fallback.update((tuple(locations[i]), tuple(locations[j])) for i, j in unreachable)
+        return duration_matrix, distance_matrix, ~known
+
+    def verify(self, locations, arcs):
+        # The graph has no route for an estimated arc; it keeps its estimate
+        return [None] * len(arcs)
+
+    def fallback_pairs(self):
+        with self._lock:
+            return set(self._fallback)
+
+
+class SharedMatrixProvider(MatrixProvider):
+    """
+    Travel times of several plans fetched once over the union of their locations
+
+    Every pair the plans' solves will ask for (a plan's full matrix, or what
+    the provider's build_sparse fetches; per departure time bucket for
+    time-dependent plans) is fetched from the wrapped provider in one pass,
+    so pairs the plans share (depot legs, recurring sites) are requested
+    once, even with the travel time cache disabled and while the plans are
+    solved in parallel. build / build_sparse / build_at return a plan's
+    slice; requests for pairs that were not fetched, verify and
+    fallback_pairs go to the wrapped provider.
+
+    Args:
+        provider: MatrixProvider the travel times come from
+        plans: List of (locations, num_depots, departures) per plan, with
+               locations depots first as solve_vrp builds them and
+               departures the departure datetimes of a time-dependent plan
+               (None: the plan uses build_sparse)
+    """
+
+    def __init__(self, provider, plans):
+        self.provider = provider
+        self.name = provider.name
+        self.time_dependent = provider.time_dependent
+
+        self._index = {}
+        locations = []
+        for plan_locations, _, _ in plans:
+            for loc in plan_locations:
+                if coord_key(loc) not in self._index:
+                    self._index[coord_key(loc)] = len(locations)
+                    locations.append(loc)
+
+        # Pairs wanted per departure time bucket (None: build_sparse)
+        M = len(locations)
+        wanted = {}
+        departures = {None: None}
+        for plan_locations, num_depots, plan_departures in plans:
+            nodes = self._nodes(plan_locations)
+            if plan_departures is not None and self.time_dependent:
+                pairs = None
+                for when in plan_departures:
+                    departures.setdefault(time_bucket(when), when)
+                buckets = [time_bucket(when) for when in plan_departures]
+            else:
+                pairs = provider.sparse_pairs(plan_locations, num_depots)
+                buckets = [None]
+            for bucket in buckets:
+                cells = wanted.setdefault(bucket, np.zeros((M, M), dtype=bool))
+                cells[np.ix_(nodes, nodes)] |= ~np.eye(len(nodes), dtype=bool) if pairs is None else pairs
+
+        self._matrices = {}
+        for bucket, cells in wanted.items():
+            np.fill_diagonal(cells, False)
+            self._matrices[bucket] = (cells,) + provider.build_pairs(locations, cells, departures[bucket])
+        logger.debug("Shared matrices for %d plans: %d locations, %d pairs in %d bucket(s)",
+                     len(plans), M, sum(int(cells.sum()) for cells in wanted.values()), len(wanted))
+
+    def build(self, locations):
+        sliced = self._slice(None, locations)
+        if sliced is None:
+            return self.provider.build(locations)
+        duration_matrix, distance_matrix, _ = sliced
+        return duration_matrix, distance_matrix
+
+    def build_at(self, locations, departure_time):
+        sliced = self._slice(time_bucket(departure_time), locations)
+        if sliced is None:
+            return self.provider.build_at(locations, departure_time)
+        duration_matrix, distance_matrix, _ = sliced
+        return duration_matrix, distance_matrix
+
+    def build_sparse(self, locations, num_depots=0):
+        sliced = self._slice(None, locations, self.provider.sparse_pairs(locations, num_depots))
+        if sliced is None:
+            return self.provider.build_sparse(locations, num_depots)
+        return sliced
+
+    def sparse_pairs(self, locations, num_depots=0):
+        return self.provider.sparse_pairs(locations, num_depots)
+
+    def verify(self, locations, arcs):
+        return self.provider.verify(locations, arcs)
+
+    def fallback_pairs(self):
+        return self.provider.fallback_pairs()
+
+    def _nodes(self, locations):
+        return np.array([self._index[coord_key(loc)] for loc in locations], dtype=np.intp)
+
+    def _slice(self, bucket, locations, required=None):
+        """
+        (duration_matrix, distance_matrix, estimated) of locations from the
+        matrices fetched for bucket, or None if they lack a required pair
+        (default: every pair)
+        """
+        if bucket not in self._matrices or any(coord_key(loc) not in self._index for loc in locations):
+            return None
+        wanted, duration_matrix, distance_matrix, known = self._matrices[bucket]
+        nodes = self._nodes(locations)
+        cells = np.ix_(nodes, nodes)
+        same = nodes[:, None] == nodes[None, :]
+        required = ~same if required is None else required & ~same
+        if (required & ~wanted[cells]).any():
+            return None
+
+        duration_matrix = duration_matrix[cells]
+        distance_matrix = distance_matrix[cells]
+        known = known[cells] | same
+        if not known.all():
+            estimate_travel_times(locations, duration_matrix, distance_matrix, known)
+        return duration_matrix, distance_matrix, ~known
+
+
+MATRIX_BACKENDS = ('google', 'haversine', 'road_graph')
+
+
+def get_matrix_provider(name='google', api_key=None, **options):
+    """
+    Create a matrix provider by backend name
+
+    Args:
+        name: One of MATRIX_BACKENDS
+        api_key: Google Maps API key (google backend only)
+        **options: Backend-specific options (e.g. graph_path for road_graph)
+
+    Returns:
+        MatrixProvider instance
+    """
+    if name == 'google':
+        if not api_key:
+            raise ValueError("Google Maps API key is required for the google matrix backend")
+        return GoogleMatrixProvider(api_key, **options)
+    if name == 'haversine':
+        return HaversineMatrixProvider(**options)
+    if name == 'road_graph':
+        graph_path = options.get('graph_path') or os.getenv('ROAD_GRAPH_PATH')
+        if not graph_path:
+            raise ValueError("ROAD_GRAPH_PATH is not configured for the road_graph matrix backend")
+        return RoadGraphMatrixProvider(graph_path)
+    raise ValueError(f"Unknown matrix backend '{name}'. Use one of: {', '.join(MATRIX_BACKENDS)}")
@@ -0,0 +1,231 @@
+"""
+Metrics
+Prometheus-style counters, gauges and latency histograms for the
+optimization pipeline, rendered in the text exposition format on /metrics.
+
+Each process (gunicorn worker) keeps its own registry, so scrape every
+worker or aggregate in Prometheus with sum by (...).
+
+A request can also collect its own numbers (stage timings, API elements,
+cache hits, solver statistics) with collect(); they are returned in the
+response metadata when the client asks for them.
+"""
+
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Latency buckets (seconds) from a cached lookup to a large cold solve
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+class _Metric:
+    """Base class: a named metric family with label values"""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _format_labels(self, key, extra=None):
+        pairs = list(zip(self.labelnames, key)) + list(extra or [])
+        if not pairs:
+            return ''
+        escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+        return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key, value):
+        return [f"{self.name}{self._format_labels(key)} {value}"]
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Value that can go up and down (last seen value)"""
+
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, count = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    def _render_value(self, key, value):
+        counts, total, count = value
+        lines = [
+            f"{self.name}_bucket{self._format_labels(key, [('le', str(bound))])} {counts[i]}"
+            for i, bound in enumerate(self.buckets)
+        ]
+        lines.append(f"{self.name}_bucket{self._format_labels(key, [('le', '+Inf')])} {count}")
+        lines.append(f"{self.name}_sum{self._format_labels(key)} {round(total, 6)}")
+        lines.append(f"{self.name}_count{self._format_labels(key)} {count}")
+        return lines
+
+
+class Registry:
+    """Collection of metric families rendered together"""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+
+    def render(self):
+        """Text exposition format (text/plain; version=0.0.4)"""
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = Histogram(
+    'route_optimizer_stage_seconds', 'Wall time of each optimization pipeline stage', ['stage']
+)
+REQUESTS = Counter(
+    'route_optimizer_requests_total', 'API requests by endpoint and outcome', ['endpoint', 'outcome']
+)
+MATRIX_CHUNK_SECONDS = Histogram(
+    'route_optimizer_distance_matrix_chunk_seconds', 'Latency of one Distance Matrix API request'
+)
+MATRIX_REQUESTS = Counter(
+    'route_optimizer_distance_matrix_requests_total', 'Distance Matrix API requests', ['status']
+)
+MATRIX_ELEMENTS = Counter(
+    'route_optimizer_distance_matrix_elements_total', 'Distance Matrix API elements (billing units)'
+)
+GEOCODE_REQUESTS = Counter(
+    'route_optimizer_geocode_requests_total', 'Geocoding API requests', ['status']
+)
+CACHE_LOOKUPS = Counter(
+    'route_optimizer_cache_lookups_total', 'Cache lookups by cache and result', ['cache', 'result']
+)
+SOLVER_SOLUTIONS = Histogram(
+    'route_optimizer_solver_solutions', 'Improving solutions found per solve',
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+)
+SOLVER_BRANCHES = Histogram(
+    'route_optimizer_solver_branches', 'Search branches (iterations) per solve',
+    buckets=(1e2, 1e3, 1e4, 1e5, 1e6, 1e7, 1e8)
+)
+SOLVER_OBJECTIVE = Gauge(
+    'route_optimizer_solver_last_objective', 'Objective of the most recent solve'
+)
+
+
+_current = contextvars.ContextVar('route_optimizer_request_metrics', default=None)
+
+
+@contextmanager
+def collect():
+    """
+    Collect the metrics recorded by this request (thread / context)
+
+    Yields:
+        Dict that fills in as the pipeline runs:
+        {'stage_seconds': {...}, 'counters': {...}, 'solver': {...}}
+    """
+    stats = {'stage_seconds': {}, 'counters': {}, 'solver': {}}
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def stage(name):
+    """Time a pipeline stage into STAGE_SECONDS and the current request's stats"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+def record_stage(name, seconds):
+    """Record an already measured stage duration"""
+    STAGE_SECONDS.observe(seconds, stage=name)
+    stats = _current.get()
+    if stats is not None:
+        stats['stage_seconds'][name] = round(stats['stage_seconds'].get(name, 0.0) + seconds, 4)
+
+
+def count(name, amount=1):
+    """Add to a per-request counter (e.g. api_elements, cache_hits)"""
+    stats = _current.get()
+    if stats is not None:
+        stats['counters'][name] = stats['counters'].get(name, 0) + amount
+
+
+def record_solver(objective, solutions, branches, wall_seconds):
+    """Record statistics of one finished solve"""
+    SOLVER_OBJECTIVE.set(objective)
+    SOLVER_SOLUTIONS.observe(solutions)
+    SOLVER_BRANCHES.observe(branches)
+    stats = _current.get()
+    if stats is not None:
+        solver = stats['solver']
+        solver['objective'] = objective
+        solver['solutions'] = solver.get('solutions', 0) + solutions
+        solver['branches'] = solver.get('branches', 0) + branches
+        solver['wall_seconds'] = round(solver.get('wall_seconds', 0.0) + wall_seconds, 4)
+
+
+def render():
+    """All metrics in the Prometheus text format"""
+    return REGISTRY.render()
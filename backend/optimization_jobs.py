@@ -0,0 +1,357 @@
+"""
+Asynchronous Optimization Jobs
+Runs route optimizations in a background worker pool so the HTTP request
+returns a job id immediately. Job state lives in a SQLite file, so any
+gunicorn worker can answer status polls and event streams for a job that
+another worker is running.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+DEFAULT_JOBS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'optimization_jobs.sqlite3')
+DEFAULT_MAX_JOBS = 500
+DEFAULT_TTL_SECONDS = 3600
+DEFAULT_WORKERS = 2
+
+# Keep only the most recent progress events per job
+MAX_EVENTS_PER_JOB = 200
+
+# Solver objective updates are throttled to this interval
+OBJECTIVE_INTERVAL_SECONDS = 0.5
+
+# Event streams one process serves at once; each holds a request thread
+DEFAULT_MAX_STREAMS = 2
+# A stream ends after this long and the client reconnects with Last-Event-ID
+DEFAULT_STREAM_SECONDS = 30
+# Reconnect delay sent to EventSource clients
+RECONNECT_MILLISECONDS = 1000
+
+TERMINAL_STATUSES = ('succeeded', 'failed')
+
+
+class JobStore:
+    """
+    Bounded, expiring store of optimization job state
+
+    Args:
+        path: SQLite file shared by all worker processes
+        max_jobs: Oldest jobs beyond this count are dropped
+        ttl_seconds: Jobs older than this are dropped
+    """
+
+    def __init__(self, path=DEFAULT_JOBS_PATH, max_jobs=DEFAULT_MAX_JOBS, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.path = path
+        self.max_jobs = max_jobs
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS optimization_jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    stage TEXT,
+                    events TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            self._conn.commit()
+
+    def create(self):
+        """
+        Register a new queued job
+
+        Returns:
+            The new job id
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO optimization_jobs VALUES (?, 'queued', NULL, '[]', NULL, NULL, ?, ?)",
+                (job_id, now, now)
+            )
+            self._prune(now)
+            self._conn.commit()
+        return job_id
+
+    def update(self, job_id, status=None, stage=None, event=None, result=None, error=None):
+        """
+        Update a job's state and optionally append a progress event
+
+        Args:
+            job_id: Job id from create()
+            status: New status (queued/running/succeeded/failed)
+            stage: Current pipeline stage (geocode/matrix/solve)
+            event: Dict appended to the job's event list
+            result: JSON-serializable result (on success)
+            error: Error message (on failure)
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, stage, events FROM optimization_jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                return  # Expired while running
+
+            events = json.loads(row[2])
+            if event is not None:
+                seq = events[-1]['seq'] + 1 if events else 0
+                events.append({'seq': seq, 'time': time.time(), **event})
+                events = events[-MAX_EVENTS_PER_JOB:]
+
+            self._conn.execute(
+                """
+                UPDATE optimization_jobs
+                SET status = ?, stage = ?, events = ?, result = COALESCE(?, result),
+                    error = COALESCE(?, error), updated_at = ?
+                WHERE id = ?
+                """,
+                (
+                    status or row[0],
+                    stage or row[1],
+                    json.dumps(events),
+                    json.dumps(result) if result is not None else None,
+                    error,
+                    time.time(),
+                    job_id
+                )
+            )
+            self._conn.commit()
+
+    def get(self, job_id):
+        """
+        Snapshot of a job
+
+        Returns:
+            Dict with id, status, stage, events, result, error and timestamps,
+            or None if the job does not exist (or expired)
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, status, stage, events, result, error, created_at, updated_at "
+                "FROM optimization_jobs WHERE id = ? AND created_at >= ?",
+                (job_id, time.time() - self.ttl_seconds)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            'job_id': row[0],
+            'status': row[1],
+            'stage': row[2],
+            'events': json.loads(row[3]),
+            'result': json.loads(row[4]) if row[4] else None,
+            'error': row[5],
+            'created_at': row[6],
+            'updated_at': row[7]
+        }
+
+    def _prune(self, now):
+        """Drop expired jobs and the oldest ones above max_jobs (lock held)"""
+        self._conn.execute(
+            "DELETE FROM optimization_jobs WHERE created_at < ?", (now - self.ttl_seconds,)
+        )
+        self._conn.execute(
+            """
+            DELETE FROM optimization_jobs WHERE id NOT IN (
+                SELECT id FROM optimization_jobs ORDER BY created_at DESC LIMIT ?
+            )
+            """,
+            (self.max_jobs,)
+        )
+
+
+class OptimizationRunner:
+    """
+    Background worker pool that runs optimizations and records their progress
+
+    Args:
+        store: JobStore for job state
+        max_workers: Number of optimizations that may run at once in this process
+        max_streams: Event streams this process serves at once
+        stream_seconds: Longest a single event stream stays open
+    """
+
+    def __init__(self, store, max_workers=DEFAULT_WORKERS, max_streams=DEFAULT_MAX_STREAMS,
+                 stream_seconds=DEFAULT_STREAM_SECONDS):
+        self.store = store
+        self.stream_seconds = stream_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='optimize')
+        self._streams = threading.BoundedSemaphore(max_streams)
+
+    def stream(self, job_id, last_event_id=None):
+        """
+        Event stream of a job (see stream_job_events) holding one of max_streams slots
+
+        Returns:
+            Iterable of SSE strings that frees its slot when the response is
+            closed, or None when every slot is taken
+        """
+        if not self._streams.acquire(blocking=False):
+            return None
+        return _EventStream(
+            stream_job_events(self.store, job_id, timeout=self.stream_seconds, last_event_id=last_event_id),
+            self._streams.release
+        )
+
+    def submit(self, fn, **kwargs):
+        """
+        Queue fn(**kwargs, progress=callback) and return its job id immediately
+
+        fn must return a JSON-serializable result. ValueError is reported as
+        a validation error, like the synchronous endpoint does.
+        """
+        job_id = self.store.create()
+        self._executor.submit(self._run, job_id, fn, kwargs)
+        return job_id
+
+    def _run(self, job_id, fn, kwargs):
+        started = time.time()
+        throttle = {'last': 0.0, 'pending': None}
+
+        def record(stage, details, elapsed):
+            self.store.update(job_id, stage=stage, event={'stage': stage, 'elapsed': elapsed, **details})
+
+        def flush():
+            if throttle['pending']:
+                record(*throttle['pending'])
+                throttle['pending'] = None
+
+        def progress(stage, **details):
+            now = time.time()
+            elapsed = round(now - started, 3)
+            # Objective updates arrive for every improving solution; record
+            # at most one per interval and hold back the newest until later
+            if 'objective' in details:
+                if now - throttle['last'] < OBJECTIVE_INTERVAL_SECONDS:
+                    throttle['pending'] = (stage, details, elapsed)
+                    return
+                throttle['last'] = now
+                throttle['pending'] = None
+            else:
+                flush()
+            record(stage, details, elapsed)
+
+        self.store.update(job_id, status='running', event={'stage': 'started', 'elapsed': 0.0})
+        try:
+            result = fn(progress=progress, **kwargs)
+        except ValueError as e:
+            flush()
+            self.store.update(job_id, status='failed', error=f'Validation error: {str(e)}',
+                              event={'stage': 'failed', 'elapsed': round(time.time() - started, 3)})
+        except Exception as e:
+            flush()
+            self.store.update(job_id, status='failed', error=str(e),
+                              event={'stage': 'failed', 'elapsed': round(time.time() - started, 3)})
+        else:
+            flush()
+            self.store.update(job_id, status='succeeded', result=result,
+                              event={'stage': 'done', 'elapsed': round(time.time() - started, 3)})
+
+
+class _EventStream:
+    """Response body over an event generator that calls release once when closed"""
+
+    def __init__(self, events, release):
+        self._events = events
+        self._release = release
+        self._lock = threading.Lock()
+        self._released = False
+
+    def __iter__(self):
+        return self._events
+
+    def close(self):
+        self._events.close()
+        with self._lock:
+            released, self._released = self._released, True
+        if not released:
+            self._release()
+
+
+def stream_job_events(store, job_id, poll_interval=0.5, timeout=DEFAULT_STREAM_SECONDS, last_event_id=None):
+    """
+    Generate server-sent events for a job until it finishes or timeout passes
+
+    A stream that times out ends with a "reconnect" event; EventSource
+    clients reconnect on their own (after RECONNECT_MILLISECONDS) and send
+    the Last-Event-ID to resume from.
+
+    Args:
+        store: JobStore
+        job_id: Job to follow
+        poll_interval: Seconds between store polls
+        timeout: End the stream after this many seconds
+        last_event_id: Seq of the last event the client has seen
+
+    Yields:
+        SSE-formatted strings ("event: ...\\ndata: ...\\n\\n")
+    """
+    next_seq = 0 if last_event_id is None else last_event_id + 1
+    deadline = time.time() + timeout
+    yield f"retry: {RECONNECT_MILLISECONDS}\n\n"
+
+    while time.time() < deadline:
+        job = store.get(job_id)
+        if job is None:
+            yield f"event: error\ndata: {json.dumps({'error': 'Job not found'})}\n\n"
+            return
+
+        for event in job['events']:
+            if event['seq'] >= next_seq:
+                yield f"id: {event['seq']}\nevent: progress\ndata: {json.dumps(event)}\n\n"
+                next_seq = event['seq'] + 1
+
+        if job['status'] in TERMINAL_STATUSES:
+            payload = {'status': job['status'], 'result': job['result'], 'error': job['error']}
+            yield f"event: {job['status']}\ndata: {json.dumps(payload)}\n\n"
+            return
+
+        # Comment line keeps proxies from closing an idle connection
+        yield ": keep-alive\n\n"
+        time.sleep(poll_interval)
+
+    yield f"event: reconnect\ndata: {json.dumps({'last_event_id': next_seq - 1 if next_seq else None})}\n\n"
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_runner():
+    """
+    Process-wide runner configured from environment variables
+
+    OPTIMIZE_JOBS_PATH, OPTIMIZE_JOBS_MAX, OPTIMIZE_JOBS_TTL_SECONDS,
+    OPTIMIZE_WORKERS, OPTIMIZE_STREAMS_MAX and OPTIMIZE_STREAM_SECONDS.
+    """
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            store = JobStore(
+                path=os.getenv('OPTIMIZE_JOBS_PATH', DEFAULT_JOBS_PATH),
+                max_jobs=int(os.getenv('OPTIMIZE_JOBS_MAX', DEFAULT_MAX_JOBS)),
+                ttl_seconds=int(os.getenv('OPTIMIZE_JOBS_TTL_SECONDS', DEFAULT_TTL_SECONDS))
+            )
+            _runner = OptimizationRunner(
+                store,
+                max_workers=int(os.getenv('OPTIMIZE_WORKERS', DEFAULT_WORKERS)),
+                max_streams=int(os.getenv('OPTIMIZE_STREAMS_MAX', DEFAULT_MAX_STREAMS)),
+                stream_seconds=float(os.getenv('OPTIMIZE_STREAM_SECONDS', DEFAULT_STREAM_SECONDS))
+            )
+        return _runner
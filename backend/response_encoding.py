@@ -0,0 +1,176 @@
+"""
+Response Encoding
+Smaller optimize responses for clients on slow links (the worker mobile app):
+an opt-in compact route format, a fast JSON serializer and gzip / brotli
+compression negotiated from Accept-Encoding. The default response schema is
+unchanged; compression and the serializer are transparent to clients.
+
+Compact format ("response_format": "compact"):
+    locations            [[lat, lng], ...] every distinct depot / job location once
+    routes.<id>.depot_index
+                         index of the route's depot in locations
+    routes.<id>.jobs[]   location_index into locations instead of location
+    routes.<id>.path_polyline
+                         optimized_path as a Google encoded polyline
+                         (precision 5, ~1 m), instead of optimized_path
+"""
+
+import gzip
+import logging
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # Optional: falls back to the standard json module
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # Optional: gzip only
+    brotli = None
+
+
+RESPONSE_FORMATS = ('full', 'compact')
+
+# Bodies smaller than this are sent as is; compression would not pay off
+COMPRESS_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+logger = logging.getLogger(__name__)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that serializes with orjson when it is installed"""
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default,
+                            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY).decode()
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=self.default,
+                            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def encode_polyline(points, precision=5):
+    """
+    Google encoded polyline of a list of (lat, lng)
+
+    Args:
+        points: Sequence of (lat, lng)
+        precision: Decimal places kept (5 is the Google Maps default)
+
+    Returns:
+        Polyline string
+    """
+    factor = 10 ** precision
+    chunks = []
+    prev_lat = prev_lng = 0
+    for lat, lng in points:
+        lat, lng = int(round(lat * factor)), int(round(lng * factor))
+        for delta in (lat - prev_lat, lng - prev_lng):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            chunks.append(chr(value + 63))
+        prev_lat, prev_lng = lat, lng
+    return ''.join(chunks)
+
+
+def compact_routes(routes):
+    """
+    Compact form of optimize_routes' routes (see module docstring)
+
+    Args:
+        routes: {worker_id: route} as returned by optimize_routes
+
+    Returns:
+        Tuple of (locations, compact_routes)
+    """
+    locations = []
+    index = {}
+
+    def location_index(location):
+        key = tuple(location)
+        if key not in index:
+            index[key] = len(locations)
+            locations.append(list(key))
+        return index[key]
+
+    compact = {}
+    for worker_id, route in routes.items():
+        compact_route = {key: value for key, value in route.items() if key not in ('jobs', 'optimized_path')}
+        compact_route['jobs'] = [
+            {**{key: value for key, value in job.items() if key != 'location'},
+             'location_index': location_index(job['location'])}
+            for job in route['jobs']
+        ]
+        if route['optimized_path']:
+            compact_route['depot_index'] = location_index(route['optimized_path'][0])
+        compact_route['path_polyline'] = encode_polyline(route['optimized_path'])
+        compact[worker_id] = compact_route
+    return locations, compact
+
+
+def apply_response_format(body, response_format):
+    """
+    Rewrite the routes of an optimize response body in place for response_format
+
+    Handles a single plan ('routes') and a batch plan ('days').
+    """
+    if response_format != 'compact':
+        return body
+    if 'routes' in body:
+        body['locations'], body['routes'] = compact_routes(body['routes'])
+    for day in body.get('days', {}).values():
+        day['locations'], day['routes'] = compact_routes(day['routes'])
+    body['response_format'] = 'compact'
+    return body
+
+
+def compress_response(response, accept_encodings):
+    """
+    Compress a response body with the best encoding the client accepts
+
+    Brotli is preferred when the brotli package is installed, then gzip.
+    Streamed responses (server-sent events), small bodies and bodies that
+    are already encoded are left alone.
+
+    Args:
+        response: Flask response
+        accept_encodings: request.accept_encodings
+
+    Returns:
+        The response
+    """
+    if (response.direct_passthrough or response.is_streamed or response.status_code < 200
+            or response.status_code in (204, 304) or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+
+    if brotli is not None and accept_encodings['br']:
+        encoding = 'br'
+    elif accept_encodings['gzip']:
+        encoding = 'gzip'
+    else:
+        return response
+
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return response
+    if encoding == 'br':
+        compressed = brotli.compress(body, quality=BROTLI_QUALITY)
+    else:
+        compressed = gzip.compress(body, compresslevel=GZIP_LEVEL)
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    logger.debug("Compressed %s response %d -> %d bytes", encoding, len(body), len(compressed))
+    return response
@@ -0,0 +1,343 @@
+"""
+Optimization Result Cache
+Content-addressed cache of /api/optimize-routes responses, so pressing
+"optimize" again on an unchanged plan (or a client retry) returns the
+previous plan instead of geocoding, building the matrix and solving again.
+
+The key is a hash of the normalized jobs / workers payload and the solver
+settings. Results live in Redis when REDIS_URL is set (shared by every
+gunicorn worker and host) or else in a SQLite file shared by the workers of
+one host. Identical requests that arrive while a plan is being computed
+wait for it (single flight): within a process on the running computation,
+across processes on a lock entry in the store.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+
+try:
+    import redis
+except ImportError:  # Optional: SQLite store only
+    redis = None
+
+import metrics
+from geocoder import normalize_address
+from travel_cache import COORD_PRECISION, time_bucket
+
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'optimize_results.sqlite3')
+DEFAULT_TTL_SECONDS = 15 * 60
+# Longest a computation may hold the lock before waiters compute themselves
+DEFAULT_LOCK_SECONDS = 180
+# How often waiters in other processes check for the result
+POLL_SECONDS = 0.2
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize_value(value):
+    if isinstance(value, float):
+        return round(value, COORD_PRECISION)
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, dict):
+        return {key: _normalize_value(item) for key, item in value.items() if item is not None}
+    if isinstance(value, list):
+        return [_normalize_value(item) for item in value]
+    return value
+
+
+def _normalize_item(item, address_field):
+    """Job / worker dict without empty fields, coordinates rounded, address normalized"""
+    item = _normalize_value(item)
+    if item.get(address_field):
+        item[address_field] = normalize_address(item[address_field])
+    return item
+
+
+def request_key(jobs, workers, settings):
+    """
+    Content hash of an optimization request
+
+    Jobs and workers are compared after normalization (empty fields
+    dropped, coordinates rounded to ~1 m, addresses normalized as for
+    geocoding), in any order. Google travel times depend on the traffic, so
+    with the google backend the key also includes the hour bucket.
+
+    Args:
+        jobs: Job dicts
+        workers: Worker dicts
+        settings: Dict of everything else that changes the result
+                  (matrix_backend, quality, time limit, response format, ...)
+
+    Returns:
+        Hex digest
+    """
+    payload = {
+        'jobs': sorted((_normalize_item(job, 'address') for job in jobs), key=lambda job: str(job.get('id'))),
+        'workers': sorted((_normalize_item(worker, 'depot_address') for worker in workers),
+                          key=lambda worker: str(worker.get('id'))),
+        'settings': settings
+    }
+    if settings.get('matrix_backend') == 'google':
+        payload['traffic_bucket'] = time_bucket()
+    canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class SQLiteResultStore:
+    """Results and single-flight locks in a SQLite file shared by the workers of one host"""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS locks (
+                    key TEXT PRIMARY KEY,
+                    token TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM results WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value, ttl_seconds):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?)",
+                               (key, json.dumps(value), now + ttl_seconds))
+            self._conn.execute("DELETE FROM results WHERE expires_at <= ?", (now,))
+            self._conn.commit()
+
+    def acquire(self, key, token, ttl_seconds):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("DELETE FROM locks WHERE key = ? AND expires_at <= ?", (key, now))
+            cursor = self._conn.execute("INSERT OR IGNORE INTO locks VALUES (?, ?, ?)",
+                                        (key, token, now + ttl_seconds))
+            self._conn.commit()
+        return cursor.rowcount == 1
+
+    def release(self, key, token):
+        with self._lock:
+            self._conn.execute("DELETE FROM locks WHERE key = ? AND token = ?", (key, token))
+            self._conn.commit()
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM results WHERE expires_at > ?",
+                                      (time.time(),)).fetchone()[0]
+
+
+class RedisResultStore:
+    """
+    Results and single-flight locks in Redis, shared by every worker and host
+
+    A sorted set of result keys scored by expiry time keeps count() cheap:
+    expired members are trimmed and the rest counted, without scanning the
+    keyspace.
+    """
+
+    # Delete the lock only if this computation still holds it
+    _RELEASE = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+
+    def __init__(self, url, prefix='optimize:'):
+        self.prefix = prefix
+        self._redis = redis.Redis.from_url(url)
+        self._release = self._redis.register_script(self._RELEASE)
+        self._index = f"{prefix}entries"
+
+    def get(self, key):
+        value = self._redis.get(self.prefix + key)
+        return json.loads(value) if value else None
+
+    def set(self, key, value, ttl_seconds):
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.set(self.prefix + key, json.dumps(value), ex=int(ttl_seconds))
+        pipe.zadd(self._index, {key: time.time() + int(ttl_seconds)})
+        pipe.execute()
+
+    def acquire(self, key, token, ttl_seconds):
+        return bool(self._redis.set(f"{self.prefix}{key}:lock", token, nx=True, ex=int(ttl_seconds)))
+
+    def release(self, key, token):
+        self._release(keys=[f"{self.prefix}{key}:lock"], args=[token])
+
+    def count(self):
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.zremrangebyscore(self._index, '-inf', time.time())
+        pipe.zcard(self._index)
+        return pipe.execute()[1]
+
+
+class ResultCache:
+    """
+    Result cache with single-flight computation
+
+    Only successful results are stored; if a computation fails, the requests
+    waiting on it in the same process get the same error and those in other
+    processes compute the result themselves.
+    """
+
+    def __init__(self, store, ttl_seconds=DEFAULT_TTL_SECONDS, lock_seconds=DEFAULT_LOCK_SECONDS):
+        self.store = store
+        self.ttl_seconds = ttl_seconds
+        self.lock_seconds = lock_seconds
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+        self._lock = threading.Lock()
+        self._inflight = {}
+
+    def get_or_compute(self, key, compute):
+        """
+        Cached result for key, computing it with compute() at most once at a time
+
+        Args:
+            key: Key from request_key()
+            compute: Callable returning a JSON-serializable result
+
+        Returns:
+            Tuple of (result, source); source is 'cache' (stored result),
+            'shared' (another request's computation) or 'computed'
+        """
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = Future()
+
+        if not leader:
+            result, _ = flight.result()
+            self._record('shared')
+            return result, 'shared'
+
+        try:
+            result, source = self._get_or_compute_shared(key, compute)
+            flight.set_result((result, source))
+        except BaseException as e:
+            flight.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+        self._record(source)
+        return result, source
+
+    def _get_or_compute_shared(self, key, compute):
+        """Store lookup, then compute under the store's lock or wait for its holder"""
+        cached = self.store.get(key)
+        if cached is not None:
+            return cached, 'cache'
+
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.lock_seconds
+        while True:
+            if self.store.acquire(key, token, self.lock_seconds):
+                try:
+                    cached = self.store.get(key)
+                    if cached is not None:
+                        return cached, 'cache'
+                    result = compute()
+                    self.store.set(key, result, self.ttl_seconds)
+                    return result, 'computed'
+                finally:
+                    self.store.release(key, token)
+
+            time.sleep(POLL_SECONDS)
+            cached = self.store.get(key)
+            if cached is not None:
+                return cached, 'shared'
+            if time.monotonic() > deadline:
+                logger.warning("Timed out waiting for an identical optimization; computing it again")
+                return compute(), 'computed'
+
+    def _record(self, source):
+        with self._lock:
+            if source == 'computed':
+                self.misses += 1
+            elif source == 'shared':
+                self.shared += 1
+            else:
+                self.hits += 1
+        result = {'computed': 'miss', 'shared': 'shared', 'cache': 'hit'}[source]
+        metrics.CACHE_LOOKUPS.inc(cache='optimize_results', result=result)
+
+    def stats(self):
+        """Hit/miss counters and number of stored results"""
+        with self._lock:
+            hits, misses, shared = self.hits, self.misses, self.shared
+        total = hits + misses + shared
+        return {
+            'hits': hits,
+            'misses': misses,
+            'shared': shared,
+            'hit_rate': round((hits + shared) / total, 4) if total else None,
+            'entries': self.store.count(),
+            'ttl_seconds': self.ttl_seconds,
+            'backend': 'redis' if isinstance(self.store, RedisResultStore) else 'sqlite'
+        }
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_result_cache():
+    """
+    Process-wide result cache configured from environment variables
+
+    RESULT_CACHE_ENABLED (default "true"), RESULT_CACHE_TTL_SECONDS,
+    REDIS_URL (Redis store; needs the redis package) and
+    RESULT_CACHE_PATH (SQLite store otherwise).
+
+    Returns:
+        ResultCache instance, or None when caching is disabled
+    """
+    global _default_cache
+
+    if os.getenv('RESULT_CACHE_ENABLED', 'true').lower() in ('0', 'false', 'no'):
+        return None
+
+    with _default_cache_lock:
+        if _default_cache is None:
+            if os.getenv('REDIS_URL') and redis is not None:
+                store = RedisResultStore(os.getenv('REDIS_URL'))
+            else:
+                if os.getenv('REDIS_URL'):
+                    logger.warning("REDIS_URL is set but the redis package is not installed; "
+                                   "using the SQLite result cache")
+                store = SQLiteResultStore(os.getenv('RESULT_CACHE_PATH', DEFAULT_CACHE_PATH))
+            _default_cache = ResultCache(
+                store,
+                ttl_seconds=int(os.getenv('RESULT_CACHE_TTL_SECONDS', DEFAULT_TTL_SECONDS))
+            )
+        return _default_cache
@@ -0,0 +1,246 @@
+"""
+Local Road Graph
+Loads a road network derived from OpenStreetMap and answers travel time
+queries with Dijkstra, so routes can be optimized without calling Google.
+
+Graph files are JSON:
+    {
+        "nodes": {"<node_id>": [lat, lng], ...},
+        "edges": [["<from_id>", "<to_id>", length_meters, duration_seconds], ...]
+    }
+Edges are directed; two-way roads appear once in each direction.
+
+An OSM XML extract (e.g. exported from openstreetmap.org or cut with
+osmium) can be converted with:
+    python road_graph.py boston.osm boston_graph.json
+"""
+
+import heapq
+import json
+import logging
+import math
+import re
+import sys
+import threading
+import xml.etree.ElementTree as ET
+
+from geo import haversine_km
+
+
+logger = logging.getLogger(__name__)
+
+
+# Free-flow speeds (km/h) per OSM highway type when no maxspeed tag is present
+HIGHWAY_SPEEDS_KMH = {
+    'motorway': 100, 'motorway_link': 60,
+    'trunk': 80, 'trunk_link': 50,
+    'primary': 65, 'primary_link': 45,
+    'secondary': 55, 'secondary_link': 40,
+    'tertiary': 45, 'tertiary_link': 35,
+    'unclassified': 40,
+    'residential': 30,
+    'living_street': 10,
+    'service': 20,
+    'road': 30,
+}
+
+# Travel from the exact address to the nearest graph node (driveways, parking)
+ACCESS_SPEED_KMH = 15
+
+# Grid cell size (degrees) for nearest-node lookups
+_GRID_SIZE = 0.01
+
+
+class RoadGraph:
+    """
+    Directed road graph with nearest-node snapping and shortest path queries
+
+    Args:
+        nodes: Dict {node_id: (lat, lng)}
+        edges: Iterable of (from_id, to_id, length_meters, duration_seconds)
+    """
+
+    def __init__(self, nodes, edges):
+        self.node_ids = [str(node_id) for node_id in nodes]
+        index = {node_id: i for i, node_id in enumerate(self.node_ids)}
+        self.coords = [tuple(coord) for coord in nodes.values()]
+
+        # Adjacency: node -> [(neighbor, duration_seconds, length_meters)]
+        self.adjacency = [[] for _ in self.node_ids]
+        for from_id, to_id, length, duration in edges:
+            u, v = index.get(str(from_id)), index.get(str(to_id))
+            if u is None or v is None:
+                continue
+            self.adjacency[u].append((v, float(duration), float(length)))
+
+        # Only nodes with outgoing edges are useful snapping targets
+        self._grid = {}
+        for i, (lat, lng) in enumerate(self.coords):
+            if self.adjacency[i]:
+                cell = (math.floor(lat / _GRID_SIZE), math.floor(lng / _GRID_SIZE))
+                self._grid.setdefault(cell, []).append(i)
+
+    def nearest_node(self, coord, max_rings=50):
+        """
+        Find the graph node closest to a (lat, lng) point
+
+        Args:
+            coord: (lat, lng) tuple
+            max_rings: How many grid rings to search before giving up
+
+        Returns:
+            Tuple of (node_index, distance_km), or (None, None) if nothing is near
+        """
+        cell_lat = math.floor(coord[0] / _GRID_SIZE)
+        cell_lng = math.floor(coord[1] / _GRID_SIZE)
+        best, best_km, found_ring = None, None, None
+
+        for ring in range(max_rings + 1):
+            for d_lat in range(-ring, ring + 1):
+                for d_lng in range(-ring, ring + 1):
+                    if max(abs(d_lat), abs(d_lng)) != ring:
+                        continue
+                    for i in self._grid.get((cell_lat + d_lat, cell_lng + d_lng), ()):
+                        km = haversine_km(coord, self.coords[i])
+                        if best_km is None or km < best_km:
+                            best, best_km = i, km
+            if best is not None and found_ring is None:
+                found_ring = ring
+            # One extra ring catches a closer node just across a cell edge
+            if found_ring is not None and ring > found_ring:
+                break
+
+        return best, best_km
+
+    def shortest_paths(self, source, targets):
+        """
+        Dijkstra on travel time from one node, stopping once all targets are settled
+
+        Args:
+            source: Node index
+            targets: Iterable of node indices
+
+        Returns:
+            Dict {target: (duration_seconds, length_meters)} for reachable targets
+        """
+        remaining = set(targets)
+        best = {source: 0.0}
+        lengths = {source: 0.0}
+        settled = {}
+        heap = [(0.0, source)]
+
+        while heap and remaining:
+            duration, u = heapq.heappop(heap)
+            if u in settled:
+                continue
+            settled[u] = (duration, lengths[u])
+            remaining.discard(u)
+            for v, edge_duration, edge_length in self.adjacency[u]:
+                candidate = duration + edge_duration
+                if v not in settled and candidate < best.get(v, math.inf):
+                    best[v] = candidate
+                    lengths[v] = lengths[u] + edge_length
+                    heapq.heappush(heap, (candidate, v))
+
+        return {t: settled[t] for t in targets if t in settled}
+
+
+def _parse_maxspeed(value):
+    """Parse an OSM maxspeed tag ("50", "30 mph") into km/h, or None"""
+    if not value:
+        return None
+    match = re.match(r'\s*(\d+(?:\.\d+)?)\s*(mph)?', value)
+    if not match:
+        return None
+    speed = float(match.group(1))
+    return speed * 1.609 if match.group(2) else speed
+
+
+def parse_osm_xml(path):
+    """
+    Build graph nodes/edges from an OSM XML file
+
+    Only ways tagged with a drivable highway type are kept. Edge durations use
+    the maxspeed tag when present, otherwise HIGHWAY_SPEEDS_KMH.
+
+    Args:
+        path: Path to a .osm file
+
+    Returns:
+        Tuple of (nodes, edges) in the RoadGraph constructor format
+    """
+    all_nodes = {}
+    ways = []
+
+    for _, elem in ET.iterparse(path, events=('end',)):
+        if elem.tag == 'node':
+            all_nodes[elem.get('id')] = (float(elem.get('lat')), float(elem.get('lon')))
+            elem.clear()
+        elif elem.tag == 'way':
+            tags = {t.get('k'): t.get('v') for t in elem.findall('tag')}
+            highway = tags.get('highway')
+            if highway in HIGHWAY_SPEEDS_KMH and tags.get('access') not in ('no', 'private'):
+                refs = [nd.get('ref') for nd in elem.findall('nd')]
+                speed = _parse_maxspeed(tags.get('maxspeed')) or HIGHWAY_SPEEDS_KMH[highway]
+                oneway = tags.get('oneway')
+                if oneway is None and (highway.startswith('motorway') or tags.get('junction') == 'roundabout'):
+                    oneway = 'yes'
+                ways.append((refs, speed, oneway))
+            elem.clear()
+
+    nodes = {}
+    edges = []
+    for refs, speed, oneway in ways:
+        if oneway == '-1':
+            refs = list(reversed(refs))
+        for a, b in zip(refs, refs[1:]):
+            if a not in all_nodes or b not in all_nodes:
+                continue
+            nodes[a], nodes[b] = all_nodes[a], all_nodes[b]
+            length = haversine_km(all_nodes[a], all_nodes[b]) * 1000
+            duration = length / (speed / 3.6)
+            edges.append((a, b, round(length, 1), round(duration, 1)))
+            if oneway not in ('yes', 'true', '1', '-1'):
+                edges.append((b, a, round(length, 1), round(duration, 1)))
+
+    return nodes, edges
+
+
+_graphs = {}
+_graphs_lock = threading.Lock()
+
+
+def load_road_graph(path):
+    """
+    Load (and memoize) a road graph from a .json graph file or an .osm extract
+
+    Args:
+        path: Path to the graph file
+
+    Returns:
+        RoadGraph
+    """
+    with _graphs_lock:
+        graph = _graphs.get(path)
+        if graph is None:
+            if path.endswith('.osm'):
+                nodes, edges = parse_osm_xml(path)
+            else:
+                with open(path) as f:
+                    data = json.load(f)
+                nodes, edges = data['nodes'], data['edges']
+            logger.info("Loaded road graph %s: %d nodes, %d edges", path, len(nodes), len(edges))
+            graph = RoadGraph(nodes, edges)
+            _graphs[path] = graph
+        return graph
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print("Usage: python road_graph.py <input.osm> <output.json>")
+        sys.exit(1)
+
+    osm_nodes, osm_edges = parse_osm_xml(sys.argv[1])
+    with open(sys.argv[2], 'w') as out:
+        json.dump({'nodes': osm_nodes, 'edges': osm_edges}, out)
+    print(f"Wrote {len(osm_nodes)} nodes and {len(osm_edges)} edges to {sys.argv[2]}")
@@ -4,15 +4,84 @@ Ported from filesForReference/app.py
 Uses Google Maps API and OR-Tools for Vehicle Routing Problem (VRP) solving
 """
 
-import math
-import googlemaps
-from ortools.constraint_solver import pywrapcp, routing_enums_pb2
+import logging
+import os
+import time
+
+import numpy as np
+
+import metrics
+from constraints import (DAY_SECONDS, JOB_FIELDS, WORKER_FIELDS, add_service_times, build_constraints,
+                         dropped_penalty, format_time_of_day)
+from geo import haversine_matrix_km
+from geocoder import geocode_many
+from matrix_providers import GoogleMatrixProvider, get_matrix_provider, google_distance_matrix
+from solver_pool import DEFAULT_WORKERS as SOLVER_WORKERS, get_solver_pool, solve_in_worker
+
+
+# Weight of the longest route in the objective (balanced workload)
+BALANCE_COEFFICIENT = 100
+
+# Days with at least this many jobs are solved cluster-first (see decomposition.py)
+DECOMPOSE_MIN_JOBS = 300
+
+# Largest model (depots + jobs) whose Duration dimension shares the cached
+# transit matrix with the arc costs. OR-Tools copies the evaluator of a
+# dimension with a span cost, travel times included, for every path its
+# local search filters; above this size those O(N^2) copies cost more than
+# the lookups save (benchmarks/solver_transit.py)
+SHARED_TRANSIT_MAX_NODES = 64
+
+# Warm-started re-optimizations only need to polish the previous plan
+INCREMENTAL_TIME_LIMIT_SECONDS = 1
+
+# Re-solves allowed after estimated arcs of a sparse matrix turn out slower
+MAX_VERIFY_ROUNDS = 3
+
+# Re-costings of a time-dependent plan with the departure slices its arcs fall in
+MAX_TIME_DEPENDENT_ROUNDS = 3
+
+# An exact route template is reused as is while each route's drive time is
+# within this fraction (or TEMPLATE_MIN_SLACK_SECONDS) of the recorded one
+TEMPLATE_TOLERANCE = 0.05
+TEMPLATE_MIN_SLACK_SECONDS = 60
+# Profile of template-seeded solves when the caller asked for none
+TEMPLATE_QUALITY = 'fast'
+
+# Latency vs. quality targets. The time budget grows with the number of jobs
+# (clamped to min/max); the search stops early once it has not improved for
+# plateau_fraction of the budget; 'portfolio' searches run in parallel.
+SOLVER_PROFILES = {
+    'fast': {'seconds_per_job': 0.01, 'min_seconds': 1, 'max_seconds': 5, 'plateau_fraction': 0.1, 'portfolio': 1},
+    'balanced': {'seconds_per_job': 0.03, 'min_seconds': 1, 'max_seconds': 30, 'plateau_fraction': 0.2,
+                 'portfolio': 1},
+    'quality': {'seconds_per_job': 0.1, 'min_seconds': 2, 'max_seconds': 120, 'plateau_fraction': 0.3,
+                'portfolio': 4},
+}
+DEFAULT_QUALITY = os.getenv('SOLVER_QUALITY', 'balanced')
+
+# Shortest plateau worth waiting for, even on tiny instances
+MIN_PLATEAU_SECONDS = 0.2
+
+# (first solution strategy, local search metaheuristic) per portfolio search,
+# the first one being the default single search
+PORTFOLIO_STRATEGIES = [
+    ('PATH_CHEAPEST_ARC', 'GUIDED_LOCAL_SEARCH'),
+    ('PARALLEL_CHEAPEST_INSERTION', 'GUIDED_LOCAL_SEARCH'),
+    ('SAVINGS', 'SIMULATED_ANNEALING'),
+    ('PATH_CHEAPEST_ARC', 'TABU_SEARCH'),
+]
+
+logger = logging.getLogger(__name__)
 
 
 def geocode_addresses(address_list, api_key):
     """
     Convert addresses to GPS coordinates using Google Maps Geocoding API
 
+    Addresses are normalized and deduplicated, repeats are served from the
+    geocode cache and misses are fetched concurrently (see geocoder.py).
+
     Args:
         address_list: List of address strings
         api_key: Google Maps API key
@@ -20,134 +89,95 @@ def geocode_addresses(address_list, api_key):
     Returns:
         List of (lat, lng) tuples
     """
-    gmaps = googlemaps.Client(key=api_key)
-    coords = []
-    for address in address_list:
-        try:
-            result = gmaps.geocode(address)
-            if result:
-                loc = result[0]["geometry"]["location"]
-                coords.append((loc["lat"], loc["lng"]))
-            else:
-                coords.append((None, None))
-        except Exception as e:
-            print(f"Error geocoding {address}: {e}")
-            coords.append((None, None))
-    return coords
+    return geocode_many(address_list, api_key)
 
 
-def google_distance_matrix(locations, api_key, max_elements=100):
+def solver_settings(num_jobs, quality=None, time_limit_seconds=None):
     """
-    Build FULL NxN distance AND duration matrices using Google Maps.
-    Falls back gracefully if traffic data is not available.
+    Time budget, plateau and portfolio size of a solve
 
     Args:
-        locations: List of (lat, lng) tuples
-        api_key: Google Maps API key
-        max_elements: Maximum API elements per request (default 100)
+        num_jobs: Number of jobs in the (sub)problem
+        quality: Latency vs. quality target, a key of SOLVER_PROFILES
+                 (default: SOLVER_QUALITY env, else 'balanced')
+        time_limit_seconds: Fixed time limit instead of the size-based budget
 
     Returns:
-        Tuple of (duration_matrix, distance_matrix)
-        - duration_matrix: NxN matrix of durations in seconds
-        - distance_matrix: NxN matrix of distances in meters
+        Dict with time_limit_seconds, plateau_seconds (stop after this long
+        without improvement) and portfolio (parallel searches, at most one
+        per solver process)
     """
-    gmaps = googlemaps.Client(key=api_key)
-
-    N = len(locations)
-    duration_matrix = [[0] * N for _ in range(N)]
-    distance_matrix = [[0] * N for _ in range(N)]
+    quality = quality or DEFAULT_QUALITY
+    if quality not in SOLVER_PROFILES:
+        raise ValueError(f"Unknown quality '{quality}', expected one of: {', '.join(SOLVER_PROFILES)}")
+    profile = SOLVER_PROFILES[quality]
 
-    # Convert to strings for API
-    loc_strings = [f"{lat},{lng}" for (lat, lng) in locations]
+    if time_limit_seconds is None:
+        time_limit_seconds = min(profile['max_seconds'],
+                                 max(profile['min_seconds'], num_jobs * profile['seconds_per_job']))
+    return {
+        'time_limit_seconds': round(time_limit_seconds, 1),
+        'plateau_seconds': round(max(MIN_PLATEAU_SECONDS, time_limit_seconds * profile['plateau_fraction']), 1),
+        'portfolio': max(1, min(profile['portfolio'], SOLVER_WORKERS))
+    }
 
-    # Determine chunk size to respect API limits
-    chunk = max(1, int(math.floor(max_elements ** 0.5)))  # e.g., sqrt(100) = 10
 
-    print(f"[DEBUG] Building distance matrix for {N} locations...")
-
-    for i_start in range(0, N, chunk):
-        for j_start in range(0, N, chunk):
-            origins = loc_strings[i_start:i_start + chunk]
-            destinations = loc_strings[j_start:j_start + chunk]
-
-            try:
-                # Try with traffic data first
-                response = gmaps.distance_matrix(
-                    origins=origins,
-                    destinations=destinations,
-                    mode="driving",
-                    departure_time="now",
-                    traffic_model="best_guess"
-                )
-
-                # Fill the matrices
-                for i, row in enumerate(response["rows"]):
-                    for j, element in enumerate(row["elements"]):
-                        if element["status"] == "OK":
-                            # Get duration - prefer traffic-aware, fallback to regular
-                            if "duration_in_traffic" in element:
-                                duration_matrix[i_start + i][j_start + j] = element["duration_in_traffic"]["value"]
-                            else:
-                                duration_matrix[i_start + i][j_start + j] = element["duration"]["value"]
-                            
-                            # Get distance in meters
-                            distance_matrix[i_start + i][j_start + j] = element["distance"]["value"]
-                        else:
-                            print(f"[WARN] Route not available: {element['status']}")
-                            duration_matrix[i_start + i][j_start + j] = 999999
-                            distance_matrix[i_start + i][j_start + j] = 999999
-
-            except KeyError as e:
-                print(f"[WARN] Traffic data not available ({e}), trying without traffic...")
-                # Retry without traffic parameters
-                try:
-                    response = gmaps.distance_matrix(
-                        origins=origins,
-                        destinations=destinations,
-                        mode="driving"
-                    )
-                    for i, row in enumerate(response["rows"]):
-                        for j, element in enumerate(row["elements"]):
-                            if element["status"] == "OK":
-                                duration_matrix[i_start + i][j_start + j] = element["duration"]["value"]
-                                distance_matrix[i_start + i][j_start + j] = element["distance"]["value"]
-                            else:
-                                duration_matrix[i_start + i][j_start + j] = 999999
-                                distance_matrix[i_start + i][j_start + j] = 999999
-                except Exception as e2:
-                    print(f"[ERROR] Distance matrix API failed: {e2}")
-                    for i in range(len(origins)):
-                        for j in range(len(destinations)):
-                            duration_matrix[i_start + i][j_start + j] = 999999
-                            distance_matrix[i_start + i][j_start + j] = 999999
-
-            except Exception as e:
-                print(f"[ERROR] Distance matrix chunk error: {e}")
-                for i in range(len(origins)):
-                    for j in range(len(destinations)):
-                        duration_matrix[i_start + i][j_start + j] = 999999
-                        distance_matrix[i_start + i][j_start + j] = 999999
-
-    # Log sample distances for debugging
-    if N > 1:
-        print(f"[DEBUG] Sample duration [0][1]: {duration_matrix[0][1]} seconds ({duration_matrix[0][1]/60:.1f} min)")
-        print(f"[DEBUG] Sample distance [0][1]: {distance_matrix[0][1]} meters ({distance_matrix[0][1]/1000:.1f} km)")
-
-    return duration_matrix, distance_matrix
+def plan_objective(routes, constraints=None):
+    """
+    Objective of a routes_dict: total duration plus the weighted longest
+    route, plus the penalties of dropped jobs when there are constraints
+    """
+    durations = [route['duration_seconds'] for route in routes.values()]
+    if not durations:
+        return 0
+    return sum(durations) + BALANCE_COEFFICIENT * max(durations) + dropped_penalty(constraints, routes)
 
 
-def solve_vrp(depot_coords, job_coords, api_key, time_limit_seconds=5):
+def solve_vrp(depot_coords, job_coords, api_key=None, time_limit_seconds=None, matrix_provider=None,
+              progress=None, initial_routes=None, decompose=None, quality=None, constraints=None,
+              offload_solve=False, template_seconds=None, departure_slices=None):
     """
     Balanced multi-vehicle VRP solver:
-    - Google Maps traffic-aware distances
+    - Google Maps traffic-aware distances (or any other matrix provider)
     - Balanced routes using "minimize the max route distance"
     - Multiple depots (one per driver)
 
     Args:
         depot_coords: List of (lat, lng) tuples for each driver's starting location
         job_coords: List of (lat, lng) tuples for job locations
-        api_key: Google Maps API key
-        time_limit_seconds: Solver time limit (default 5 seconds)
+        api_key: Google Maps API key (used when no matrix_provider is given)
+        time_limit_seconds: Solver time limit (default: scaled with the
+                            number of jobs, see solver_settings)
+        matrix_provider: MatrixProvider for travel times (default: Google)
+        progress: Optional callback progress(stage, **details), see optimize_routes
+        initial_routes: Optional warm start, one list of job indices (into
+                        job_coords) per driver in visiting order. Jobs not
+                        listed are inserted where they are cheapest.
+        decompose: Solve cluster-first (decomposition.py). Default: for cold
+                   solves with at least DECOMPOSE_MIN_JOBS jobs and 2+ drivers
+        quality: Latency vs. quality target, a key of SOLVER_PROFILES
+        constraints: Service times, time windows, capacities and drop
+                     penalties per node (constraints.build_constraints)
+        offload_solve: Run every search in the solver process pool even
+                       without a portfolio, so optimizations running in
+                       several threads search in parallel and the calling
+                       process never holds the GIL for a search
+        template_seconds: Drive seconds per driver of initial_routes when
+                          they were recorded as a route template. If they
+                          list every job, no driver has a shift, time window
+                          or capacity, and each route's drive time is still
+                          within TEMPLATE_TOLERANCE, they are the plan and no
+                          search runs
+        departure_slices: (seconds_after_midnight, datetime) pairs from
+                          matrix_providers.departure_slices. With a
+                          time-dependent provider (google) a full matrix is
+                          built per slice; the first search runs on their
+                          average, then every arc is re-costed with the
+                          slice nearest its departure time and the plan
+                          re-solved from its routes until the slices stop
+                          changing (MAX_TIME_DEPENDENT_ROUNDS). Routes leave
+                          at their shift start, else at the first slice.
+                          Ignored by cluster-first solves
 
     Returns:
         Tuple of (routes_dict, all_locations)
@@ -158,10 +188,274 @@ def solve_vrp(depot_coords, job_coords, api_key, time_limit_seconds=5):
     num_drivers = len(depot_coords)
     num_jobs = len(job_coords)
 
-    print(f"[DEBUG] Solving VRP: {num_drivers} drivers, {num_jobs} jobs")
+    logger.debug("Solving VRP: %d drivers, %d jobs", num_drivers, num_jobs)
 
     # Build distance matrices (duration for optimization, distance for reporting)
-    duration_matrix, distance_matrix = google_distance_matrix(all_locations, api_key)
+    if matrix_provider is None:
+        matrix_provider = GoogleMatrixProvider(api_key)
+
+    if decompose is None:
+        decompose = initial_routes is None and num_jobs >= DECOMPOSE_MIN_JOBS and num_drivers >= 2
+    if decompose:
+        # Imported here: decomposition builds on solve_vrp_matrix from this module
+        from decomposition import solve_vrp_decomposed
+        routes = solve_vrp_decomposed(depot_coords, job_coords, matrix_provider, time_limit_seconds,
+                                      progress=progress, quality=quality, constraints=constraints)
+        return routes, all_locations
+
+    time_dependent = departure_slices is not None and matrix_provider.time_dependent
+    if progress:
+        progress('matrix', locations=len(all_locations), slices=len(departure_slices) if time_dependent else 1)
+    with metrics.stage('matrix'):
+        if time_dependent:
+            slice_matrices = [matrix_provider.build_at(all_locations, when) for _, when in departure_slices]
+            slice_durations = np.stack([duration for duration, _ in slice_matrices])
+            slice_distances = np.stack([distance for _, distance in slice_matrices])
+            duration_matrix = np.rint(slice_durations.mean(axis=0)).astype(np.int32)
+            distance_matrix = np.rint(slice_distances.mean(axis=0)).astype(np.int32)
+            estimated = np.zeros(duration_matrix.shape, dtype=bool)
+        else:
+            duration_matrix, distance_matrix, estimated = matrix_provider.build_sparse(all_locations, num_drivers)
+    duration_matrix = add_service_times(duration_matrix, constraints)
+
+    def polish(routes):
+        """Short warm-started search from the current routes on the current matrices"""
+        current = [routes[f"driver_{v}"]['path'][1:-1] for v in range(num_drivers)]
+        if offload_solve:
+            return solve_vrp_portfolio(duration_matrix, distance_matrix, num_drivers, INCREMENTAL_TIME_LIMIT_SECONDS,
+                                       size=1, initial_routes=current, constraints=constraints)
+        return solve_vrp_matrix(duration_matrix, distance_matrix, num_drivers, INCREMENTAL_TIME_LIMIT_SECONDS,
+                                initial_routes=current, constraints=constraints)
+
+    initial_nodes = None
+    if initial_routes is not None:
+        # Job i is node num_drivers + i
+        initial_nodes = [[num_drivers + i for i in route] for route in initial_routes]
+        listed = {i for route in initial_routes for i in route}
+        unlisted = [num_drivers + i for i in range(num_jobs) if i not in listed]
+        initial_nodes = insert_jobs(initial_nodes, unlisted, duration_matrix)
+
+    routes = None
+    if template_seconds is not None and (constraints is None or (constraints['windows'] is None
+                                                                 and constraints['capacity'] is None)):
+        routes = template_routes(initial_nodes, duration_matrix, distance_matrix, template_seconds, constraints)
+
+    settings = solver_settings(num_jobs, quality, time_limit_seconds)
+    if routes is not None:
+        logger.info("Route template still matches the travel times, reusing it without a search")
+        metrics.count('template_reuses')
+    elif settings['portfolio'] > 1 or offload_solve:
+        routes = solve_vrp_portfolio(duration_matrix, distance_matrix, num_drivers, settings['time_limit_seconds'],
+                                     plateau_seconds=settings['plateau_seconds'], size=settings['portfolio'],
+                                     progress=progress, initial_routes=initial_nodes, constraints=constraints)
+    else:
+        routes = solve_vrp_matrix(duration_matrix, distance_matrix, num_drivers, settings['time_limit_seconds'],
+                                  progress=progress, initial_routes=initial_nodes,
+                                  plateau_seconds=settings['plateau_seconds'], constraints=constraints)
+
+    # Sparse matrices: check every estimated arc the solution uses against
+    # real travel times and re-solve from the current routes when one was
+    # underestimated
+    for verify_round in range(MAX_VERIFY_ROUNDS + 1):
+        arcs = sorted({
+            (i, j)
+            for route in routes.values()
+            for i, j in zip(route['path'], route['path'][1:])
+            if estimated[i, j]
+        })
+        if not arcs:
+            break
+
+        if progress:
+            progress('verify', arcs=len(arcs))
+        underestimated = 0
+        with metrics.stage('verify'):
+            verified = matrix_provider.verify(all_locations, arcs)
+        service = constraints['service'] if constraints is not None else np.zeros(len(all_locations), dtype=int)
+        for (i, j), travel in zip(arcs, verified):
+            # Arcs that still could not be fetched keep their estimate
+            estimated[i, j] = False
+            if travel is None:
+                continue
+            duration, distance = travel
+            underestimated += duration + service[i] > duration_matrix[i, j]
+            duration_matrix[i, j] = duration + service[i]
+            distance_matrix[i, j] = distance
+
+        logger.debug("Verified %d estimated arcs, %d underestimated", len(arcs), underestimated)
+        metrics.count('verified_arcs', len(arcs))
+        update_route_totals(routes, duration_matrix, distance_matrix)
+        if not underestimated or verify_round == MAX_VERIFY_ROUNDS:
+            break
+        routes = polish(routes)
+
+    # Time-dependent travel: cost each node's outgoing arcs with the slice
+    # nearest the time the plan leaves it, then re-solve on those costs
+    if time_dependent and not all(route.get('from_template') for route in routes.values()):
+        slice_seconds = np.array([seconds for seconds, _ in departure_slices])
+        nodes = np.arange(len(all_locations))
+        choice = None
+        for td_round in range(MAX_TIME_DEPENDENT_ROUNDS):
+            new_choice = departure_slice_choice(routes, duration_matrix, slice_seconds, constraints)
+            if choice is not None and np.array_equal(choice, new_choice):
+                break
+            choice = new_choice
+            duration_matrix = add_service_times(slice_durations[choice, nodes], constraints)
+            distance_matrix = slice_distances[choice, nodes]
+            if progress:
+                progress('time_dependent', round=td_round + 1)
+            routes = polish(routes)
+        logger.debug("Time-dependent plan after %d round(s), slices used: %s",
+                     td_round + 1, np.bincount(choice, minlength=len(slice_seconds)).tolist())
+        metrics.count('time_dependent_rounds', td_round + 1)
+
+    return routes, all_locations
+
+
+def departure_slice_choice(routes, duration_matrix, slice_seconds, constraints=None):
+    """
+    Departure slice of every node: the one nearest the time the plan leaves it
+
+    Departures come from the routes' arrival times when the model is timed
+    (shifts / time windows), otherwise routes are taken to leave their
+    depot at the first slice and arrivals follow from duration_matrix.
+
+    Args:
+        routes: routes_dict from solve_vrp_matrix
+        duration_matrix: NxN durations in seconds, service times included
+        slice_seconds: (S,) slice times in seconds after midnight, ascending
+        constraints: Optional per-node constraints (for the service times)
+
+    Returns:
+        (N,) int array of slice indices; nodes no route visits get the first slice
+    """
+    N = len(duration_matrix)
+    service = constraints['service'] if constraints is not None else np.zeros(N, dtype=int)
+    departures = np.full(N, slice_seconds[0], dtype=np.int64)
+    for route in routes.values():
+        path = route['path']
+        arrivals = route.get('arrivals')
+        if arrivals is None:
+            arrivals = np.concatenate(([slice_seconds[0]], slice_seconds[0] + np.cumsum(
+                np.asarray(duration_matrix, dtype=np.int64)[path[:-1], path[1:]])))
+        for node, arrival in zip(path[:-1], arrivals[:-1]):
+            departures[node] = arrival + service[node]
+    return np.abs(departures[:, None] - slice_seconds[None, :]).argmin(axis=1)
+
+
+def template_routes(initial_nodes, duration_matrix, distance_matrix, template_seconds, constraints=None):
+    """
+    Routes of an exact route template, if its drive times have not materially changed
+
+    Args:
+        initial_nodes: One list of job nodes per driver (driver v starts/ends at node v)
+        duration_matrix: NxN int32 array of durations in seconds, service times included
+        distance_matrix: NxN int32 array of distances in meters
+        template_seconds: Recorded drive seconds per driver
+        constraints: Optional per-node constraints (for the service times)
+
+    Returns:
+        routes_dict as from solve_vrp_matrix, each route marked 'from_template',
+        or None if a route's drive time moved by more than TEMPLATE_TOLERANCE
+    """
+    routes = {}
+    for v, (nodes, recorded) in enumerate(zip(initial_nodes, template_seconds)):
+        path = [v, *nodes, v]
+        legs = (path[:-1], path[1:])
+        duration = int(duration_matrix[legs].sum())
+        travel = duration - (int(constraints['service'][path[:-1]].sum()) if constraints is not None else 0)
+        if abs(travel - recorded) > max(TEMPLATE_TOLERANCE * recorded, TEMPLATE_MIN_SLACK_SECONDS):
+            logger.info("Route template drive time changed for driver %d (%d s recorded, %d s now)",
+                        v, recorded, travel)
+            return None
+        routes[f"driver_{v}"] = {
+            "path": path,
+            "duration_seconds": duration,
+            "distance_meters": int(distance_matrix[legs].sum()),
+            "job_count": len(nodes),
+            "from_template": True
+        }
+    return routes
+
+
+def update_route_totals(routes, duration_matrix, distance_matrix):
+    """Recompute each route's duration/distance from the matrices (in place)"""
+    for route in routes.values():
+        legs = (route['path'][:-1], route['path'][1:])
+        route['duration_seconds'] = int(duration_matrix[legs].sum())
+        route['distance_meters'] = int(distance_matrix[legs].sum())
+
+
+def insert_jobs(routes, nodes, duration_matrix):
+    """
+    Cheapest insertion of job nodes into existing routes
+
+    Each node goes where it increases the objective least: its detour plus
+    BALANCE_COEFFICIENT times any growth of the longest route.
+
+    Args:
+        routes: One list of job nodes per driver (driver v starts/ends at node v)
+        nodes: Job nodes to insert, in order
+        duration_matrix: NxN int32 array of durations in seconds
+
+    Returns:
+        New list of routes with every node inserted
+    """
+    routes = [list(route) for route in routes]
+    durations = np.asarray(duration_matrix, dtype=np.int64)
+    totals = [int(durations[[v, *route], [*route, v]].sum()) for v, route in enumerate(routes)]
+
+    for node in nodes:
+        longest = max(totals)
+        best = None
+        for v, route in enumerate(routes):
+            stops = np.array([v, *route, v])
+            # Detour of inserting node between each pair of consecutive stops
+            detours = durations[stops[:-1], node] + durations[node, stops[1:]] - durations[stops[:-1], stops[1:]]
+            pos = int(detours.argmin())
+            detour = int(detours[pos])
+            cost = detour + BALANCE_COEFFICIENT * max(0, totals[v] + detour - longest)
+            if best is None or cost < best[0]:
+                best = (cost, v, pos, detour)
+
+        _, v, pos, detour = best
+        routes[v].insert(pos, node)
+        totals[v] += detour
+
+    return routes
+
+
+def build_routing_model(duration_matrix, num_drivers, model_parameters=None, constraints=None):
+    """
+    Build the OR-Tools routing model for a duration matrix
+
+    Depots are nodes 0..num_drivers-1 (driver v starts and ends at node v),
+    jobs are the remaining nodes. Arc costs always come from a precomputed
+    transit matrix, so the search evaluates them in C++. Up to
+    SHARED_TRANSIT_MAX_NODES nodes the Duration dimension shares it, with a
+    dense C++ cache; larger models give the dimension a callback over a
+    precomputed index-to-node list, which is cheap for OR-Tools to copy.
+
+    With time windows the Duration dimension runs on times of day (seconds
+    after midnight) with slack for waiting, each crew's shift bounds its
+    start and end, and jobs must be reached inside their window. With
+    windows or capacities every job gets a disjunction, so a job no crew
+    can fit in is dropped (at its priority's penalty) instead of making the
+    model infeasible.
+
+    Args:
+        duration_matrix: NxN int32 array of durations in seconds, service
+                         times included (constraints.add_service_times)
+        num_drivers: Number of drivers (depots)
+        model_parameters: Optional RoutingModelParameters (e.g. for profiling)
+        constraints: Optional per-node constraints (constraints.build_constraints)
+
+    Returns:
+        Tuple of (manager, routing)
+    """
+    # Imported here: web workers hand searches to the solver processes and
+    # never load OR-Tools (see gunicorn.conf.py)
+    from ortools.constraint_solver import pywrapcp
 
     # Create routing index manager
     manager = pywrapcp.RoutingIndexManager(
@@ -171,70 +465,208 @@ def solve_vrp(depot_coords, job_coords, api_key, time_limit_seconds=5):
         list(range(num_drivers))   # End nodes (return to depot)
     )
 
-    routing = pywrapcp.RoutingModel(manager)
-
-    # Duration callback (optimize based on travel time)
-    def duration_callback(from_idx, to_idx):
-        f = manager.IndexToNode(from_idx)
-        t = manager.IndexToNode(to_idx)
-        return duration_matrix[f][t]
+    if model_parameters is None:
+        model_parameters = pywrapcp.DefaultRoutingModelParameters()
+    shared_transit = len(duration_matrix) <= SHARED_TRANSIT_MAX_NODES
+    if shared_transit:
+        # Let OR-Tools keep a dense C++ cache of transit values for every node
+        # pair; without it each lookup goes through a generic evaluator
+        model_parameters.max_callback_cache_size = max(
+            model_parameters.max_callback_cache_size, len(duration_matrix) + num_drivers
+        )
+    routing = pywrapcp.RoutingModel(manager, model_parameters)
 
-    transit_idx = routing.RegisterTransitCallback(duration_callback)
+    # Duration transit (optimize based on travel time)
+    durations = np.asarray(duration_matrix).tolist()
+    transit_idx = routing.RegisterTransitMatrix(durations)
     routing.SetArcCostEvaluatorOfAllVehicles(transit_idx)
 
+    if shared_transit:
+        duration_idx = transit_idx
+    else:
+        # The span cost makes OR-Tools copy this evaluator per filtered path;
+        # a closure copies in constant time where a native matrix copies N^2
+        nodes = [manager.IndexToNode(index) for index in range(routing.Size() + num_drivers)]
+
+        def duration_callback(from_index, to_index):
+            return durations[nodes[from_index]][nodes[to_index]]
+
+        duration_idx = routing.RegisterTransitCallback(duration_callback)
+
+    windows = constraints['windows'] if constraints is not None else None
+
     # Add duration dimension
-    routing.AddDimension(
-        transit_idx,
-        0,          # no slack
-        99999999,   # max route duration allowed (very large)
-        True,       # start cumul at zero
-        "Duration"
-    )
+    if windows is None:
+        routing.AddDimension(
+            duration_idx,
+            0,          # no slack
+            99999999,   # max route duration allowed (very large)
+            True,       # start cumul at zero
+            "Duration"
+        )
+    else:
+        routing.AddDimension(
+            duration_idx,
+            DAY_SECONDS,  # waiting for a window to open
+            DAY_SECONDS,  # cumuls are times of day
+            False,        # crews start when their shift allows
+            "Duration"
+        )
 
     duration_dimension = routing.GetDimensionOrDie("Duration")
 
     # KEY: Minimize the MAXIMUM duration across all drivers (balanced workload)
-    distance_dimension_coefficient = 100
-    duration_dimension.SetGlobalSpanCostCoefficient(distance_dimension_coefficient)
-    print(f"[DEBUG] Balance coefficient: {distance_dimension_coefficient}")
+    duration_dimension.SetGlobalSpanCostCoefficient(BALANCE_COEFFICIENT)
+    logger.debug("Balance coefficient: %d", BALANCE_COEFFICIENT)
+
+    if windows is not None:
+        for node in range(num_drivers, len(duration_matrix)):
+            duration_dimension.CumulVar(manager.NodeToIndex(node)).SetRange(int(windows[node, 0]),
+                                                                            int(windows[node, 1]))
+        for v in range(num_drivers):
+            shift_start, shift_end = int(windows[v, 0]), int(windows[v, 1])
+            duration_dimension.CumulVar(routing.Start(v)).SetRange(shift_start, shift_end)
+            duration_dimension.CumulVar(routing.End(v)).SetRange(shift_start, shift_end)
+            # Leave as late and return as early as the plan allows (no idle time at the start)
+            routing.AddVariableMaximizedByFinalizer(duration_dimension.CumulVar(routing.Start(v)))
+            routing.AddVariableMinimizedByFinalizer(duration_dimension.CumulVar(routing.End(v)))
+
+    if constraints is not None and constraints['capacity'] is not None:
+        demand_idx = routing.RegisterUnaryTransitVector(constraints['demand'].tolist())
+        routing.AddDimensionWithVehicleCapacity(
+            demand_idx,
+            0,                                  # no slack
+            constraints['capacity'].tolist(),   # per-crew capacity
+            True,                               # start empty
+            "Capacity"
+        )
+
+    if constraints is not None and (windows is not None or constraints['capacity'] is not None):
+        for node in range(num_drivers, len(duration_matrix)):
+            routing.AddDisjunction([manager.NodeToIndex(node)], int(constraints['penalty'][node]))
+
+    return manager, routing
+
+
+def solve_vrp_matrix(duration_matrix, distance_matrix, num_drivers, time_limit_seconds=5, progress=None,
+                     initial_routes=None, plateau_seconds=None, strategy=None, constraints=None):
+    """
+    Solve the balanced VRP for precomputed matrices
+
+    Args:
+        duration_matrix: NxN int32 array of durations in seconds (depots first)
+        distance_matrix: NxN int32 array of distances in meters
+        num_drivers: Number of drivers (depots)
+        time_limit_seconds: Solver time limit
+        progress: Optional callback, called as progress('solve', objective=...)
+                  each time the solver finds a better solution
+        initial_routes: Optional warm start, one list of job nodes per driver
+                        covering every job; local search starts from it
+                        instead of building a first solution from scratch
+        plateau_seconds: Stop early once the best objective has not improved
+                         for this long (default: run until the time limit)
+        strategy: (first solution strategy, metaheuristic) names, see
+                  PORTFOLIO_STRATEGIES (default: the first one)
+        constraints: Optional per-node constraints (constraints.build_constraints);
+                     jobs that cannot be served are left out of every path
+
+    Returns:
+        routes_dict: {driver_id: route_data}; with time windows route_data
+        also has 'arrivals', the time of day at each node of the path
+    """
+    first_solution, metaheuristic = strategy or PORTFOLIO_STRATEGIES[0]
+
+    with metrics.stage('model_build'):
+        manager, routing = build_routing_model(duration_matrix, num_drivers, constraints=constraints)
+
+    from ortools.constraint_solver import pywrapcp, routing_enums_pb2
 
     # Search parameters
     params = pywrapcp.DefaultRoutingSearchParameters()
-    params.first_solution_strategy = routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC
-    params.local_search_metaheuristic = routing_enums_pb2.LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH
-    params.time_limit.FromSeconds(time_limit_seconds)
+    params.first_solution_strategy = getattr(routing_enums_pb2.FirstSolutionStrategy, first_solution)
+    params.local_search_metaheuristic = getattr(routing_enums_pb2.LocalSearchMetaheuristic, metaheuristic)
+    params.time_limit.FromMilliseconds(int(time_limit_seconds * 1000))
+
+    if progress:
+        progress('solve', time_limit_seconds=time_limit_seconds)
+
+    # Count improving solutions (and report them as progress). OR-Tools'
+    # improvement limit does not apply to guided local search, so the
+    # plateau is detected here: the metaheuristic keeps producing (worse)
+    # solutions, and the search is finished once none has beaten the best
+    # for plateau_seconds.
+    best = {'objective': None, 'solutions': 0, 'improved_at': None, 'plateau': False}
+
+    def on_solution():
+        objective = routing.CostVar().Value()
+        now = time.perf_counter()
+        if best['objective'] is None or objective < best['objective']:
+            best['objective'] = objective
+            best['solutions'] += 1
+            best['improved_at'] = now
+            if progress:
+                progress('solve', objective=objective)
+        elif plateau_seconds and now - best['improved_at'] >= plateau_seconds:
+            best['plateau'] = True
+            routing.solver().FinishCurrentSearch()
+
+    routing.AddAtSolutionCallback(on_solution)
 
     # Solve
-    print(f"[DEBUG] Running solver with {time_limit_seconds}s time limit...")
-    solution = routing.SolveWithParameters(params)
+    logger.debug("Running solver (%s / %s) with %.1fs time limit", first_solution, metaheuristic,
+                 time_limit_seconds)
+    started = time.perf_counter()
+    initial = None
+    if initial_routes is not None:
+        routing.CloseModelWithParameters(params)
+        initial = routing.ReadAssignmentFromRoutes(
+            [[manager.NodeToIndex(node) for node in route] for route in initial_routes], True
+        )
+        if initial is None:
+            logger.warning("Initial routes rejected by the model, solving from scratch")
+
+    if initial is not None:
+        solution = routing.SolveFromAssignmentWithParameters(initial, params)
+    else:
+        solution = routing.SolveWithParameters(params)
+
+    solve_seconds = time.perf_counter() - started
+    metrics.record_stage('solve', solve_seconds)
+    if best['plateau']:
+        logger.debug("No improvement for %.1fs, stopped after %.1fs", plateau_seconds, solve_seconds)
+        metrics.count('plateau_stops')
 
     if solution is None:
         raise Exception("No solution found. Try reducing number of jobs or increasing number of drivers.")
 
-    print("[DEBUG] Solution found! Extracting routes...")
+    metrics.record_solver(solution.ObjectiveValue(), best['solutions'], routing.solver().Branches(), solve_seconds)
+    logger.debug("Solution found (objective %d), extracting routes", solution.ObjectiveValue())
 
     # Extract routes with proper distance and duration
+    started = time.perf_counter()
+    timed = constraints is not None and constraints['windows'] is not None
+    duration_dimension = routing.GetDimensionOrDie("Duration")
     routes = {}
     for v in range(num_drivers):
         idx = routing.Start(v)
         path_nodes = []
-        route_duration = 0
-        route_distance = 0
+        arrivals = []
 
         while not routing.IsEnd(idx):
-            node = manager.IndexToNode(idx)
-            path_nodes.append(node)
-            previous_idx = idx
+            path_nodes.append(manager.IndexToNode(idx))
+            if timed:
+                arrivals.append(solution.Min(duration_dimension.CumulVar(idx)))
             idx = solution.Value(routing.NextVar(idx))
-            
-            # Get actual values from matrices
-            from_node = manager.IndexToNode(previous_idx)
-            to_node = manager.IndexToNode(idx)
-            route_duration += duration_matrix[from_node][to_node]
-            route_distance += distance_matrix[from_node][to_node]
 
         # Add final node
         path_nodes.append(manager.IndexToNode(idx))
+        if timed:
+            arrivals.append(solution.Min(duration_dimension.CumulVar(idx)))
+
+        # Get actual values from matrices (sum over all legs at once)
+        legs = (path_nodes[:-1], path_nodes[1:])
+        route_duration = int(duration_matrix[legs].sum())
+        route_distance = int(distance_matrix[legs].sum())
 
         # Count actual jobs (exclude depot nodes)
         job_count = len([n for n in path_nodes if n >= num_drivers])
@@ -245,15 +677,80 @@ def solve_vrp(depot_coords, job_coords, api_key, time_limit_seconds=5):
             "distance_meters": route_distance,
             "job_count": job_count
         }
+        if timed:
+            routes[f"driver_{v}"]["arrivals"] = arrivals
 
-        print(f"[DEBUG] Driver {v}: {job_count} jobs, {route_distance/1000:.1f} km, {route_duration/60:.0f} min")
+        logger.debug("Driver %d: %d jobs, %.1f km, %.0f min", v, job_count, route_distance / 1000, route_duration / 60)
 
-    return routes, all_locations
+    metrics.record_stage('result_mapping', time.perf_counter() - started)
+    return routes
 
 
-def optimize_routes(jobs, workers, api_key):
+def solve_vrp_portfolio(duration_matrix, distance_matrix, num_drivers, time_limit_seconds, plateau_seconds=None,
+                        size=len(PORTFOLIO_STRATEGIES), progress=None, initial_routes=None, constraints=None):
     """
-    Main function to optimize routes for given jobs and workers
+    Run several search strategies in parallel processes and keep the best plan
+
+    Different first solutions and metaheuristics get stuck in different
+    local optima; with spare cores, racing them costs no extra wall time.
+
+    Args:
+        duration_matrix: NxN int32 array of durations in seconds (depots first)
+        distance_matrix: NxN int32 array of distances in meters
+        num_drivers: Number of drivers (depots)
+        time_limit_seconds: Time limit of each search
+        plateau_seconds: Early stop of each search, see solve_vrp_matrix
+        size: Number of searches (the first entries of PORTFOLIO_STRATEGIES);
+              1 runs just the default search, in a worker process
+        progress: Optional callback progress(stage, **details)
+        initial_routes: Optional warm start shared by all searches
+        constraints: Optional per-node constraints, see solve_vrp_matrix
+
+    Returns:
+        routes_dict of the search with the lowest objective
+    """
+    strategies = PORTFOLIO_STRATEGIES[:size]
+    if progress:
+        progress('solve', time_limit_seconds=time_limit_seconds, strategies=len(strategies))
+
+    pool = get_solver_pool()
+    futures = [
+        pool.submit(solve_in_worker, duration_matrix, distance_matrix, num_drivers, time_limit_seconds,
+                    initial_routes=initial_routes, plateau_seconds=plateau_seconds, strategy=strategy,
+                    constraints=constraints)
+        for strategy in strategies
+    ]
+
+    results = []
+    with metrics.stage('solve'):
+        for strategy, future in zip(strategies, futures):
+            try:
+                routes, solver_stats = future.result()
+            except Exception as e:
+                logger.warning("Portfolio search %s failed: %s", '/'.join(strategy), e)
+                continue
+            results.append((plan_objective(routes, constraints), strategy, routes, solver_stats))
+
+    if not results:
+        raise Exception("No solution found. Try reducing number of jobs or increasing number of drivers.")
+
+    results.sort(key=lambda result: result[0])
+    # Best search last, so it sets the reported objective
+    for _, _, _, solver_stats in reversed(results):
+        metrics.record_solver(**solver_stats)
+
+    objective, strategy, routes, _ = results[0]
+    if len(strategies) > 1:
+        logger.info("Portfolio: %s won with objective %d (%s)", '/'.join(strategy), objective,
+                    ', '.join(f"{'/'.join(r[1])}={r[0]}" for r in results[1:]) or 'no other result')
+    if progress:
+        progress('solve', objective=objective, strategy='/'.join(strategy))
+    return routes
+
+
+def prepare_coordinates(jobs, workers, api_key):
+    """
+    Resolve depot and job coordinates, geocoding every missing one in a single batch
 
     Args:
         jobs: List of job dicts with 'id', 'address', 'latitude', 'longitude'
@@ -261,100 +758,202 @@ def optimize_routes(jobs, workers, api_key):
         api_key: Google Maps API key
 
     Returns:
-        Dict with optimized routes for each worker
+        Tuple of (depot_coords, job_coords, geocoded)
+        - depot_coords: List of (lat, lng), one per worker
+        - job_coords: List of (lat, lng), one per job
+        - geocoded: {'jobs': [...], 'workers': [...]} coordinates that were
+          geocoded here, so callers can store them and skip geocoding next time
     """
-    print(f"\n{'='*60}")
-    print(f"[OPTIMIZE] Starting route optimization")
-    print(f"[OPTIMIZE] Workers: {len(workers)}, Jobs: {len(jobs)}")
-    print(f"{'='*60}")
+    depot_coords = [None] * len(workers)
+    job_coords = [None] * len(jobs)
+    pending = []  # (kind, index, address)
 
     # Prepare depot coordinates (one per worker)
-    depot_coords = []
     for i, worker in enumerate(workers):
         if 'depot_lat' in worker and 'depot_lng' in worker and worker['depot_lat'] and worker['depot_lng']:
-            depot_coords.append((float(worker['depot_lat']), float(worker['depot_lng'])))
-            print(f"[OPTIMIZE] Worker {i} ({worker.get('name', 'Unknown')}): Using provided depot coords")
+            depot_coords[i] = (float(worker['depot_lat']), float(worker['depot_lng']))
+            logger.debug("Worker %d (%s): using provided depot coords", i, worker.get('name', 'Unknown'))
         elif 'depot_address' in worker and worker['depot_address']:
-            # Geocode depot address
-            print(f"[OPTIMIZE] Worker {i} ({worker.get('name', 'Unknown')}): Geocoding depot '{worker['depot_address']}'")
-            coords = geocode_addresses([worker['depot_address']], api_key)
-            if coords[0][0] is None:
-                raise ValueError(f"Could not geocode depot for worker {worker['id']}")
-            depot_coords.append(coords[0])
+            logger.debug("Worker %d (%s): geocoding depot '%s'", i, worker.get('name', 'Unknown'), worker['depot_address'])
+            pending.append(('worker', i, worker['depot_address']))
         else:
             # Default to Boston City Hall
-            default_depot = (42.3601, -71.0589)
-            print(f"[OPTIMIZE] Worker {i} ({worker.get('name', 'Unknown')}): Using default depot (Boston City Hall)")
-            depot_coords.append(default_depot)
+            logger.debug("Worker %d (%s): using default depot (Boston City Hall)", i, worker.get('name', 'Unknown'))
+            depot_coords[i] = (42.3601, -71.0589)
 
     # Prepare job coordinates
-    job_coords = []
     for i, job in enumerate(jobs):
         if 'latitude' in job and 'longitude' in job and job['latitude'] and job['longitude']:
-            job_coords.append((float(job['latitude']), float(job['longitude'])))
+            job_coords[i] = (float(job['latitude']), float(job['longitude']))
         elif 'address' in job and job['address']:
-            # Geocode job address
-            print(f"[OPTIMIZE] Job {i}: Geocoding '{job['address']}'")
-            coords = geocode_addresses([job['address']], api_key)
-            if coords[0][0] is None:
-                raise ValueError(f"Could not geocode job {job['id']}")
-            job_coords.append(coords[0])
+            pending.append(('job', i, job['address']))
         else:
             raise ValueError(f"Job {job['id']} missing location")
 
-    print(f"[OPTIMIZE] All coordinates prepared. Running VRP solver...")
+    geocoded = {'jobs': [], 'workers': []}
+    if pending:
+        coords = geocode_addresses([address for _, _, address in pending], api_key)
+        for (kind, i, _), (lat, lng) in zip(pending, coords):
+            if kind == 'worker':
+                if lat is None:
+                    raise ValueError(f"Could not geocode depot for worker {workers[i]['id']}")
+                depot_coords[i] = (lat, lng)
+                geocoded['workers'].append({'worker_id': workers[i]['id'], 'depot_latitude': lat, 'depot_longitude': lng})
+            else:
+                if lat is None:
+                    raise ValueError(f"Could not geocode job {jobs[i]['id']}")
+                job_coords[i] = (lat, lng)
+                geocoded['jobs'].append({'job_id': jobs[i]['id'], 'latitude': lat, 'longitude': lng})
 
-    # Check for jobs that are far from depot (>200km as the crow flies)
-    def haversine_km(coord1, coord2):
-        """Calculate distance between two lat/lng points in km"""
-        from math import radians, sin, cos, sqrt, atan2
-        lat1, lon1 = radians(coord1[0]), radians(coord1[1])
-        lat2, lon2 = radians(coord2[0]), radians(coord2[1])
-        dlat, dlon = lat2 - lat1, lon2 - lon1
-        a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-        return 6371 * 2 * atan2(sqrt(a), sqrt(1-a))
+    return depot_coords, job_coords, geocoded
+
+
+def optimize_routes(jobs, workers, api_key, matrix_backend='google', progress=None, time_limit_seconds=None,
+                    initial_assignment=None, decompose=None, matrix_options=None, quality=None,
+                    offload_solve=False, templates=None, departure_slices=None, matrix_provider=None):
+    """
+    Main function to optimize routes for given jobs and workers
+
+    Args:
+        jobs: List of job dicts with 'id', 'address', 'latitude', 'longitude'
+              and optionally 'service_minutes', 'time_window_start',
+              'time_window_end', 'priority' and 'demand' (see constraints.py)
+        workers: List of worker dicts with 'id', 'name', 'depot_address' or 'depot_lat'/'depot_lng'
+                 and optionally 'shift_start', 'shift_end' and 'capacity'
+        api_key: Google Maps API key (needed for geocoding and the google backend)
+        matrix_backend: Travel time source, one of matrix_providers.MATRIX_BACKENDS
+        progress: Optional callback progress(stage, **details) reporting the
+                  pipeline stage (geocode/matrix/solve) and the solver's best
+                  objective as it improves
+        time_limit_seconds: Solver time limit (default: scaled with the
+                            number of jobs, see solver_settings)
+        initial_assignment: Optional warm start {worker_id: [job_id, ...]} in
+                            visiting order; unlisted jobs are inserted greedily
+        decompose: Force (True) or disable (False) the cluster-first
+                   large-instance mode; default decides by size, see solve_vrp
+        matrix_options: Extra keyword arguments for the matrix provider
+                        (e.g. cache or neighbors for google)
+        quality: Latency vs. quality target: 'fast', 'balanced' or 'quality'
+                 (see SOLVER_PROFILES)
+        offload_solve: Search in the solver process pool, see solve_vrp
+        templates: Optional RouteTemplateStore (route_templates.py). Without
+                   initial_assignment, a past plan covering most of the jobs
+                   seeds the solver (with the TEMPLATE_QUALITY profile unless
+                   quality or time_limit_seconds is given) or, on an exact
+                   match, is reused as is; the new plan is recorded
+        departure_slices: Optional departure-time slices of the plan's day
+                          (matrix_providers.departure_slices); travel times
+                          then follow the time of day each leg is driven,
+                          see solve_vrp
+        matrix_provider: Optional MatrixProvider to use instead of creating
+                         one for matrix_backend and matrix_options (e.g. a
+                         SharedMatrixProvider of several plans)
+
+    Returns:
+        Dict with optimized routes for each worker, warnings, the ids of
+        jobs no crew could serve ('dropped_jobs'), the coordinates
+        geocoded during this run ('geocoded', see prepare_coordinates) and
+        the route template used ('template': {'id', 'coverage', 'reused'},
+        or None)
+    """
+    logger.info("Starting route optimization: %d workers, %d jobs, matrix backend %s",
+                len(workers), len(jobs), matrix_backend)
+
+    # Fail fast on a bad backend, quality or constraint before any geocoding
+    if matrix_provider is None:
+        matrix_provider = get_matrix_provider(matrix_backend, api_key, **(matrix_options or {}))
+    solver_settings(len(jobs), quality, time_limit_seconds)
+    constraints = build_constraints(jobs, workers)
+
+    if progress:
+        progress('geocode', jobs=len(jobs), workers=len(workers))
+
+    with metrics.stage('geocode'):
+        depot_coords, job_coords, geocoded = prepare_coordinates(jobs, workers, api_key)
+
+    # Check for jobs that are far from every depot (>200km as the crow flies).
+    # One vectorized pass gives each job's distance to every depot; the
+    # nearest-depot screening is reused by the solver stages.
+    depot_job_km = haversine_matrix_km(depot_coords, job_coords)
+    nearest_depot = depot_job_km.argmin(axis=0)
+    nearest_depot_km = depot_job_km.min(axis=0)
 
-    # Use first depot as reference point
-    reference_depot = depot_coords[0]
     far_jobs = []
-    for i, job_coord in enumerate(job_coords):
-        dist_km = haversine_km(reference_depot, job_coord)
-        if dist_km > 200:  # 200km threshold
-            far_jobs.append({
-                'index': i,
-                'job': jobs[i],
-                'distance_km': dist_km
-            })
+    for i in np.flatnonzero(nearest_depot_km > 200):  # 200km threshold
+        far_jobs.append({
+            'index': int(i),
+            'job': jobs[i],
+            'distance_km': float(nearest_depot_km[i]),
+            'nearest_worker': workers[nearest_depot[i]].get('name', 'Unknown')
+        })
 
     if far_jobs:
-        print(f"\n[WARNING] {len(far_jobs)} job(s) are >200km from depot:")
-        for fj in far_jobs:
-            print(f"  - {fj['job'].get('address', 'Unknown')}: {fj['distance_km']:.0f} km away")
-        print(f"[WARNING] Consider setting worker depot addresses closer to jobs, or jobs may cluster to one driver.\n")
+        logger.warning("%d job(s) are >200km from every depot: %s", len(far_jobs), [
+            f"{fj['job'].get('address', 'Unknown')}: {fj['distance_km']:.0f} km ({fj['nearest_worker']})"
+            for fj in far_jobs
+        ])
+
+    initial_routes = None
+    if initial_assignment is not None:
+        job_index = {job['id']: i for i, job in enumerate(jobs)}
+        initial_routes = [
+            [job_index[job_id] for job_id in initial_assignment.get(worker['id'], []) if job_id in job_index]
+            for worker in workers
+        ]
+
+    # Recurring stops: start from (or reuse) the best matching past plan
+    template = None
+    template_seconds = None
+    if templates is not None and initial_assignment is None and not decompose:
+        with metrics.stage('template'):
+            template = templates.match(job_coords, [worker['id'] for worker in workers])
+        if template is not None:
+            worker_ids = [str(worker['id']) for worker in workers]
+            initial_routes = [template['routes'][worker_id] for worker_id in worker_ids]
+            if template['exact'] and all(template['travel_seconds'].get(worker_id) is not None
+                                         for worker_id in worker_ids):
+                template_seconds = [template['travel_seconds'][worker_id] for worker_id in worker_ids]
+            if quality is None and time_limit_seconds is None:
+                quality = TEMPLATE_QUALITY
 
     # Solve VRP
-    routes, all_locations = solve_vrp(depot_coords, job_coords, api_key)
+    routes, all_locations = solve_vrp(depot_coords, job_coords, api_key, time_limit_seconds,
+                                      matrix_provider=matrix_provider, progress=progress,
+                                      initial_routes=initial_routes, decompose=decompose, quality=quality,
+                                      constraints=constraints, offload_solve=offload_solve,
+                                      template_seconds=template_seconds, departure_slices=departure_slices)
+    reused = template is not None and all(route.get('from_template') for route in routes.values())
 
     # Map routes back to job IDs
+    mapping_started = time.perf_counter()
     result = {}
     total_jobs_assigned = 0
-    
+    assigned_jobs = set()
+
     for driver_key, route_data in routes.items():
         driver_idx = int(driver_key.split('_')[1])
         worker = workers[driver_idx]
 
+        arrivals = route_data.get('arrivals')
+
         # Extract job assignments (skip depot nodes)
         job_assignments = []
-        for node_idx in route_data['path']:
+        for position, node_idx in enumerate(route_data['path']):
             # Depot nodes are 0 to num_workers-1
             if node_idx >= len(workers):
                 job_idx = node_idx - len(workers)
                 job = jobs[job_idx]
-                job_assignments.append({
+                assignment = {
                     'job_id': job['id'],
                     'order': len(job_assignments) + 1,
                     'location': all_locations[node_idx]
-                })
+                }
+                if arrivals:
+                    assignment['arrival_time'] = format_time_of_day(arrivals[position])
+                # Carried along so a re-optimization keeps the job's constraints
+                assignment.update({field: job[field] for field in JOB_FIELDS if job.get(field) is not None})
+                job_assignments.append(assignment)
+                assigned_jobs.add(job_idx)
 
         total_jobs_assigned += len(job_assignments)
 
@@ -366,20 +965,150 @@ def optimize_routes(jobs, workers, api_key):
             'total_distance_meters': route_data['distance_meters'],
             'optimized_path': [all_locations[idx] for idx in route_data['path']]
         }
+        if arrivals:
+            result[worker['id']]['start_time'] = format_time_of_day(arrivals[0])
+            result[worker['id']]['end_time'] = format_time_of_day(arrivals[-1])
+        result[worker['id']].update({field: worker[field] for field in WORKER_FIELDS if worker.get(field) is not None})
 
-        print(f"[RESULT] {worker.get('name', 'Unknown')}: {len(job_assignments)} jobs, "
-              f"{route_data['distance_meters']/1000:.1f} km, {route_data['duration_seconds']/60:.0f} min")
+        logger.debug("%s: %d jobs, %.1f km, %.0f min", worker.get('name', 'Unknown'), len(job_assignments),
+                     route_data['distance_meters'] / 1000, route_data['duration_seconds'] / 60)
 
-    print(f"\n[SUMMARY] Total jobs assigned: {total_jobs_assigned}/{len(jobs)}")
-    print(f"{'='*60}\n")
+    metrics.record_stage('result_mapping', time.perf_counter() - mapping_started)
+    logger.info("Route optimization done: %d/%d jobs assigned", total_jobs_assigned, len(jobs))
 
     # Build warnings list for frontend
     warnings = []
     if far_jobs:
         warnings.append({
             'type': 'far_jobs',
-            'message': f"{len(far_jobs)} job(s) are more than 200km from the depot. Consider updating worker depot addresses.",
-            'details': [f"{fj['job'].get('address', 'Unknown')}: {fj['distance_km']:.0f} km away" for fj in far_jobs]
+            'message': f"{len(far_jobs)} job(s) are more than 200km from every depot. Consider updating worker depot addresses.",
+            'details': [f"{fj['job'].get('address', 'Unknown')}: {fj['distance_km']:.0f} km from nearest depot" for fj in far_jobs]
+        })
+
+    # Travel times that could not be fetched (e.g. Distance Matrix requests
+    # that kept failing) were estimated from straight-line distance; a
+    # provider shared with other plans also reports theirs
+    points = {tuple(location) for location in all_locations}
+    fallback = {pair for pair in matrix_provider.fallback_pairs() if pair[0] in points and pair[1] in points}
+    if fallback:
+        estimated_legs = []
+        for worker_id, route in result.items():
+            stops = ['depot'] + [str(job['job_id']) for job in route['jobs']] + ['depot']
+            path = [tuple(location) for location in route['optimized_path']]
+            for leg, pair in enumerate(zip(path, path[1:])):
+                if pair in fallback:
+                    estimated_legs.append(f"{route['worker_name']}: {stops[leg]} -> {stops[leg + 1]}")
+        logger.warning("%d travel time(s) estimated after failed requests, %d on the routes",
+                       len(fallback), len(estimated_legs))
+        warnings.append({
+            'type': 'estimated_travel_times',
+            'message': f"{len(fallback)} travel time(s) could not be fetched from Google and were estimated "
+                       f"from straight-line distance; {len(estimated_legs)} leg(s) of the routes use them.",
+            'details': estimated_legs
+        })
+
+    dropped_jobs = [job['id'] for i, job in enumerate(jobs) if i not in assigned_jobs]
+    if dropped_jobs:
+        logger.warning("%d job(s) could not be scheduled: %s", len(dropped_jobs), dropped_jobs)
+        warnings.append({
+            'type': 'dropped_jobs',
+            'message': f"{len(dropped_jobs)} job(s) could not be scheduled within the crews' shifts, "
+                       f"time windows or capacity.",
+            'details': [str(job_id) for job_id in dropped_jobs]
         })
 
-    return {'routes': result, 'warnings': warnings}
+    # A reused template keeps its recorded drive times, so slow drift still
+    # shows up against the original baseline
+    if templates is not None and not reused:
+        templates.record(result)
+
+    return {
+        'routes': result,
+        'warnings': warnings,
+        'dropped_jobs': dropped_jobs,
+        'geocoded': geocoded,
+        'template': {'id': template['id'], 'coverage': round(template['coverage'], 4), 'reused': reused}
+        if template is not None else None
+    }
+
+
+def reoptimize_routes(previous_routes, api_key, add_jobs=None, remove_job_ids=None, update_workers=None,
+                      matrix_backend='google', progress=None, time_limit_seconds=INCREMENTAL_TIME_LIMIT_SECONDS,
+                      quality=None, offload_solve=False):
+    """
+    Re-optimize a previous plan after a dispatch change
+
+    Jobs and depots are taken from the previous result, so only added jobs
+    and changed depots are geocoded, and only their matrix rows/columns miss
+    the travel time cache. The solver starts from the previous routes with
+    the new jobs inserted at their cheapest position.
+
+    Args:
+        previous_routes: 'routes' of a previous optimize_routes result
+        api_key: Google Maps API key
+        add_jobs: Job dicts to add (same format as optimize_routes). A job
+                  whose id is already planned replaces it, e.g. when it moved
+        remove_job_ids: Ids of cancelled jobs
+        update_workers: Worker dicts whose depot, name, shift or capacity
+                        changed; unknown ids are added as new workers with
+                        an empty route
+        matrix_backend: Travel time source, one of matrix_providers.MATRIX_BACKENDS
+        progress: Optional progress callback, see optimize_routes
+        time_limit_seconds: Solver time limit
+        quality: Latency vs. quality target, see optimize_routes
+        offload_solve: Search in the solver process pool, see solve_vrp
+
+    Returns:
+        Same as optimize_routes
+    """
+    add_jobs = add_jobs or []
+    replaced = {str(job_id) for job_id in remove_job_ids or []} | {str(job['id']) for job in add_jobs}
+
+    workers = []
+    jobs = []
+    initial_assignment = {}
+    for worker_id, route in previous_routes.items():
+        worker = {'id': route.get('worker_id', worker_id), 'name': route.get('worker_name', 'Unknown')}
+        worker.update({field: route[field] for field in WORKER_FIELDS if route.get(field) is not None})
+        if route.get('optimized_path'):
+            worker['depot_lat'], worker['depot_lng'] = route['optimized_path'][0]
+        workers.append(worker)
+
+        kept = []
+        for assignment in sorted(route.get('jobs', []), key=lambda a: a['order']):
+            if str(assignment['job_id']) in replaced:
+                continue
+            lat, lng = assignment['location']
+            job = {'id': assignment['job_id'], 'latitude': lat, 'longitude': lng}
+            job.update({field: assignment[field] for field in JOB_FIELDS if assignment.get(field) is not None})
+            jobs.append(job)
+            kept.append(assignment['job_id'])
+        initial_assignment[worker['id']] = kept
+
+    worker_index = {str(worker['id']): i for i, worker in enumerate(workers)}
+    for update in update_workers or []:
+        i = worker_index.get(str(update['id']))
+        if i is None:
+            workers.append(dict(update))
+            continue
+        worker = {'id': workers[i]['id'], 'name': update.get('name', workers[i]['name'])}
+        if any(update.get(field) for field in ('depot_address', 'depot_lat', 'depot_lng')):
+            for field in ('depot_address', 'depot_lat', 'depot_lng'):
+                if update.get(field):
+                    worker[field] = update[field]
+        else:
+            worker.update({k: v for k, v in workers[i].items() if k.startswith('depot_')})
+        for field in WORKER_FIELDS:
+            value = update.get(field, workers[i].get(field))
+            if value is not None:
+                worker[field] = value
+        workers[i] = worker
+
+    jobs.extend(add_jobs)
+
+    logger.info("Incremental re-optimization: %d added, %d removed, %d worker update(s)",
+                len(add_jobs), len(remove_job_ids or []), len(update_workers or []))
+
+    return optimize_routes(jobs, workers, api_key, matrix_backend=matrix_backend, progress=progress,
+                           time_limit_seconds=time_limit_seconds, initial_assignment=initial_assignment,
+                           quality=quality, offload_solve=offload_solve)
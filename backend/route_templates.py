@@ -0,0 +1,330 @@
+"""
+Route Templates
+Memory of past plans for the recurring part of the book. Most customers are
+weekly stops, so a day's job sites largely repeat an earlier day's. Every
+plan is recorded as a template (each crew's stops in visiting order, keyed by
+location, and the route's drive time); a new optimization whose jobs mostly
+match a template starts the solver from it instead of from scratch, which
+gives a good plan within a short search and keeps crews on familiar routes.
+When the stops and crews are exactly the template's and the drive times
+have not materially changed, the template is the plan (see
+route_optimizer.solve_vrp).
+
+Templates live in a SQLite file shared by the workers of one host. When
+DATABASE_URL is set, a new store is seeded from the routes saved over the
+last TEMPLATE_HISTORY_DAYS days.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+
+import db
+import metrics
+from travel_cache import coord_key
+
+
+DEFAULT_TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'route_templates.sqlite3')
+DEFAULT_TTL_SECONDS = 90 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 5000
+DEFAULT_HISTORY_DAYS = 56
+
+# Share of a request's jobs a template must cover to seed the solver
+DEFAULT_MIN_OVERLAP = 0.7
+# Plans with fewer stops are not worth remembering
+MIN_TEMPLATE_STOPS = 3
+# Templates with the most shared stops that are scored in full per match
+MATCH_CANDIDATES = 5
+
+# SQLite limits the number of bound parameters per statement
+_QUERY_BATCH = 400
+
+logger = logging.getLogger(__name__)
+
+
+def _travel_seconds(route):
+    """Drive time of an optimize_routes route: its duration minus the service time of its jobs"""
+    service = sum(int(round(float(job.get('service_minutes') or 0) * 60)) for job in route['jobs'])
+    return int(route['total_duration_seconds']) - service
+
+
+class RouteTemplateStore:
+    """
+    SQLite-backed store of past plans with TTL expiry and LRU eviction
+
+    Args:
+        path: SQLite file shared by all worker processes
+        ttl_seconds: Templates not recorded or used for this long expire
+        max_entries: Most templates kept
+        min_overlap: Share of a request's jobs a template must cover to match
+    """
+
+    def __init__(self, path=DEFAULT_TEMPLATE_PATH, ttl_seconds=DEFAULT_TTL_SECONDS, max_entries=DEFAULT_MAX_ENTRIES,
+                 min_overlap=DEFAULT_MIN_OVERLAP):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.min_overlap = min_overlap
+        self.matches = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA foreign_keys=ON")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS templates (
+                    id INTEGER PRIMARY KEY,
+                    signature TEXT NOT NULL UNIQUE,
+                    routes TEXT NOT NULL,
+                    stop_count INTEGER NOT NULL,
+                    recorded_at REAL NOT NULL,
+                    used_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS template_stops (
+                    template_id INTEGER NOT NULL REFERENCES templates(id) ON DELETE CASCADE,
+                    stop TEXT NOT NULL,
+                    PRIMARY KEY (stop, template_id)
+                )
+            """)
+            self._conn.commit()
+
+    def record(self, routes):
+        """
+        Remember a plan
+
+        A plan with the same crews and stops as an existing template replaces it.
+
+        Args:
+            routes: {worker_id: route} as returned by optimize_routes; a
+                    route's 'travel_seconds' may be None when its drive time
+                    is not known (plans loaded from the database)
+
+        Returns:
+            Template id, or None if the plan is too small to keep
+        """
+        template = {
+            str(worker_id): {
+                'stops': [coord_key(job['location']) for job in sorted(route['jobs'], key=lambda job: job['order'])],
+                'travel_seconds': route['travel_seconds'] if 'travel_seconds' in route else _travel_seconds(route)
+            }
+            for worker_id, route in routes.items()
+        }
+        stops = sorted({stop for route in template.values() for stop in route['stops']})
+        if len(stops) < MIN_TEMPLATE_STOPS:
+            return None
+
+        signature = hashlib.sha256(json.dumps([sorted(template), stops]).encode()).hexdigest()
+        now = time.time()
+        with self._lock:
+            self._conn.execute("DELETE FROM templates WHERE signature = ?", (signature,))
+            cursor = self._conn.execute(
+                "INSERT INTO templates (signature, routes, stop_count, recorded_at, used_at) VALUES (?, ?, ?, ?, ?)",
+                (signature, json.dumps(template), len(stops), now, now)
+            )
+            template_id = cursor.lastrowid
+            self._conn.executemany("INSERT INTO template_stops VALUES (?, ?)",
+                                   [(template_id, stop) for stop in stops])
+            self._conn.commit()
+            self._evict()
+        return template_id
+
+    def match(self, job_coords, worker_ids):
+        """
+        Best template for a set of jobs and crews
+
+        Candidates are the templates sharing the most stops with the jobs;
+        each is scored by the share of jobs it places on one of the given
+        crews. Stops and crews of the template that are not in the request
+        are left out.
+
+        Args:
+            job_coords: List of (lat, lng), one per job
+            worker_ids: Worker ids, one per crew
+
+        Returns:
+            None if no template covers min_overlap of the jobs, else a dict with
+            - id: Template id
+            - routes: {worker_id: [job index, ...]} in visiting order
+            - travel_seconds: {worker_id: drive seconds when recorded, or None}
+            - coverage: Share of the jobs placed by the template
+            - exact: True when the template has exactly these stops and crews
+        """
+        job_keys = [coord_key(coord) for coord in job_coords]
+        worker_ids = [str(worker_id) for worker_id in worker_ids]
+        if not job_keys or not worker_ids:
+            return None
+
+        keys = sorted(set(job_keys))
+        shared = Counter()
+        now = time.time()
+        with self._lock:
+            for start in range(0, len(keys), _QUERY_BATCH):
+                batch = keys[start:start + _QUERY_BATCH]
+                rows = self._conn.execute(
+                    f"""
+                    SELECT s.template_id, COUNT(*) FROM template_stops s JOIN templates t ON t.id = s.template_id
+                    WHERE t.used_at >= ? AND s.stop IN ({','.join('?' * len(batch))})
+                    GROUP BY s.template_id
+                    """,
+                    [now - self.ttl_seconds, *batch]
+                ).fetchall()
+                shared.update(dict(rows))
+
+            # A template can only cover as many jobs as it shares stops with
+            candidates = [template_id for template_id, count in shared.most_common(MATCH_CANDIDATES)
+                          if count >= self.min_overlap * len(keys)]
+            rows = self._conn.execute(
+                f"SELECT id, routes, stop_count FROM templates WHERE id IN ({','.join('?' * len(candidates))})",
+                candidates
+            ).fetchall() if candidates else []
+
+        best = None
+        for template_id, routes, stop_count in rows:
+            scored = self._score(template_id, json.loads(routes), stop_count, shared[template_id],
+                                 job_keys, worker_ids)
+            if best is None or scored['coverage'] > best['coverage']:
+                best = scored
+
+        with self._lock:
+            if best is None or best['coverage'] < self.min_overlap:
+                self.misses += 1
+                metrics.CACHE_LOOKUPS.inc(cache='route_templates', result='miss')
+                return None
+            self.matches += 1
+            self._conn.execute("UPDATE templates SET used_at = ? WHERE id = ?", (now, best['id']))
+            self._conn.commit()
+
+        metrics.CACHE_LOOKUPS.inc(cache='route_templates', result='hit')
+        logger.info("Route template %d covers %.0f%% of the jobs%s", best['id'], best['coverage'] * 100,
+                    " (exact)" if best['exact'] else "")
+        return best
+
+    @staticmethod
+    def _score(template_id, template, stop_count, shared_stops, job_keys, worker_ids):
+        """Place the jobs on the template's routes of the requested crews"""
+        jobs_at = defaultdict(list)
+        for i, key in enumerate(job_keys):
+            jobs_at[key].append(i)
+
+        routes = {}
+        travel_seconds = {}
+        placed = 0
+        for worker_id in worker_ids:
+            route = template.get(worker_id)
+            routes[worker_id] = []
+            if route is None:
+                continue
+            for stop in route['stops']:
+                # Every job at the stop's location, the first time it is visited
+                routes[worker_id].extend(jobs_at.pop(stop, []))
+            placed += len(routes[worker_id])
+            travel_seconds[worker_id] = route['travel_seconds']
+
+        exact = (not jobs_at and shared_stops == stop_count and set(template) == set(worker_ids)
+                 and len(set(job_keys)) == stop_count)
+        return {
+            'id': template_id,
+            'routes': routes,
+            'travel_seconds': travel_seconds,
+            'coverage': placed / len(job_keys),
+            'exact': exact
+        }
+
+    def import_history(self, days):
+        """
+        Record plans loaded from the database (see db.load_route_history)
+
+        Args:
+            days: {"YYYY-MM-DD": {worker_id: route}}
+
+        Returns:
+            Number of templates recorded
+        """
+        recorded = 0
+        for routes in days.values():
+            if self.record(routes) is not None:
+                recorded += 1
+        return recorded
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM templates").fetchone()[0]
+
+    def stats(self):
+        """Match/miss counters and number of stored templates"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM templates").fetchone()[0]
+            total = self.matches + self.misses
+            return {
+                'matches': self.matches,
+                'misses': self.misses,
+                'match_rate': round(self.matches / total, 4) if total else None,
+                'entries': entries,
+                'ttl_seconds': self.ttl_seconds,
+                'max_entries': self.max_entries
+            }
+
+    def _evict(self):
+        """Drop expired templates, then the least recently used ones above max_entries (lock held)"""
+        self._conn.execute("DELETE FROM templates WHERE used_at < ?", (time.time() - self.ttl_seconds,))
+        count = self._conn.execute("SELECT COUNT(*) FROM templates").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM templates WHERE id IN (SELECT id FROM templates ORDER BY used_at ASC LIMIT ?)",
+                (count - self.max_entries,)
+            )
+        self._conn.commit()
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_default_template_store():
+    """
+    Process-wide template store configured from environment variables
+
+    ROUTE_TEMPLATES_ENABLED (default "true"), ROUTE_TEMPLATES_PATH,
+    ROUTE_TEMPLATES_TTL_SECONDS, ROUTE_TEMPLATES_MAX_ENTRIES,
+    ROUTE_TEMPLATES_MIN_OVERLAP and TEMPLATE_HISTORY_DAYS (days of saved
+    routes an empty store is seeded with when DATABASE_URL is set).
+
+    Returns:
+        RouteTemplateStore instance, or None when templates are disabled
+    """
+    global _default_store
+
+    if os.getenv('ROUTE_TEMPLATES_ENABLED', 'true').lower() in ('0', 'false', 'no'):
+        return None
+
+    with _default_store_lock:
+        if _default_store is None:
+            store = RouteTemplateStore(
+                path=os.getenv('ROUTE_TEMPLATES_PATH', DEFAULT_TEMPLATE_PATH),
+                ttl_seconds=int(os.getenv('ROUTE_TEMPLATES_TTL_SECONDS', DEFAULT_TTL_SECONDS)),
+                max_entries=int(os.getenv('ROUTE_TEMPLATES_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)),
+                min_overlap=float(os.getenv('ROUTE_TEMPLATES_MIN_OVERLAP', DEFAULT_MIN_OVERLAP))
+            )
+            if db.is_configured() and store.count() == 0:
+                history_days = int(os.getenv('TEMPLATE_HISTORY_DAYS', DEFAULT_HISTORY_DAYS))
+                try:
+                    imported = store.import_history(db.load_route_history(date.today() - timedelta(days=history_days)))
+                    logger.info("Seeded %d route template(s) from the last %d days of saved routes",
+                                imported, history_days)
+                except Exception as e:
+                    logger.warning("Could not seed route templates from the database: %s", e)
+            _default_store = store
+        return _default_store
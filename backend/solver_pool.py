@@ -0,0 +1,52 @@
+"""
+Solver Process Pool
+Worker processes shared by the solves that run in parallel: cluster
+sub-problems of large days (decomposition.py) and portfolio searches
+(route_optimizer.solve_vrp_portfolio). OR-Tools holds the GIL while it
+searches, so parallel solves need processes rather than threads.
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import metrics
+
+
+# Every gunicorn worker has its own pool, so together they get one process per core
+DEFAULT_WORKERS = int(os.getenv('SOLVER_WORKERS') or os.getenv('DECOMPOSE_WORKERS')
+                      or max(1, (os.cpu_count() or 1) // int(os.getenv('WEB_CONCURRENCY') or 1)))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_solver_pool():
+    """Process pool shared by all parallel solves in this process"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: forking a multi-threaded gunicorn worker is not safe
+            _pool = ProcessPoolExecutor(max_workers=DEFAULT_WORKERS,
+                                        mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def solve_in_worker(duration_matrix, distance_matrix, num_drivers, time_limit_seconds, **options):
+    """
+    Worker process entry point: solve_vrp_matrix on one (sub)problem
+
+    Metrics recorded in a worker stay in that process, so the solver
+    statistics are handed back for the caller to record.
+
+    Returns:
+        Tuple of (routes_dict, solver_stats); pass solver_stats to
+        metrics.record_solver(**solver_stats) in the calling process
+    """
+    # Imported here: route_optimizer imports this module
+    from route_optimizer import solve_vrp_matrix
+
+    with metrics.collect() as stats:
+        routes = solve_vrp_matrix(duration_matrix, distance_matrix, num_drivers, time_limit_seconds, **options)
+    return routes, stats['solver']
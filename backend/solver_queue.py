@@ -0,0 +1,252 @@
+"""
+Solver Admission Queue
+Bounds the optimizations a host runs at once across all gunicorn workers.
+An optimization holds one of SOLVER_SLOTS slots for its whole run, up to
+SOLVER_QUEUE_SIZE more wait for a slot in arrival order, and anything beyond
+that is turned away at once with SolverBusy (HTTP 429 with Retry-After)
+instead of piling up threads, memory and solver processes until every
+request times out. Waiting requests give up after SOLVER_QUEUE_WAIT_SECONDS.
+
+Tickets are rows in a SQLite file shared by the workers of the host. A
+running ticket expires after its lease and a waiting one when its request
+stops polling, so a killed worker does not hold a slot forever; a live one
+renews its lease while it solves.
+"""
+
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+
+import metrics
+
+
+DEFAULT_QUEUE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'solver_queue.sqlite3')
+# One running optimization per core of the host
+DEFAULT_SLOTS = os.cpu_count() or 1
+DEFAULT_QUEUE_SIZE = 2 * DEFAULT_SLOTS
+DEFAULT_WAIT_SECONDS = 30
+
+# A running optimization frees its slot this long after its worker stopped renewing it
+LEASE_SECONDS = 60
+RENEW_SECONDS = LEASE_SECONDS / 3
+# A waiting request that stopped polling for this long loses its place
+WAIT_LEASE_SECONDS = 10
+POLL_SECONDS = 0.25
+
+logger = logging.getLogger(__name__)
+
+
+class SolverBusy(Exception):
+    """
+    The host is running and queueing as many optimizations as it may
+
+    Attributes:
+        retry_after: Seconds until a slot is expected to be free
+    """
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class SolverQueue:
+    """
+    Host-wide bounded queue of optimizations
+
+    Args:
+        path: SQLite file shared by all worker processes
+        slots: Optimizations that may run at once
+        queue_size: Optimizations that may wait for a slot
+        wait_seconds: Longest a request waits for a slot
+    """
+
+    def __init__(self, path=DEFAULT_QUEUE_PATH, slots=DEFAULT_SLOTS, queue_size=DEFAULT_QUEUE_SIZE,
+                 wait_seconds=DEFAULT_WAIT_SECONDS):
+        self.path = path
+        self.slots = max(1, slots)
+        self.queue_size = max(0, queue_size)
+        self.wait_seconds = wait_seconds
+        self._lock = threading.Lock()
+
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+        # Autocommit: every check-and-update below runs in its own BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS solver_tickets (
+                    id TEXT PRIMARY KEY,
+                    state TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    expected_end REAL NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                self._conn.execute("DELETE FROM solver_tickets WHERE expires_at <= ?", (now,))
+                yield now
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _counts(self):
+        rows = self._conn.execute("SELECT state, COUNT(*) FROM solver_tickets GROUP BY state").fetchall()
+        counts = dict(rows)
+        return counts.get('running', 0), counts.get('waiting', 0)
+
+    def _retry_after(self, now, waiting):
+        """Seconds until the slot a new request would get is expected to free up"""
+        ends = sorted(row[0] for row in self._conn.execute(
+            "SELECT expected_end FROM solver_tickets WHERE state = 'running'"
+        ))
+        if not ends:
+            return 1
+        remaining = [max(0.0, end - now) for end in ends]
+        # Waiting requests take the earliest slots, one round of slots at a time
+        rounds, position = divmod(waiting, self.slots)
+        typical = max(1.0, sum(remaining) / len(remaining))
+        return max(1, math.ceil(remaining[min(position, len(remaining) - 1)] + rounds * typical))
+
+    def _reject(self, now, waiting, reason):
+        retry_after = self._retry_after(now, waiting)
+        logger.warning("Optimization rejected (%s), retry after %d s", reason, retry_after)
+        return SolverBusy(f"Route optimizer is busy ({reason}); retry in {retry_after} seconds", retry_after)
+
+    def check(self):
+        """
+        Raise SolverBusy if a new optimization would be turned away now
+
+        For callers that queue work for later (/api/optimize-routes/jobs).
+        """
+        with self._transaction() as now:
+            running, waiting = self._counts()
+            if running + waiting >= self.slots + self.queue_size:
+                raise self._reject(now, waiting, 'queue full')
+
+    @contextmanager
+    def slot(self, expected_seconds, wait_seconds=None, progress=None):
+        """
+        Hold a solver slot for the duration of the block
+
+        Args:
+            expected_seconds: Expected run time, used for Retry-After estimates
+            wait_seconds: Longest to wait for a slot (default: the queue's)
+            progress: Optional callback progress(stage, **details); gets a
+                      'queued' event with the queue position when it has to wait
+
+        Raises:
+            SolverBusy: If the queue is full or no slot freed up in time
+        """
+        ticket = uuid.uuid4().hex
+        wait_seconds = self.wait_seconds if wait_seconds is None else wait_seconds
+
+        with self._transaction() as now:
+            running, waiting = self._counts()
+            if running < self.slots and waiting == 0:
+                state = 'running'
+            elif running + waiting >= self.slots + self.queue_size:
+                raise self._reject(now, waiting, 'queue full')
+            else:
+                state = 'waiting'
+            self._conn.execute(
+                "INSERT INTO solver_tickets VALUES (?, ?, ?, ?, ?)",
+                (ticket, state, now, now + expected_seconds,
+                 now + (LEASE_SECONDS if state == 'running' else WAIT_LEASE_SECONDS))
+            )
+
+        stop = threading.Event()
+        try:
+            if state == 'waiting':
+                if progress:
+                    progress('queued', position=waiting + 1)
+                with metrics.stage('queue'):
+                    self._wait(ticket, expected_seconds, time.monotonic() + wait_seconds)
+            threading.Thread(target=self._renew, args=(ticket, stop), name='solver-lease', daemon=True).start()
+            yield
+        finally:
+            stop.set()
+            with self._lock:
+                self._conn.execute("DELETE FROM solver_tickets WHERE id = ?", (ticket,))
+
+    def _renew(self, ticket, stop):
+        """Extend a running ticket's lease every RENEW_SECONDS until stop is set"""
+        while not stop.wait(RENEW_SECONDS):
+            try:
+                with self._lock:
+                    self._conn.execute("UPDATE solver_tickets SET expires_at = ? WHERE id = ?",
+                                       (time.time() + LEASE_SECONDS, ticket))
+            except sqlite3.Error:
+                logger.exception("Failed to renew solver slot lease")
+
+    def _wait(self, ticket, expected_seconds, deadline):
+        """Poll until ticket is the oldest waiting one and a slot is free, then take it"""
+        while True:
+            time.sleep(POLL_SECONDS)
+            with self._transaction() as now:
+                running, waiting = self._counts()
+                first = self._conn.execute(
+                    "SELECT id FROM solver_tickets WHERE state = 'waiting' ORDER BY created_at, id LIMIT 1"
+                ).fetchone()
+                if running < self.slots and first is not None and first[0] == ticket:
+                    self._conn.execute(
+                        "UPDATE solver_tickets SET state = 'running', expected_end = ?, expires_at = ? WHERE id = ?",
+                        (now + expected_seconds, now + LEASE_SECONDS, ticket)
+                    )
+                    return
+                if time.monotonic() > deadline:
+                    raise self._reject(now, max(0, waiting - 1), 'no slot freed up in time')
+                self._conn.execute("UPDATE solver_tickets SET expires_at = ? WHERE id = ?",
+                                   (now + WAIT_LEASE_SECONDS, ticket))
+
+
+_default_queue = None
+_default_queue_lock = threading.Lock()
+
+
+def get_solver_queue():
+    """
+    Process-wide solver queue configured from environment variables
+
+    SOLVER_QUEUE_ENABLED (default "true"), SOLVER_QUEUE_PATH, SOLVER_SLOTS
+    (default: number of CPU cores), SOLVER_QUEUE_SIZE (default twice that) and
+    SOLVER_QUEUE_WAIT_SECONDS.
+
+    Returns:
+        SolverQueue instance, or None when admission control is disabled
+    """
+    global _default_queue
+
+    if os.getenv('SOLVER_QUEUE_ENABLED', 'true').lower() in ('0', 'false', 'no'):
+        return None
+
+    with _default_queue_lock:
+        if _default_queue is None:
+            _default_queue = SolverQueue(
+                path=os.getenv('SOLVER_QUEUE_PATH', DEFAULT_QUEUE_PATH),
+                slots=int(os.getenv('SOLVER_SLOTS') or DEFAULT_SLOTS),
+                queue_size=int(os.getenv('SOLVER_QUEUE_SIZE') or DEFAULT_QUEUE_SIZE),
+                wait_seconds=float(os.getenv('SOLVER_QUEUE_WAIT_SECONDS', DEFAULT_WAIT_SECONDS))
+            )
+        return _default_queue
+
+
+def solver_slot(expected_seconds, wait_seconds=None, progress=None):
+    """Hold a slot of the process-wide queue (see SolverQueue.slot); a no-op when disabled"""
+    queue = get_solver_queue()
+    if queue is None:
+        return nullcontext()
+    return queue.slot(expected_seconds, wait_seconds=wait_seconds, progress=progress)
@@ -0,0 +1,27 @@
+"""
+Shared test setup: the backend modules are imported from the parent
+directory, and every on-disk cache and store points at a temporary directory
+so tests never touch .cache/ or each other's state.
+"""
+
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+_cache_dir = tempfile.mkdtemp(prefix='route-optimizer-tests-')
+for variable, filename in (('TRAVEL_CACHE_PATH', 'travel_times.sqlite3'),
+                           ('GEOCODE_CACHE_PATH', 'geocodes.sqlite3'),
+                           ('RESULT_CACHE_PATH', 'results.sqlite3'),
+                           ('ROUTE_TEMPLATES_PATH', 'route_templates.sqlite3'),
+                           ('SOLVER_QUEUE_PATH', 'solver_queue.sqlite3'),
+                           ('OPTIMIZE_JOBS_PATH', 'optimization_jobs.sqlite3')):
+    os.environ[variable] = os.path.join(_cache_dir, filename)
+
+# Requests must not be answered from, or seed the solver with, earlier tests' plans
+os.environ['RESULT_CACHE_ENABLED'] = 'false'
+os.environ['ROUTE_TEMPLATES_ENABLED'] = 'false'
+os.environ.pop('DATABASE_URL', None)
+os.environ.pop('REDIS_URL', None)
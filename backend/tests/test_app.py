@@ -0,0 +1,138 @@
+"""
+Endpoint validation against the offline haversine backend
+
+Solves run in the spawned solver processes, as in production.
+"""
+
+import pytest
+
+import optimization_jobs
+import solver_queue
+from app import app
+from optimization_jobs import OptimizationRunner
+from solver_queue import SolverQueue
+
+
+JOBS = [{'id': f'job-{i}', 'latitude': 42.30 + 0.01 * i, 'longitude': -71.10 + 0.005 * i} for i in range(4)]
+WORKERS = [{'id': 'w1', 'name': 'Crew 1', 'depot_lat': 42.30, 'depot_lng': -71.10},
+           {'id': 'w2', 'name': 'Crew 2', 'depot_lat': 42.34, 'depot_lng': -71.08}]
+
+
+def optimize_body(**fields):
+    return {'jobs': JOBS, 'workers': WORKERS, 'matrix_backend': 'haversine', 'time_limit_seconds': 1, **fields}
+
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+
+@pytest.fixture
+def full_queue(tmp_path, monkeypatch):
+    """Solver queue with its only slot taken and no room to wait"""
+    queue = SolverQueue(path=str(tmp_path / 'queue.sqlite3'), slots=1, queue_size=0)
+    monkeypatch.setattr(solver_queue, '_default_queue', queue)
+    with queue.slot(30):
+        yield queue
+
+
+def test_optimize_haversine(client):
+    response = client.post('/api/optimize-routes', json=optimize_body())
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['success']
+    planned = sorted(job['job_id'] for route in body['routes'].values() for job in route['jobs'])
+    assert planned == sorted(job['id'] for job in JOBS)
+    assert body['metadata']['matrix_backend'] == 'haversine'
+
+
+@pytest.mark.parametrize('body, error', [
+    ({}, 'Request body is required'),
+    ({'jobs': JOBS}, 'Both jobs and workers are required'),
+    ({'jobs': [], 'workers': WORKERS}, 'At least one job'),
+    (optimize_body(matrix_backend='osrm'), 'matrix_backend must be one of'),
+    (optimize_body(quality='best'), 'quality must be one of'),
+    (optimize_body(decompose='yes'), 'decompose must be true or false'),
+    (optimize_body(response_format='xml'), 'response_format must be one of'),
+    (optimize_body(departure_slices=[]), 'departure_slices must be a non-empty list'),
+    (optimize_body(departure_slices=['7am']), 'departure_slices'),
+    (optimize_body(time_limit_seconds='soon'), 'Validation error'),
+    (optimize_body(time_limit_seconds=[1]), 'time_limit_seconds must be a number'),
+    (optimize_body(jobs=[{'id': 'j', 'latitude': 42.3, 'longitude': -71.1, 'time_window_start': '18:00',
+                          'time_window_end': '09:00'}]), 'Validation error')
+])
+def test_optimize_rejects_invalid_requests(client, body, error):
+    response = client.post('/api/optimize-routes', json=body)
+
+    assert response.status_code == 400
+    assert error in response.get_json()['error']
+
+
+def test_incremental_without_a_time_limit(client):
+    previous = client.post('/api/optimize-routes', json=optimize_body()).get_json()['routes']
+
+    response = client.post('/api/optimize-routes/incremental', json={
+        'previous_routes': previous, 'matrix_backend': 'haversine', 'time_limit_seconds': None,
+        'remove_job_ids': ['job-0']
+    })
+
+    assert response.status_code == 200
+    planned = sorted(job['job_id'] for route in response.get_json()['routes'].values() for job in route['jobs'])
+    assert planned == ['job-1', 'job-2', 'job-3']
+
+
+@pytest.mark.parametrize('time_limit_seconds', ['soon', [1], {'seconds': 1}])
+def test_incremental_rejects_a_time_limit_that_is_not_a_number(client, time_limit_seconds):
+    response = client.post('/api/optimize-routes/incremental', json={
+        'previous_routes': {'w1': {'worker_id': 'w1', 'jobs': []}}, 'matrix_backend': 'haversine',
+        'time_limit_seconds': time_limit_seconds
+    })
+
+    assert response.status_code == 400
+    assert 'time_limit_seconds must be a number' in response.get_json()['error']
+
+
+def test_optimize_answers_429_when_the_queue_is_full(client, full_queue):
+    response = client.post('/api/optimize-routes', json=optimize_body())
+
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+    assert response.get_json()['retry_after'] == int(response.headers['Retry-After'])
+
+
+def test_job_submission_validation(client):
+    assert client.post('/api/optimize-routes/jobs', json=optimize_body(time_limit_seconds='soon')).status_code == 400
+    assert client.post('/api/optimize-routes/jobs', json=optimize_body(quality='best')).status_code == 400
+
+
+def test_job_submission_answers_429_when_the_queue_is_full(client, full_queue):
+    assert client.post('/api/optimize-routes/jobs', json=optimize_body()).status_code == 429
+
+
+def test_event_streams_are_capped(client, tmp_path, monkeypatch):
+    runner = OptimizationRunner(optimization_jobs.JobStore(str(tmp_path / 'jobs.sqlite3')), max_streams=1,
+                                stream_seconds=0.2)
+    monkeypatch.setattr(optimization_jobs, '_runner', runner)
+    job_id = runner.store.create()
+
+    first = client.get(f'/api/optimize-routes/jobs/{job_id}/events')
+    assert client.get(f'/api/optimize-routes/jobs/{job_id}/events').status_code == 429
+    assert 'event: reconnect' in first.get_data(as_text=True)
+    first.close()
+
+    resumed = client.get(f'/api/optimize-routes/jobs/{job_id}/events', headers={'Last-Event-ID': '3'})
+    assert resumed.status_code == 200
+    assert '"last_event_id": 3' in resumed.get_data(as_text=True)
+    resumed.close()
+
+    assert client.get(f'/api/optimize-routes/jobs/{job_id}/events?last_event_id=x').status_code == 400
+
+
+def test_bulk_geocode_validation(client):
+    response = client.post('/api/geocode/bulk', data='x', content_type='text/plain')
+    assert response.status_code == 400
+
+    response = client.post('/api/geocode/bulk', data='id,street\n1,Main\n', content_type='text/csv')
+    assert response.status_code == 400
+    assert 'address' in response.get_json()['error']
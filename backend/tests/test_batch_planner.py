@@ -0,0 +1,94 @@
+from datetime import date
+
+import numpy as np
+import pytest
+
+import matrix_providers
+from batch_planner import optimize_days
+from matrix_providers import GoogleMatrixProvider, HaversineMatrixProvider, SharedMatrixProvider, departure_slices
+
+
+DEPOTS = [(42.30, -71.10), (42.34, -71.08)]
+MONDAY = DEPOTS + [(42.31 + 0.01 * i, -71.09) for i in range(4)]
+# Shares a depot and a site with Monday
+TUESDAY = DEPOTS[:1] + [(42.31, -71.09), (42.36, -71.02), (42.37, -71.03)]
+SHARED_PAIRS = 6 * 5 + 4 * 3 - 2
+
+
+@pytest.fixture
+def fetches(monkeypatch):
+    """Replaces the Distance Matrix fetch with haversine travel times; records every call"""
+    calls = []
+
+    def fetch_travel_times(locations, api_key, required=None, departure_time="now", **options):
+        calls.append({'locations': list(locations), 'required': required, 'departure_time': departure_time})
+        duration_matrix, distance_matrix = HaversineMatrixProvider().build(locations)
+        known = np.ones(duration_matrix.shape, dtype=bool) if required is None else required | np.eye(
+            len(locations), dtype=bool)
+        return duration_matrix, distance_matrix, known
+
+    monkeypatch.setattr(matrix_providers, 'fetch_travel_times', fetch_travel_times)
+    return calls
+
+
+class TestSharedMatrixProvider:
+
+    def test_each_plan_gets_its_slice(self):
+        provider = HaversineMatrixProvider()
+        shared = SharedMatrixProvider(provider, [(MONDAY, 2, None), (TUESDAY, 1, None)])
+
+        for locations in (MONDAY, TUESDAY, TUESDAY[::-1], MONDAY[:3]):
+            for sliced, built in zip(shared.build(locations), provider.build(locations)):
+                assert (sliced == built).all()
+        _, _, estimated = shared.build_sparse(TUESDAY, 1)
+        assert not estimated.any()
+
+    def test_shared_pairs_are_fetched_once(self, fetches):
+        shared = SharedMatrixProvider(GoogleMatrixProvider('key'), [(MONDAY, 2, None), (TUESDAY, 1, None)])
+
+        call, = fetches
+        assert len(call['locations']) == len(set(MONDAY + TUESDAY))
+        assert call['required'].sum() == SHARED_PAIRS
+
+        shared.build_sparse(MONDAY, 2)
+        shared.build(TUESDAY)
+        assert len(fetches) == 1
+
+    def test_pairs_no_plan_asked_for_go_to_the_provider(self, fetches):
+        shared = SharedMatrixProvider(GoogleMatrixProvider('key'), [(MONDAY, 2, None), (TUESDAY, 1, None)])
+
+        shared.build([MONDAY[3], TUESDAY[3]])
+
+        assert len(fetches) == 2
+        assert fetches[1]['locations'] == [MONDAY[3], TUESDAY[3]]
+
+    def test_one_fetch_per_departure_time_bucket(self, fetches):
+        monday, tuesday = date(2031, 3, 3), date(2031, 3, 4)
+        plans = [(MONDAY, 2, [when for _, when in departure_slices(monday, ['08:00', '12:00'])]),
+                 (TUESDAY, 1, [when for _, when in departure_slices(tuesday, ['08:00', '12:00'])])]
+
+        shared = SharedMatrixProvider(GoogleMatrixProvider('key'), plans)
+
+        assert len(fetches) == 2
+        assert all(call['required'].sum() == SHARED_PAIRS for call in fetches)
+        for _, when in departure_slices(tuesday, ['08:00', '12:00']):
+            shared.build_at(TUESDAY, when)
+        assert len(fetches) == 2
+
+
+def test_days_are_planned_on_one_fetch(fetches):
+    jobs = [{'id': f'mon-{i}', 'latitude': lat, 'longitude': lng, 'scheduled_date': '2031-03-03'}
+            for i, (lat, lng) in enumerate(MONDAY[2:])]
+    jobs += [{'id': f'tue-{i}', 'latitude': lat, 'longitude': lng, 'scheduled_date': '2031-03-04'}
+             for i, (lat, lng) in enumerate(TUESDAY[1:])]
+    workers = [{'id': 'w1', 'name': 'Crew 1', 'depot_lat': DEPOTS[0][0], 'depot_lng': DEPOTS[0][1]},
+               {'id': 'w2', 'name': 'Crew 2', 'depot_lat': DEPOTS[1][0], 'depot_lng': DEPOTS[1][1],
+                'available_dates': ['2031-03-03']}]
+
+    result = optimize_days(jobs, workers, 'key', time_limit_seconds=1)
+
+    call, = fetches
+    assert call['required'].sum() == SHARED_PAIRS
+    planned = sorted(job['job_id'] for day in result['days'].values()
+                     for route in day['routes'].values() for job in route['jobs'])
+    assert planned == sorted(job['id'] for job in jobs)
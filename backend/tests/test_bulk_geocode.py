@@ -0,0 +1,59 @@
+import io
+import time
+
+import pytest
+
+import bulk_geocode
+from bulk_geocode import geocode_rows, read_rows
+
+
+def read(text, input_format):
+    return list(read_rows(io.BytesIO(text.encode()), input_format))
+
+
+def test_ndjson_rows():
+    rows = read('{"id": "p-1", "address": "1 Main St"}\n'
+                '"2 Elm St"\n'
+                '\n'
+                '{not json\n'
+                '{"id": "p-5", "address": " "}\n'
+                '[1, 2]\n', 'ndjson')
+
+    assert rows == [
+        {'line': 1, 'id': 'p-1', 'address': '1 Main St'},
+        {'line': 2, 'id': None, 'address': '2 Elm St'},
+        {'line': 4, 'error': 'Invalid JSON'},
+        {'line': 5, 'id': 'p-5', 'error': 'Missing address'},
+        {'line': 6, 'error': 'Expected an object with an address or an address string'}
+    ]
+
+
+def test_csv_rows_with_any_header_case():
+    # Excel prepends a byte order mark
+    rows = read('\ufeffID,Address,notes\np-1,1 Main St,gate code\np-2,,\n', 'csv')
+
+    assert rows == [
+        {'line': 2, 'id': 'p-1', 'address': '1 Main St'},
+        {'line': 3, 'id': 'p-2', 'error': 'Missing address'}
+    ]
+
+
+def test_csv_without_an_address_column_is_rejected():
+    with pytest.raises(ValueError, match='address'):
+        read_rows(io.BytesIO(b'id,street\n1,Main\n'), 'csv')
+
+
+def test_batches_are_released_as_they_finish(monkeypatch):
+    def geocode_many(addresses, api_key):
+        if addresses[0].startswith('slow'):
+            time.sleep(0.3)
+        return [(None, None) if address == 'nowhere' else (42.0, -71.0) for address in addresses]
+
+    monkeypatch.setattr(bulk_geocode, 'geocode_many', geocode_many)
+    text = '\n'.join(['"slow 1"', '"slow 2"', '"fast 1"', '"nowhere"', '"fast 3"', '"fast 4"'])
+
+    results = list(geocode_rows(read_rows(io.BytesIO(text.encode()), 'ndjson'), 'key', batch_size=2, max_pending=2))
+
+    assert [result['line'] for result in results] == [3, 4, 5, 6, 1, 2]
+    assert [result['success'] for result in results] == [True, False, True, True, True, True]
+    assert results[1]['error'] == 'Address not found'
@@ -0,0 +1,58 @@
+import pytest
+
+from constraints import DAY_SECONDS, DROP_PENALTY, build_constraints, parse_time_of_day
+
+
+WORKERS = [{'id': 'w1'}, {'id': 'w2'}]
+
+
+def test_plain_request_has_no_constraints():
+    jobs = [{'id': 'j1', 'address': 'a'}, {'id': 'j2', 'service_minutes': None}]
+    assert build_constraints(jobs, WORKERS) is None
+
+
+def test_job_fields_fill_the_job_nodes():
+    jobs = [
+        {'id': 'j1', 'service_minutes': 30, 'time_window_start': '09:00', 'time_window_end': 720},
+        {'id': 'j2', 'priority': 2, 'demand': 3}
+    ]
+    constraints = build_constraints(jobs, WORKERS)
+
+    # Depots first, then jobs
+    assert constraints['service'].tolist() == [0, 0, 1800, 0]
+    assert constraints['demand'].tolist() == [0, 0, 1, 3]
+    assert constraints['penalty'].tolist() == [0, 0, DROP_PENALTY, 2 * DROP_PENALTY]
+    assert constraints['windows'][2].tolist() == [9 * 3600, 12 * 3600]
+    assert constraints['windows'][3].tolist() == [0, DAY_SECONDS]
+    assert constraints['capacity'] is None
+
+
+def test_shifts_and_capacity_fill_the_depot_nodes():
+    workers = [{'id': 'w1', 'shift_start': '08:00', 'shift_end': '16:00', 'capacity': 5}, {'id': 'w2'}]
+    constraints = build_constraints([{'id': 'j1', 'demand': 2}, {'id': 'j2'}], workers)
+
+    assert constraints['windows'][0].tolist() == [8 * 3600, 16 * 3600]
+    assert constraints['windows'][1].tolist() == [0, DAY_SECONDS]
+    # A crew without a capacity can take every job
+    assert constraints['capacity'].tolist() == [5, 3]
+
+
+@pytest.mark.parametrize('job', [
+    {'id': 'j1', 'time_window_start': '14:00', 'time_window_end': '10:00'},
+    {'id': 'j1', 'time_window_start': '25:00'},
+    {'id': 'j1', 'service_minutes': 'long'},
+    {'id': 'j1', 'priority': 0},
+    {'id': 'j1', 'demand': -1}
+])
+def test_malformed_values_are_rejected(job):
+    with pytest.raises(ValueError):
+        build_constraints([job], WORKERS)
+
+
+def test_parse_time_of_day():
+    assert parse_time_of_day('07:45', 'field') == 7 * 3600 + 45 * 60
+    assert parse_time_of_day('07:45:30', 'field') == 7 * 3600 + 45 * 60 + 30
+    assert parse_time_of_day(90, 'field') == 5400
+    assert parse_time_of_day('24:00', 'field') == DAY_SECONDS
+    with pytest.raises(ValueError, match='field'):
+        parse_time_of_day('noon', 'field')
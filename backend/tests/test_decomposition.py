@@ -0,0 +1,39 @@
+import random
+
+from decomposition import partition
+
+
+def blob(center, count, seed):
+    rng = random.Random(seed)
+    return [(center[0] + rng.uniform(-0.01, 0.01), center[1] + rng.uniform(-0.01, 0.01)) for _ in range(count)]
+
+
+def test_every_job_and_driver_lands_in_one_cluster():
+    jobs = blob((42.30, -71.10), 120, 1) + blob((42.45, -70.95), 60, 2)
+    depots = [(42.30, -71.10), (42.31, -71.09), (42.45, -70.95), (42.29, -71.11)]
+
+    clusters, centroids = partition(depots, jobs, max_cluster_jobs=100)
+
+    assert len(clusters) == len(centroids) == 2
+    assert sorted(j for _, cluster_jobs in clusters for j in cluster_jobs) == list(range(len(jobs)))
+    assert sorted(d for drivers, _ in clusters for d in drivers) == list(range(len(depots)))
+    assert all(drivers for drivers, _ in clusters)
+
+
+def test_drivers_follow_the_jobs_and_stay_close():
+    jobs = blob((42.30, -71.10), 120, 1) + blob((42.45, -70.95), 60, 2)
+    depots = [(42.30, -71.10), (42.31, -71.09), (42.45, -70.95), (42.29, -71.11)]
+
+    clusters, _ = partition(depots, jobs, max_cluster_jobs=100)
+
+    by_size = sorted(clusters, key=lambda cluster: len(cluster[1]))
+    # 60 and 120 jobs: one and three drivers, each cluster served by the depots next to it
+    assert by_size[0][0] == [2]
+    assert by_size[1][0] == [0, 1, 3]
+
+
+def test_small_day_is_one_cluster():
+    jobs = blob((42.30, -71.10), 40, 3)
+    clusters, _ = partition([(42.3, -71.1), (42.4, -71.0)], jobs, max_cluster_jobs=150)
+
+    assert clusters == [([0, 1], list(range(40)))]
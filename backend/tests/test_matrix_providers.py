@@ -0,0 +1,162 @@
+import math
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import pytest
+
+import matrix_providers
+from google_client import DISTANCE_MATRIX_MAX_DESTINATIONS, DISTANCE_MATRIX_MAX_ORIGINS
+from matrix_providers import (_FailureBudget, _fetch_chunk, best_chunk_shape, departure_slices,
+                              plan_requests)
+
+
+def grid_locations(count):
+    return [(42.30 + 0.01 * (i % 7), -71.10 + 0.01 * (i // 7)) for i in range(count)]
+
+
+def covered_cells(requests):
+    cells = []
+    for origins, destinations in requests:
+        cells.extend((i, j) for i in origins for j in destinations)
+    return cells
+
+
+class TestBestChunkShape:
+
+    def test_fits_the_api_limits(self):
+        for rows, cols in [(1, 1), (12, 12), (30, 7), (200, 200)]:
+            chunk_rows, chunk_cols = best_chunk_shape(rows, cols, max_elements=100)
+            assert chunk_rows * chunk_cols <= 100
+            assert chunk_rows <= DISTANCE_MATRIX_MAX_ORIGINS
+            assert chunk_cols <= DISTANCE_MATRIX_MAX_DESTINATIONS
+
+    def test_beats_square_chunks_on_ragged_edges(self):
+        rows, cols = best_chunk_shape(12, 12, max_elements=100)
+        assert math.ceil(12 / rows) * math.ceil(12 / cols) == 2
+
+    def test_small_matrix_is_one_request(self):
+        assert best_chunk_shape(3, 4, max_elements=100) == (3, 4)
+
+
+class TestPlanRequests:
+
+    def test_full_matrix_covers_every_cell_once(self):
+        locations = grid_locations(23)
+        missing = np.ones((23, 23), dtype=bool)
+        requests = plan_requests(locations, missing)
+
+        cells = covered_cells(requests)
+        assert len(cells) == len(set(cells)) == 23 * 23
+        assert all(len(o) * len(d) <= 100 for o, d in requests)
+
+    def test_new_stop_only_pays_for_its_row_and_column(self):
+        locations = grid_locations(40)
+        missing = np.zeros((40, 40), dtype=bool)
+        missing[17, :] = missing[:, 17] = True
+
+        requests = plan_requests(locations, missing)
+
+        cells = set(covered_cells(requests))
+        assert set(zip(*np.nonzero(missing))) <= cells
+        assert len(covered_cells(requests)) == missing.sum()
+
+    def test_nothing_missing_needs_no_requests(self):
+        locations = grid_locations(10)
+        assert plan_requests(locations, np.zeros((10, 10), dtype=bool)) == []
+
+
+class FlakyClient:
+    """Distance Matrix stand-in that fails requests per a rule"""
+
+    def __init__(self, fail):
+        self.fail = fail
+        self.calls = []
+
+    def distance_matrix(self, origins, destinations, mode, departure_time=None, traffic_model=None):
+        self.calls.append((list(origins), list(destinations)))
+        error = self.fail(origins, destinations, len(self.calls))
+        if error:
+            raise ApiError(error)
+        return {'rows': [
+            {'elements': [{'status': 'OK', 'duration': {'value': 60}, 'distance': {'value': 1000}}
+                          for _ in destinations]}
+            for _ in origins
+        ]}
+
+
+class ApiError(Exception):
+
+    def __init__(self, status):
+        super().__init__(status)
+        self.status = status
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(matrix_providers, '_backoff_seconds', lambda attempt: 0)
+
+
+class TestFetchChunk:
+
+    def test_retries_a_transient_failure(self):
+        client = FlakyClient(lambda origins, destinations, call: 'UNKNOWN_ERROR' if call == 1 else None)
+        budget = _FailureBudget(5)
+
+        rows = _fetch_chunk(client, ['a', 'b'], ['c'], budget)
+
+        assert rows == [[(60, 1000)], [(60, 1000)]]
+        assert len(client.calls) == 2
+        assert budget.retries == 1
+
+    def test_splits_down_to_the_bad_location(self):
+        client = FlakyClient(lambda origins, destinations, call: 'INVALID_REQUEST' if 'bad' in origins else None)
+        budget = _FailureBudget(20)
+
+        rows = _fetch_chunk(client, ['a', 'b', 'c', 'bad'], ['x', 'y'], budget)
+
+        assert rows[:3] == [[(60, 1000)] * 2] * 3
+        assert rows[3] == [None, None]
+        assert budget.splits > 0
+        assert budget.retries == 0
+
+    def test_request_denied_is_neither_retried_nor_split(self):
+        client = FlakyClient(lambda origins, destinations, call: 'REQUEST_DENIED')
+
+        rows = _fetch_chunk(client, ['a', 'b'], ['x', 'y'], _FailureBudget(20))
+
+        assert rows == [[None, None], [None, None]]
+        assert len(client.calls) == 1
+
+    def test_spent_budget_gives_up_at_once(self):
+        client = FlakyClient(lambda origins, destinations, call: 'UNKNOWN_ERROR')
+
+        rows = _fetch_chunk(client, ['a', 'b'], ['x'], _FailureBudget(0))
+
+        assert rows == [[None], [None]]
+        assert len(client.calls) == 1
+
+
+class TestDepartureSlices:
+
+    def test_future_day_keeps_its_times_in_order(self):
+        day = date.today() + timedelta(days=30)
+        slices = departure_slices(day, ['16:00', '08:00', '12:30'], timezone='America/New_York')
+
+        assert [seconds for seconds, _ in slices] == [8 * 3600, 12 * 3600 + 1800, 16 * 3600]
+        for seconds, when in slices:
+            assert when.tzinfo == ZoneInfo('America/New_York')
+            assert when.date() == day
+            assert when.hour * 3600 + when.minute * 60 == seconds
+
+    def test_past_day_moves_on_by_whole_weeks(self):
+        day = date.today() - timedelta(days=10)
+        (_, when), = departure_slices(day, ['09:00'], timezone='America/New_York')
+
+        assert when > datetime.now(ZoneInfo('America/New_York'))
+        assert when.weekday() == day.weekday()
+        assert (when.hour, when.minute) == (9, 0)
+
+    def test_malformed_time_is_rejected(self):
+        with pytest.raises(ValueError):
+            departure_slices(date.today(), ['7am'])
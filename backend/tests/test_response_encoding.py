@@ -0,0 +1,47 @@
+from response_encoding import apply_response_format, compact_routes, encode_polyline
+
+
+def test_encode_polyline_matches_the_reference_encoding():
+    # Example from Google's encoded polyline algorithm documentation
+    points = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+    assert encode_polyline(points) == '_p~iF~ps|U_ulLnnqC_mqNvxq`@'
+
+
+def test_encode_polyline_of_nothing_is_empty():
+    assert encode_polyline([]) == ''
+
+
+ROUTES = {
+    'w1': {
+        'worker_id': 'w1',
+        'jobs': [{'job_id': 'a', 'order': 1, 'location': [42.1, -71.1]},
+                 {'job_id': 'b', 'order': 2, 'location': [42.2, -71.2]}],
+        'optimized_path': [[42.0, -71.0], [42.1, -71.1], [42.2, -71.2], [42.0, -71.0]],
+        'total_duration_seconds': 100
+    },
+    'w2': {
+        'worker_id': 'w2',
+        'jobs': [{'job_id': 'c', 'order': 1, 'location': [42.1, -71.1]}],
+        'optimized_path': [[42.0, -71.0], [42.1, -71.1], [42.0, -71.0]],
+        'total_duration_seconds': 50
+    }
+}
+
+
+def test_compact_routes_share_locations():
+    locations, routes = compact_routes(ROUTES)
+
+    assert locations == [[42.1, -71.1], [42.2, -71.2], [42.0, -71.0]]
+    assert routes['w1']['jobs'] == [{'job_id': 'a', 'order': 1, 'location_index': 0},
+                                    {'job_id': 'b', 'order': 2, 'location_index': 1}]
+    assert routes['w2']['jobs'][0]['location_index'] == 0
+    assert routes['w1']['depot_index'] == routes['w2']['depot_index'] == 2
+    assert routes['w1']['path_polyline'] == encode_polyline(ROUTES['w1']['optimized_path'])
+    assert routes['w1']['total_duration_seconds'] == 100
+    assert 'optimized_path' not in routes['w1']
+
+
+def test_full_format_leaves_the_body_alone():
+    body = {'routes': ROUTES}
+    assert apply_response_format(body, 'full') is body
+    assert body['routes'] is ROUTES
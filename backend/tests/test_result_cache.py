@@ -0,0 +1,35 @@
+import result_cache
+from result_cache import request_key
+
+
+JOBS = [{'id': 'j1', 'address': '12 Main St., Boston', 'latitude': 42.3601234, 'longitude': -71.0589},
+        {'id': 'j2', 'latitude': 42.35, 'longitude': -71.06}]
+WORKERS = [{'id': 'w1', 'name': 'Crew', 'depot_lat': 42.3, 'depot_lng': -71.1}]
+SETTINGS = {'matrix_backend': 'haversine', 'quality': 'balanced'}
+
+
+def test_order_and_formatting_do_not_change_the_key():
+    reordered = [
+        {'id': 'j2', 'latitude': 42.3500000001, 'longitude': -71.06, 'priority': None},
+        {'id': 'j1', 'address': '  12 main st, BOSTON ', 'latitude': 42.3601234, 'longitude': -71.0589}
+    ]
+    assert request_key(reordered, WORKERS, SETTINGS) == request_key(JOBS, WORKERS, SETTINGS)
+
+
+def test_anything_that_changes_the_plan_changes_the_key():
+    key = request_key(JOBS, WORKERS, SETTINGS)
+    moved = [{**JOBS[0], 'latitude': 42.37}, JOBS[1]]
+    assert request_key(moved, WORKERS, SETTINGS) != key
+    assert request_key(JOBS, WORKERS, {**SETTINGS, 'quality': 'fast'}) != key
+    assert request_key(JOBS, [{**WORKERS[0], 'shift_end': '15:00'}], SETTINGS) != key
+
+
+def test_google_keys_include_the_traffic_hour(monkeypatch):
+    settings = {**SETTINGS, 'matrix_backend': 'google'}
+    monkeypatch.setattr(result_cache, 'time_bucket', lambda: 'wd-08')
+    morning = request_key(JOBS, WORKERS, settings)
+    haversine = request_key(JOBS, WORKERS, SETTINGS)
+    monkeypatch.setattr(result_cache, 'time_bucket', lambda: 'wd-17')
+
+    assert request_key(JOBS, WORKERS, settings) != morning
+    assert request_key(JOBS, WORKERS, SETTINGS) == haversine
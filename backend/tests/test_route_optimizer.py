@@ -0,0 +1,66 @@
+import numpy as np
+
+from constraints import build_constraints
+from route_optimizer import TEMPLATE_MIN_SLACK_SECONDS, insert_jobs, template_routes
+
+
+def line_matrix(positions):
+    """Durations between points on a line, one second per unit"""
+    positions = np.asarray(positions)
+    return np.abs(positions[:, None] - positions[None, :]).astype(np.int32)
+
+
+class TestInsertJobs:
+
+    def test_each_job_goes_to_its_cheapest_position(self):
+        # Drivers at 0 and 100; jobs at 10, 20 (planned), 90 and 15 (new)
+        durations = line_matrix([0, 100, 10, 20, 90, 15])
+
+        routes = insert_jobs([[2, 3], []], [4, 5], durations)
+
+        assert routes == [[2, 5, 3], [4]]
+
+    def test_input_routes_are_not_modified(self):
+        durations = line_matrix([0, 100, 10, 90])
+        planned = [[2], []]
+
+        insert_jobs(planned, [3], durations)
+
+        assert planned == [[2], []]
+
+    def test_longest_route_growth_is_penalised(self):
+        # Both drivers at 0; the job is the same detour from either route, so it joins the shorter one
+        durations = line_matrix([0, 0, 50, 10, -30])
+
+        routes = insert_jobs([[2], [3]], [4], durations)
+
+        assert routes[0] == [2]
+        assert sorted(routes[1]) == [3, 4]
+
+
+class TestTemplateRoutes:
+
+    durations = line_matrix([0, 100, 10, 20, 90])
+    distances = durations * 10
+
+    def test_unchanged_drive_times_reuse_the_template(self):
+        routes = template_routes([[2, 3], [4]], self.durations, self.distances, [40, 20])
+
+        assert routes['driver_0']['path'] == [0, 2, 3, 0]
+        assert routes['driver_0']['duration_seconds'] == 40
+        assert routes['driver_0']['distance_meters'] == 400
+        assert routes['driver_1']['path'] == [1, 4, 1]
+        assert all(route['from_template'] for route in routes.values())
+
+    def test_changed_drive_time_falls_back_to_solving(self):
+        recorded = 40 + TEMPLATE_MIN_SLACK_SECONDS + 1
+        assert template_routes([[2, 3], [4]], self.durations, self.distances, [recorded, 20]) is None
+
+    def test_service_time_is_not_drive_time(self):
+        jobs = [{'id': 'a', 'service_minutes': 30}, {'id': 'b'}, {'id': 'c'}]
+        constraints = build_constraints(jobs, [{'id': 'w1'}, {'id': 'w2'}])
+        durations = self.durations + constraints['service'][:, None]
+
+        routes = template_routes([[2, 3], [4]], durations, self.distances, [40, 20], constraints)
+
+        assert routes['driver_0']['duration_seconds'] == 40 + 1800
@@ -0,0 +1,66 @@
+import pytest
+
+from route_templates import RouteTemplateStore
+
+
+STOPS = [(42.30 + 0.01 * i, -71.05 - 0.01 * i) for i in range(6)]
+
+
+def plan(assignment):
+    """optimize_routes-style routes from {worker_id: [stop index, ...]}"""
+    return {
+        worker_id: {
+            'jobs': [{'job_id': f'job-{i}', 'order': order, 'location': list(STOPS[i])}
+                     for order, i in enumerate(stops, 1)],
+            'total_duration_seconds': 600 * len(stops)
+        }
+        for worker_id, stops in assignment.items()
+    }
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = RouteTemplateStore(path=str(tmp_path / 'templates.sqlite3'))
+    store.record(plan({'w1': [2, 0, 1], 'w2': [3, 4, 5]}))
+    return store
+
+
+def test_same_stops_and_crews_match_exactly(store):
+    match = store.match(STOPS, ['w1', 'w2'])
+
+    assert match['exact']
+    assert match['coverage'] == 1
+    # Job indices in the recorded visiting order
+    assert match['routes'] == {'w1': [2, 0, 1], 'w2': [3, 4, 5]}
+    assert match['travel_seconds'] == {'w1': 1800, 'w2': 1800}
+
+
+def test_jobs_are_placed_by_location_in_any_order(store):
+    jobs = [STOPS[5], STOPS[0], STOPS[1], STOPS[2], STOPS[3]]
+
+    match = store.match(jobs, ['w1', 'w2'])
+
+    assert not match['exact']
+    assert match['routes'] == {'w1': [3, 1, 2], 'w2': [4, 0]}
+    assert match['coverage'] == 1
+
+
+def test_missing_crew_lowers_the_coverage(store):
+    assert store.match(STOPS, ['w1']) is None
+
+    store.min_overlap = 0.5
+    match = store.match(STOPS, ['w1'])
+    assert match['routes'] == {'w1': [2, 0, 1]}
+    assert match['coverage'] == 0.5
+
+
+def test_mostly_new_stops_do_not_match(store):
+    new_stops = [(41.0 + 0.01 * i, -70.0) for i in range(5)]
+    assert store.match(STOPS[:2] + new_stops, ['w1', 'w2']) is None
+    assert store.misses == 1
+
+
+def test_small_plans_are_not_recorded(tmp_path):
+    store = RouteTemplateStore(path=str(tmp_path / 'templates.sqlite3'))
+    assert store.record(plan({'w1': [0, 1]})) is None
+    assert store.count() == 0
@@ -0,0 +1,34 @@
+from datetime import datetime, timezone
+
+import travel_cache
+from travel_cache import time_bucket
+
+
+def test_aware_times_are_converted_to_the_service_zone(monkeypatch):
+    monkeypatch.setattr(travel_cache, 'SERVICE_TIMEZONE', 'America/New_York')
+    # 12:30 UTC on a Monday is 07:30 in Boston
+    assert time_bucket(datetime(2026, 3, 2, 12, 30, tzinfo=timezone.utc)) == 'wd-07'
+    # 02:00 UTC on a Saturday is still Friday evening there
+    assert time_bucket(datetime(2026, 3, 7, 2, 0, tzinfo=timezone.utc)) == 'wd-21'
+
+
+def test_naive_times_are_service_zone_wall_clock(monkeypatch):
+    monkeypatch.setattr(travel_cache, 'SERVICE_TIMEZONE', 'America/New_York')
+    assert time_bucket(datetime(2026, 3, 2, 7, 30)) == 'wd-07'
+    assert time_bucket(datetime(2026, 3, 8, 14, 0)) == 'we-14'
+
+
+class FrozenDatetime(datetime):
+
+    @classmethod
+    def now(cls, tz=None):
+        # Monday 12:30 UTC
+        return datetime(2026, 3, 2, 12, 30, tzinfo=timezone.utc).astimezone(tz)
+
+
+def test_now_is_read_in_the_service_zone(monkeypatch):
+    monkeypatch.setattr(travel_cache, 'datetime', FrozenDatetime)
+    monkeypatch.setattr(travel_cache, 'SERVICE_TIMEZONE', 'America/New_York')
+    assert time_bucket() == 'wd-07'
+    monkeypatch.setattr(travel_cache, 'SERVICE_TIMEZONE', 'Asia/Tokyo')
+    assert time_bucket("now") == 'wd-21'
@@ -0,0 +1,158 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+import warmup
+from matrix_providers import neighborhood_mask, plan_requests
+from travel_cache import TravelTimeCache, time_bucket
+from warmup import BUDGET_NEIGHBORS, billed_elements, budgeted_pairs, prefetch_travel_times
+
+
+NUM_DEPOTS = 2
+LOCATIONS = [tuple(point) for point in
+             np.random.default_rng(7).uniform((42.25, -71.20), (42.45, -70.95), size=(40, 2))]
+MISSING = ~np.eye(len(LOCATIONS), dtype=bool)
+NEAREST = neighborhood_mask(LOCATIONS, NUM_DEPOTS, BUDGET_NEIGHBORS)
+
+
+def assert_whole_leading_rows(pairs, base, extra):
+    """pairs is base plus complete rows of extra, taken in row order"""
+    assert not (base & ~pairs).any()
+    rows = np.flatnonzero(extra.any(axis=1))
+    taken = [bool((pairs[row] & extra[row]).any()) for row in rows]
+    assert all((pairs[row] & extra[row] == extra[row]).all() for row, used in zip(rows, taken) if used)
+    assert taken == sorted(taken, reverse=True)
+    return sum(taken)
+
+
+def test_billed_elements_is_what_the_requests_cost():
+    requests = plan_requests(LOCATIONS, NEAREST)
+    assert billed_elements(LOCATIONS, NEAREST) == sum(len(o) * len(d) for o, d in requests)
+    assert billed_elements(LOCATIONS, MISSING) >= MISSING.sum()
+    assert billed_elements(LOCATIONS, np.zeros_like(MISSING)) == 0
+
+
+class TestBudgetedPairs:
+
+    def test_everything_within_budget(self):
+        pairs = budgeted_pairs(MISSING, NUM_DEPOTS, LOCATIONS, billed_elements(LOCATIONS, MISSING))
+        assert (pairs == MISSING).all()
+
+    def test_nearest_neighbors_first_then_whole_rows(self):
+        nearest_cost = billed_elements(LOCATIONS, NEAREST)
+        full_cost = billed_elements(LOCATIONS, MISSING)
+        assert nearest_cost < full_cost
+        budget = (nearest_cost + full_cost) // 2
+
+        pairs = budgeted_pairs(MISSING, NUM_DEPOTS, LOCATIONS, budget)
+
+        assert billed_elements(LOCATIONS, pairs) <= budget
+        rows = assert_whole_leading_rows(pairs, NEAREST, MISSING & ~NEAREST)
+        assert 0 < rows < len(LOCATIONS)
+        # The depots' rows come first
+        assert pairs[:NUM_DEPOTS].sum() == MISSING[:NUM_DEPOTS].sum()
+
+    def test_short_budget_fills_whole_rows_of_nearest_pairs(self):
+        budget = billed_elements(LOCATIONS, NEAREST) // 3
+
+        pairs = budgeted_pairs(MISSING, NUM_DEPOTS, LOCATIONS, budget)
+
+        assert billed_elements(LOCATIONS, pairs) <= budget
+        assert not (pairs & ~NEAREST).any()
+        assert assert_whole_leading_rows(pairs, np.zeros_like(MISSING), NEAREST) > 0
+
+    def test_only_missing_pairs_are_fetched(self):
+        missing = MISSING.copy()
+        missing[:, :5] = False
+
+        pairs = budgeted_pairs(missing, NUM_DEPOTS, LOCATIONS, billed_elements(LOCATIONS, NEAREST))
+
+        assert pairs.any()
+        assert not (pairs & ~missing).any()
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return TravelTimeCache(path=str(tmp_path / 'travel_times.sqlite3'))
+
+
+@pytest.fixture
+def fetches(monkeypatch):
+    """Replaces the Distance Matrix fetch; records the pairs each call asked for"""
+    calls = []
+
+    def fetch_travel_times(locations, api_key, required=None, **kwargs):
+        calls.append((list(locations), required.copy()))
+
+    monkeypatch.setattr(warmup, 'fetch_travel_times', fetch_travel_times)
+    return calls
+
+
+WHEN = warmup.departures(date.today() + timedelta(days=30), ['08:00'])[0]
+DEPOTS = list(LOCATIONS[:NUM_DEPOTS])
+JOBS = list(LOCATIONS[NUM_DEPOTS:])
+
+
+class TestPrefetchTravelTimes:
+
+    def test_only_uncached_pairs_are_requested(self, cache, fetches):
+        cache.put_many([(JOBS[0], JOBS[1], 60, 500), (JOBS[1], JOBS[0], 60, 500)], time_bucket(WHEN))
+
+        summary = prefetch_travel_times(DEPOTS + [DEPOTS[0]], JOBS, WHEN, budget=10 ** 6, cache=cache)
+
+        (locations, required), = fetches
+        assert locations == LOCATIONS
+        M = len(LOCATIONS)
+        assert summary['pairs'] == M * (M - 1)
+        assert summary['cached'] == 2
+        assert summary['requested'] == required.sum() == M * (M - 1) - 2
+        assert summary['skipped'] == 0
+        assert not required[NUM_DEPOTS, NUM_DEPOTS + 1]
+
+    def test_pairs_past_the_budget_are_counted_as_skipped(self, cache, fetches):
+        budget = billed_elements(LOCATIONS, NEAREST)
+
+        summary = prefetch_travel_times(DEPOTS, JOBS, WHEN, budget=budget, cache=cache)
+
+        (_, required), = fetches
+        assert (required == budgeted_pairs(MISSING, NUM_DEPOTS, LOCATIONS, budget)).all()
+        assert summary['skipped'] == MISSING.sum() - required.sum() > 0
+
+    def test_nothing_to_fetch_when_all_cached(self, cache, fetches):
+        cache.put_many([(a, b, 60, 500) for a in LOCATIONS for b in LOCATIONS if a != b], time_bucket(WHEN))
+
+        summary = prefetch_travel_times(DEPOTS, JOBS, WHEN, budget=10 ** 6, cache=cache)
+
+        assert fetches == []
+        assert summary['requested'] == summary['skipped'] == summary['elements'] == 0
+
+
+class TestWarmDay:
+
+    request_body = {
+        'jobs': [{'id': f'job-{i}', 'latitude': lat, 'longitude': lng} for i, (lat, lng) in enumerate(JOBS[:5])],
+        'workers': [{'id': 'w1', 'name': 'Crew', 'depot_lat': DEPOTS[0][0], 'depot_lng': DEPOTS[0][1]}]
+    }
+
+    def warm(self, monkeypatch, skipped):
+        solved = []
+        monkeypatch.setattr(warmup, 'prefetch_travel_times',
+                            lambda *args, **kwargs: {'elements': 25, 'skipped': skipped})
+        monkeypatch.setattr(warmup, 'optimize_routes', lambda jobs, workers, api_key, **kwargs: solved.append(
+            jobs) or {'routes': {}, 'dropped_jobs': [], 'template': None})
+        summary, spent = warmup.warm_day(WHEN.date(), self.request_body, times=['08:00'], draft=True)
+        assert spent == 25
+        return summary, solved
+
+    def test_no_draft_when_pairs_were_skipped(self, monkeypatch):
+        summary, solved = self.warm(monkeypatch, skipped=3)
+
+        assert solved == []
+        assert 'draft' not in summary
+
+    def test_draft_when_everything_was_fetched(self, monkeypatch):
+        summary, solved = self.warm(monkeypatch, skipped=0)
+
+        assert len(solved) == 1
+        assert summary['draft']['dropped_jobs'] == []
@@ -0,0 +1,267 @@
+"""
+Travel Time Cache
+Persistent origin -> destination cache for Distance Matrix results.
+Keys are rounded coordinates plus a time-of-day bucket so traffic-aware
+durations from the morning are not reused for the evening rush.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import metrics
+
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'travel_times.sqlite3')
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 500000
+
+# Coordinates are rounded to 5 decimals (~1 m) before building keys
+COORD_PRECISION = 5
+
+# SQLite limits the number of bound parameters per statement
+_QUERY_BATCH = 400
+
+# Time zone of the service area; traffic buckets are hours of its wall clock
+SERVICE_TIMEZONE = os.getenv('SERVICE_TIMEZONE', 'America/New_York')
+
+
+def coord_key(coord, precision=COORD_PRECISION):
+    """
+    Build the cache key for a (lat, lng) tuple
+
+    Args:
+        coord: (lat, lng) tuple
+        precision: Number of decimals to keep
+
+    Returns:
+        String like "42.36010,-71.05890"
+    """
+    lat, lng = coord
+    return f"{float(lat):.{precision}f},{float(lng):.{precision}f}"
+
+
+def time_bucket(departure_time="now"):
+    """
+    Map a departure time to a coarse traffic bucket
+
+    Weekdays and weekends are kept apart and each hour gets its own bucket,
+    which is the granularity at which Google's traffic estimates change.
+    Hours are those of SERVICE_TIMEZONE whatever the server's own time zone,
+    so a request and the warm-up of its hour land in the same bucket.
+
+    Args:
+        departure_time: "now" or a datetime (naive ones are SERVICE_TIMEZONE
+            wall-clock times)
+
+    Returns:
+        Bucket string such as "wd-08" or "we-14"
+    """
+    zone = ZoneInfo(SERVICE_TIMEZONE)
+    if departure_time == "now":
+        when = datetime.now(zone)
+    elif departure_time.tzinfo is None:
+        when = departure_time.replace(tzinfo=zone)
+    else:
+        when = departure_time.astimezone(zone)
+    day_type = "we" if when.weekday() >= 5 else "wd"
+    return f"{day_type}-{when.hour:02d}"
+
+
+class TravelTimeCache:
+    """
+    SQLite-backed travel time cache with TTL expiry and LRU eviction
+
+    The database file can be shared by several processes (gunicorn workers);
+    SQLite takes care of the file locking.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl_seconds=DEFAULT_TTL_SECONDS,
+                 max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS travel_times (
+                    origin TEXT NOT NULL,
+                    destination TEXT NOT NULL,
+                    bucket TEXT NOT NULL,
+                    duration INTEGER NOT NULL,
+                    distance INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    PRIMARY KEY (origin, destination, bucket)
+                )
+            """)
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_travel_times_accessed ON travel_times (accessed_at)"
+            )
+            self._conn.commit()
+
+    def get_many(self, origins, destinations, bucket):
+        """
+        Look up every origin -> destination pair in one pass
+
+        Args:
+            origins: List of (lat, lng) tuples
+            destinations: List of (lat, lng) tuples
+            bucket: Time bucket from time_bucket()
+
+        Returns:
+            Dict {(origin_key, destination_key): (duration_seconds, distance_meters)}
+        """
+        origin_keys = sorted({coord_key(c) for c in origins})
+        destination_keys = sorted({coord_key(c) for c in destinations})
+        if not origin_keys or not destination_keys:
+            return {}
+
+        now = time.time()
+        min_created = now - self.ttl_seconds
+        found = {}
+
+        with self._lock:
+            for o_start in range(0, len(origin_keys), _QUERY_BATCH):
+                o_batch = origin_keys[o_start:o_start + _QUERY_BATCH]
+                for d_start in range(0, len(destination_keys), _QUERY_BATCH):
+                    d_batch = destination_keys[d_start:d_start + _QUERY_BATCH]
+                    rows = self._conn.execute(
+                        f"""
+                        SELECT origin, destination, duration, distance FROM travel_times
+                        WHERE bucket = ? AND created_at >= ?
+                          AND origin IN ({','.join('?' * len(o_batch))})
+                          AND destination IN ({','.join('?' * len(d_batch))})
+                        """,
+                        [bucket, min_created, *o_batch, *d_batch]
+                    ).fetchall()
+                    for origin, destination, duration, distance in rows:
+                        found[(origin, destination)] = (duration, distance)
+
+            # Refresh access time of the hits so LRU eviction keeps them
+            if found:
+                self._conn.executemany(
+                    "UPDATE travel_times SET accessed_at = ? WHERE origin = ? AND destination = ? AND bucket = ?",
+                    [(now, o, d, bucket) for (o, d) in found]
+                )
+                self._conn.commit()
+
+        return found
+
+    def put_many(self, entries, bucket):
+        """
+        Store travel times
+
+        Args:
+            entries: Iterable of (origin, destination, duration_seconds, distance_meters)
+                     where origin/destination are (lat, lng) tuples
+            bucket: Time bucket from time_bucket()
+        """
+        now = time.time()
+        rows = [
+            (coord_key(o), coord_key(d), bucket, int(duration), int(distance), now, now)
+            for (o, d, duration, distance) in entries
+        ]
+        if not rows:
+            return
+
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO travel_times VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+            self._evict()
+
+    def record(self, hits, misses):
+        """Add lookup outcomes to the running hit/miss counters"""
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+        metrics.CACHE_LOOKUPS.inc(hits, cache='travel_times', result='hit')
+        metrics.CACHE_LOOKUPS.inc(misses, cache='travel_times', result='miss')
+
+    def stats(self):
+        """
+        Cache statistics for monitoring
+
+        Returns:
+            Dict with hits, misses, hit_rate and number of stored entries
+        """
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM travel_times").fetchone()[0]
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else None,
+                'entries': entries,
+                'ttl_seconds': self.ttl_seconds,
+                'max_entries': self.max_entries
+            }
+
+    def clear(self):
+        """Remove every cached entry"""
+        with self._lock:
+            self._conn.execute("DELETE FROM travel_times")
+            self._conn.commit()
+
+    def _evict(self):
+        """Drop expired rows, then the least recently used ones above max_entries (lock held)"""
+        self._conn.execute(
+            "DELETE FROM travel_times WHERE created_at < ?",
+            (time.time() - self.ttl_seconds,)
+        )
+        count = self._conn.execute("SELECT COUNT(*) FROM travel_times").fetchone()[0]
+        if count > self.max_entries:
+            # Evict down to 90% so we are not evicting on every insert
+            excess = count - int(self.max_entries * 0.9)
+            self._conn.execute(
+                """
+                DELETE FROM travel_times WHERE rowid IN (
+                    SELECT rowid FROM travel_times ORDER BY accessed_at ASC LIMIT ?
+                )
+                """,
+                (excess,)
+            )
+        self._conn.commit()
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache():
+    """
+    Process-wide cache configured from environment variables
+
+    TRAVEL_CACHE_ENABLED (default "true"), TRAVEL_CACHE_PATH,
+    TRAVEL_CACHE_TTL_SECONDS and TRAVEL_CACHE_MAX_ENTRIES.
+
+    Returns:
+        TravelTimeCache instance, or None when caching is disabled
+    """
+    global _default_cache
+
+    if os.getenv('TRAVEL_CACHE_ENABLED', 'true').lower() in ('0', 'false', 'no'):
+        return None
+
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = TravelTimeCache(
+                path=os.getenv('TRAVEL_CACHE_PATH', DEFAULT_CACHE_PATH),
+                ttl_seconds=int(os.getenv('TRAVEL_CACHE_TTL_SECONDS', DEFAULT_TTL_SECONDS)),
+                max_entries=int(os.getenv('TRAVEL_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES))
+            )
+        return _default_cache
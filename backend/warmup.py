@@ -0,0 +1,339 @@
+"""
+Nightly Warm-Up
+Does the expensive part of a day's optimizations ahead of time, so the
+dispatcher's morning /api/optimize-routes requests hit warm caches instead of
+geocoding, fetching the matrix and solving from scratch:
+
+1. Jobs and depots without coordinates are geocoded (into the geocode
+   cache, and onto the rows when the jobs come from the database).
+2. Google travel times between all of the day's depots and job sites are
+   fetched into the travel time cache for the hours the plans are expected
+   to be made (--at) and, with --time-dependent, for the departure slices,
+   within an API element budget. When the budget cannot cover every pair,
+   each stop's nearest neighbors and depot links go first (what a sparse
+   matrix build asks for), then whole rows as far as the budget goes.
+3. With --draft, the day is solved on those travel times. The plan is
+   recorded as a route template (route_templates.py), which the morning
+   request reuses or starts from; --save also writes it to the database.
+
+Run it the night before from cron or any other scheduler, e.g.
+    0 2 * * *  cd /app && python warmup.py --draft
+
+    python warmup.py [--date 2026-03-03] [--days 1] [--input request.json]
+        [--at 07:00 08:00] [--time-dependent] [--max-elements 50000]
+        [--workers 4] [--draft] [--quality balanced] [--save]
+
+Jobs and workers are read from the database (DATABASE_URL), or from an
+/api/optimize-routes request body given with --input (jobs with a
+scheduled_date are planned on that day only). A JSON summary per day is
+written to stdout.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import numpy as np
+from dotenv import load_dotenv
+
+import db
+import metrics
+from matrix_providers import (SERVICE_TIMEZONE, departure_slices, fetch_travel_times, neighborhood_mask,
+                              plan_requests)
+from route_optimizer import SOLVER_PROFILES, optimize_routes, prepare_coordinates
+from route_templates import get_default_template_store
+from travel_cache import coord_key, get_default_cache, time_bucket
+
+load_dotenv()
+
+logging.basicConfig(
+    level=os.getenv('LOG_LEVEL', 'INFO').upper(),
+    format='%(asctime)s %(levelname)s %(name)s: %(message)s'
+)
+logger = logging.getLogger('warmup')
+
+GOOGLE_API_KEY = os.getenv('GOOGLE_MAPS_API_KEY')
+
+# Hours of the day the morning optimizations are expected at
+DEFAULT_DEPARTURES = os.getenv('WARMUP_DEPARTURES', '07:00')
+# Distance Matrix elements one run may spend (Google bills per element)
+DEFAULT_MAX_ELEMENTS = int(os.getenv('WARMUP_MAX_ELEMENTS', 50000))
+# Concurrent Distance Matrix requests; the nightly run need not be fast
+DEFAULT_WORKERS = int(os.getenv('WARMUP_WORKERS', 4))
+# Nearest neighbors per stop fetched first when the budget is short
+BUDGET_NEIGHBORS = 10
+
+
+def load_day(day, request_body=None):
+    """
+    Jobs and workers to plan on day
+
+    Args:
+        day: date to plan
+        request_body: Optional /api/optimize-routes body with 'jobs' and
+                      'workers'; default: open jobs and all workers from the database
+
+    Returns:
+        Tuple of (jobs, workers)
+    """
+    if request_body is None:
+        return db.load_jobs(day.isoformat()), db.load_workers()
+    jobs = [job for job in request_body['jobs']
+            if not job.get('scheduled_date') or str(job['scheduled_date'])[:10] == day.isoformat()]
+    return jobs, request_body['workers']
+
+
+def departures(day, times, time_dependent=False):
+    """
+    Departure times to prefetch travel times for
+
+    Times given with --at are SERVICE_TIMEZONE times, the zone the "now" of
+    the morning requests is bucketed in (travel_cache.time_bucket); times that
+    have already passed are skipped. Time-dependent slices follow
+    matrix_providers.departure_slices.
+
+    Returns:
+        List of time zone aware datetimes, one per distinct time bucket
+    """
+    zone = ZoneInfo(SERVICE_TIMEZONE)
+    now = datetime.now(zone)
+    result = {}
+    for value in times:
+        hours, minutes = (int(part) for part in value.split(':'))
+        when = datetime(day.year, day.month, day.day, hours, minutes, tzinfo=zone)
+        if when < now:
+            logger.warning("Skipping departure %s: already passed", when.isoformat())
+            continue
+        result.setdefault(time_bucket(when), when)
+    if time_dependent:
+        for _, when in departure_slices(day):
+            result.setdefault(time_bucket(when), when)
+    return list(result.values())
+
+
+def billed_elements(locations, pairs):
+    """Distance Matrix elements fetch_travel_times pays for pairs (see plan_requests)"""
+    return sum(len(origins) * len(destinations) for origins, destinations in plan_requests(locations, pairs))
+
+
+def budgeted_pairs(missing, num_depots, locations, budget):
+    """
+    The missing pairs to fetch within budget elements
+
+    All of them if they fit; otherwise each stop's BUDGET_NEIGHBORS nearest
+    neighbors and depot links, then whole origin rows in order (depots first)
+    as far as the budget goes.
+
+    Args:
+        missing: MxM bool array of the pairs not in the cache
+        num_depots: Number of depots at the start of locations
+        locations: List of (lat, lng), unique
+        budget: Elements left
+
+    Returns:
+        MxM bool array of the pairs to fetch
+    """
+    if billed_elements(locations, missing) <= budget:
+        return missing
+    nearest = missing & neighborhood_mask(locations, num_depots, BUDGET_NEIGHBORS)
+    if billed_elements(locations, nearest) <= budget:
+        base, extra = nearest, missing & ~nearest
+    else:
+        base, extra = np.zeros_like(missing), nearest
+
+    # Most origin rows of extra that still fit, by bisection
+    rows = np.flatnonzero(extra.any(axis=1))
+
+    def with_rows(count):
+        pairs = base.copy()
+        pairs[rows[:count]] |= extra[rows[:count]]
+        return pairs
+
+    low, high = 0, len(rows)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if billed_elements(locations, with_rows(middle)) <= budget:
+            low = middle
+        else:
+            high = middle - 1
+    return with_rows(low)
+
+
+def prefetch_travel_times(depot_coords, job_coords, when, budget, max_workers=DEFAULT_WORKERS, cache=None):
+    """
+    Fetch the day's missing travel times for one departure time into the cache
+
+    Args:
+        depot_coords: List of (lat, lng), one per worker
+        job_coords: List of (lat, lng), one per job
+        when: Departure datetime
+        budget: Distance Matrix elements this fetch may spend
+        max_workers: Concurrent Distance Matrix requests
+        cache: TravelTimeCache (default: process-wide cache)
+
+    Returns:
+        Dict with bucket, pairs, cached, requested (pairs sent to the API),
+        elements (billed) and skipped (pairs left out for the budget)
+    """
+    cache = cache or get_default_cache()
+
+    # Unique points, depots first; duplicates share their travel times
+    locations = {}
+    for coord in depot_coords:
+        locations.setdefault(coord_key(coord), coord)
+    num_depots = len(locations)
+    for coord in job_coords:
+        locations.setdefault(coord_key(coord), coord)
+    keys, locations = list(locations), list(locations.values())
+    position = {key: i for i, key in enumerate(keys)}
+
+    bucket = time_bucket(when)
+    M = len(locations)
+    missing = ~np.eye(M, dtype=bool)
+    for origin, destination in cache.get_many(locations, locations, bucket):
+        missing[position[origin], position[destination]] = False
+
+    wanted = budgeted_pairs(missing, num_depots, locations, budget)
+    summary = {
+        'departure': when.isoformat(),
+        'bucket': bucket,
+        'pairs': M * (M - 1),
+        'cached': M * (M - 1) - int(missing.sum()),
+        'requested': int(wanted.sum()),
+        'elements': 0,
+        'skipped': int(missing.sum() - wanted.sum())
+    }
+    if wanted.any():
+        with metrics.collect() as fetch_metrics:
+            fetch_travel_times(locations, GOOGLE_API_KEY, required=wanted, cache=cache,
+                               max_workers=max_workers, departure_time=when)
+        summary['elements'] = fetch_metrics['counters'].get('api_elements', 0)
+        summary['failed'] = fetch_metrics['counters'].get('matrix_failed_cells', 0)
+    if summary['skipped']:
+        logger.warning("Element budget exhausted: %d pairs for %s not prefetched", summary['skipped'], bucket)
+    return summary
+
+
+def warm_day(day, request_body=None, times=(), time_dependent=False, budget=DEFAULT_MAX_ELEMENTS,
+             max_workers=DEFAULT_WORKERS, draft=False, quality=None, save=False):
+    """
+    Geocode, prefetch and optionally draft-solve one day (see module docstring)
+
+    Returns:
+        Tuple of (summary dict, elements spent)
+    """
+    jobs, workers = load_day(day, request_body)
+    summary = {'date': day.isoformat(), 'jobs': len(jobs), 'workers': len(workers)}
+    if not jobs or not workers:
+        logger.info("%s: nothing to plan", day.isoformat())
+        return summary, 0
+
+    with metrics.collect() as day_metrics:
+        depot_coords, job_coords, geocoded = prepare_coordinates(jobs, workers, GOOGLE_API_KEY)
+    summary['geocoded'] = len(geocoded['jobs']) + len(geocoded['workers'])
+    summary['geocode_requests'] = day_metrics['counters'].get('geocode_requests', 0)
+    if summary['geocoded'] and request_body is None:
+        db.save_geocoded(geocoded)
+
+    spent = 0
+    summary['travel_times'] = []
+    day_departures = departures(day, times, time_dependent)
+    for when in day_departures:
+        fetched = prefetch_travel_times(depot_coords, job_coords, when, budget - spent, max_workers)
+        spent += fetched['elements']
+        summary['travel_times'].append(fetched)
+
+    if draft and day_departures and summary['travel_times'][0]['skipped']:
+        # Solving now would fetch the skipped pairs past the budget
+        logger.warning("%s: no draft, the travel times at %s are not all cached", day.isoformat(),
+                       day_departures[0].isoformat())
+    elif draft and day_departures:
+        # A single slice at the first departure: the draft is solved on the
+        # travel times just cached instead of tonight's traffic
+        first = day_departures[0]
+        slices = (departure_slices(day) if time_dependent else
+                  [(first.hour * 3600 + first.minute * 60, first)])
+        jobs = [{**job, 'latitude': lat, 'longitude': lng} for job, (lat, lng) in zip(jobs, job_coords)]
+        workers = [{**worker, 'depot_lat': lat, 'depot_lng': lng}
+                   for worker, (lat, lng) in zip(workers, depot_coords)]
+        templates = get_default_template_store()
+        if templates is None and not save:
+            logger.warning("Route templates are disabled; the draft is only kept with --save")
+        result = optimize_routes(jobs, workers, GOOGLE_API_KEY, quality=quality, templates=templates,
+                                 departure_slices=slices)
+        summary['draft'] = {
+            'routes': {worker_id: len(route['jobs']) for worker_id, route in result['routes'].items()},
+            'dropped_jobs': result['dropped_jobs'],
+            'template': result['template']
+        }
+        if save:
+            summary['draft']['saved_routes'] = db.save_routes(result['routes'], day.isoformat(),
+                                                              result['dropped_jobs'])
+    return summary, spent
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Warm the geocode / travel time caches for upcoming days")
+    parser.add_argument('--date', type=date.fromisoformat,
+                        help="First day to warm, YYYY-MM-DD (default: tomorrow in SERVICE_TIMEZONE)")
+    parser.add_argument('--days', type=int, default=1, help="Number of days to warm (default 1)")
+    parser.add_argument('--input', help="JSON request body with jobs and workers instead of the database")
+    parser.add_argument('--at', nargs='+', default=DEFAULT_DEPARTURES.split(','),
+                        help="Times of day the plans will be made, HH:MM in SERVICE_TIMEZONE "
+                             "(default: WARMUP_DEPARTURES)")
+    parser.add_argument('--time-dependent', action='store_true',
+                        help="Also prefetch the departure slices of time-dependent plans (DEPARTURE_SLICES)")
+    parser.add_argument('--max-elements', type=int, default=DEFAULT_MAX_ELEMENTS,
+                        help="Distance Matrix elements the whole run may spend (default: WARMUP_MAX_ELEMENTS)")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help="Concurrent Distance Matrix requests (default: WARMUP_WORKERS)")
+    parser.add_argument('--draft', action='store_true', help="Solve a draft plan per day")
+    parser.add_argument('--quality', choices=list(SOLVER_PROFILES), help="Solver profile of the draft")
+    parser.add_argument('--save', action='store_true', help="Write the draft routes to the database")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not GOOGLE_API_KEY:
+        logger.error("GOOGLE_MAPS_API_KEY is not set")
+        return 1
+    if get_default_cache() is None:
+        logger.error("The travel time cache is disabled (TRAVEL_CACHE_ENABLED); nothing to warm")
+        return 1
+    if (args.input is None or args.save) and not db.is_configured():
+        logger.error("DATABASE_URL is not set (needed without --input and for --save)")
+        return 1
+
+    request_body = None
+    if args.input:
+        with open(args.input) as f:
+            request_body = json.load(f)
+
+    first_day = args.date or datetime.now(ZoneInfo(SERVICE_TIMEZONE)).date() + timedelta(days=1)
+    spent = 0
+    failed = 0
+    for offset in range(args.days):
+        day = first_day + timedelta(days=offset)
+        try:
+            summary, day_spent = warm_day(day, request_body, times=args.at, time_dependent=args.time_dependent,
+                                          budget=args.max_elements - spent, max_workers=args.workers,
+                                          draft=args.draft, quality=args.quality, save=args.save)
+        except Exception as e:
+            # One bad day (e.g. an address that does not geocode) does not stop the others
+            logger.exception("Warm-up of %s failed", day.isoformat())
+            summary, day_spent = {'date': day.isoformat(), 'error': str(e)}, 0
+            failed += 1
+        spent += day_spent
+        summary['elements_left'] = args.max_elements - spent
+        print(json.dumps(summary, default=str), flush=True)
+    logger.info("Warm-up done: %d day(s), %d failed, %d Distance Matrix elements", args.days, failed, spent)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
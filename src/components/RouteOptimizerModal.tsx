@@ -53,29 +53,8 @@ export default function RouteOptimizerModal({
 
   const handleOptimize = async () => {
     try {
-      // Prepare jobs data
-      const jobs = availableJobs
-        .filter((job) => selectedJobIds.includes(job.id))
-        .map((job) => ({
-          id: job.id,
-          address: job.address,
-          latitude: job.latitude,
-          longitude: job.longitude,
-        }))
-
-      // Prepare workers data
-      const workers = availableWorkers
-        .filter((worker) => selectedWorkerIds.includes(worker.id))
-        .map((worker) => ({
-          id: worker.id,
-          name: worker.name,
-          depot_address: worker.depot_address,
-          depot_lat: worker.depot_latitude,
-          depot_lng: worker.depot_longitude,
-        }))
-
-      // Call optimization API
-      const result = await optimizeRoutes(jobs, workers, routeDate)
+      // Call optimization API (loads the selected rows and saves the routes)
+      const result = await optimizeRoutes(selectedJobIds, selectedWorkerIds, routeDate)
 
       setOptimizationResult(result)
       setWarnings(result.warnings || [])
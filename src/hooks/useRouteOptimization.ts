@@ -4,21 +4,6 @@ import { supabase } from '@/lib/supabase'
 // Backend API configuration
 const API_BASE_URL = import.meta.env.VITE_ROUTE_OPTIMIZER_API_URL || 'http://localhost:5001'
 
-interface Job {
-  id: string
-  address?: string
-  latitude?: number
-  longitude?: number
-}
-
-interface Worker {
-  id: string
-  name: string
-  depot_address?: string
-  depot_lat?: number
-  depot_lng?: number
-}
-
 interface OptimizedRoute {
   worker_id: string
   worker_name: string
@@ -32,9 +17,16 @@ interface OptimizedRoute {
   optimized_path: Array<[number, number]>
 }
 
+interface GeocodedCoordinates {
+  jobs: Array<{ job_id: string; latitude: number; longitude: number }>
+  workers: Array<{ worker_id: string; depot_latitude: number; depot_longitude: number }>
+}
+
 interface OptimizeRoutesResponse {
   success: boolean
   routes: Record<string, OptimizedRoute>
+  geocoded?: GeocodedCoordinates
+  saved_routes?: Record<string, string>
   metadata?: {
     num_jobs: number
     num_workers: number
@@ -48,9 +40,12 @@ export function useRouteOptimization() {
   const [error, setError] = useState<Error | null>(null)
 
   /**
-   * Call the backend API to optimize routes
+   * Optimize routes for the selected jobs and workers and save them for routeDate
+   *
+   * The backend loads the jobs and workers, and writes the routes (and any
+   * coordinates it geocoded) in one transaction.
    */
-  const optimizeRoutes = async (jobs: Job[], workers: Worker[], routeDate: string) => {
+  const optimizeRoutes = async (jobIds: string[], workerIds: string[], routeDate: string) => {
     setLoading(true)
     setError(null)
 
@@ -61,7 +56,12 @@ export function useRouteOptimization() {
         headers: {
           'Content-Type': 'application/json',
         },
-        body: JSON.stringify({ jobs, workers }),
+        body: JSON.stringify({
+          route_date: routeDate,
+          job_ids: jobIds,
+          worker_ids: workerIds,
+          save: true,
+        }),
       })
 
       const data: OptimizeRoutesResponse = await response.json()
@@ -70,12 +70,9 @@ export function useRouteOptimization() {
         throw new Error(data.error || 'Failed to optimize routes')
       }
 
-      // Save routes to Supabase
-      const savedRoutes = await saveRoutesToDatabase(data.routes, routeDate)
-
       return {
         routes: data.routes,
-        savedRoutes,
+        savedRoutes: data.saved_routes || {},
         warnings: data.warnings || [],
       }
     } catch (err) {
@@ -113,106 +110,6 @@ export function useRouteOptimization() {
     }
   }
 
-  /**
-   * Save optimized routes to Supabase database
-   */
-  const saveRoutesToDatabase = async (
-    routes: Record<string, OptimizedRoute>,
-    routeDate: string
-  ) => {
-    const savedRoutes = []
-    const workerIds = Object.values(routes).map(r => r.worker_id)
-
-    // First, delete existing routes for these workers on this date
-    console.log(`[SAVE] Deleting existing routes for ${workerIds.length} workers on ${routeDate}`)
-    
-    for (const workerId of workerIds) {
-      // Get existing route for this worker/date
-      const { data: existingRoute } = await supabase
-        .from('routes')
-        .select('id')
-        .eq('worker_id', workerId)
-        .eq('route_date', routeDate)
-        .single()
-
-      if (existingRoute) {
-        // Delete route_jobs first (foreign key constraint)
-        await supabase
-          .from('route_jobs')
-          .delete()
-          .eq('route_id', existingRoute.id)
-
-        // Clear route_id from jobs
-        await supabase
-          .from('jobs')
-          .update({ route_id: null, route_order: null })
-          .eq('route_id', existingRoute.id)
-
-        // Delete the route
-        await supabase
-          .from('routes')
-          .delete()
-          .eq('id', existingRoute.id)
-
-        console.log(`[SAVE] Deleted existing route ${existingRoute.id} for worker ${workerId}`)
-      }
-    }
-
-    // Now create new routes
-    for (const [workerId, routeData] of Object.entries(routes)) {
-      try {
-        // 1. Insert route record
-        const { data: route, error: routeError } = await supabase
-          .from('routes')
-          .insert({
-            route_date: routeDate,
-            worker_id: routeData.worker_id,
-            status: 'pending',
-            total_distance_meters: routeData.total_distance_meters,
-            total_duration_seconds: routeData.total_duration_seconds,
-            optimized_path: routeData.optimized_path,
-          })
-          .select()
-          .single()
-
-        if (routeError) throw routeError
-
-        // 2. Insert route_jobs records
-        const routeJobs = routeData.jobs.map((job) => ({
-          route_id: route.id,
-          job_id: job.job_id,
-          job_order: job.order,
-          location_lat: job.location[0],
-          location_lng: job.location[1],
-        }))
-
-        const { error: jobsError } = await supabase.from('route_jobs').insert(routeJobs)
-
-        if (jobsError) throw jobsError
-
-        // 3. Update jobs table with route_id and route_order
-        for (const job of routeData.jobs) {
-          const { error: updateError } = await supabase
-            .from('jobs')
-            .update({
-              route_id: route.id,
-              route_order: job.order,
-            })
-            .eq('id', job.job_id)
-
-          if (updateError) throw updateError
-        }
-
-        savedRoutes.push(route)
-      } catch (err) {
-        console.error(`Error saving route for worker ${workerId}:`, err)
-        throw err
-      }
-    }
-
-    return savedRoutes
-  }
-
   return {
     optimizeRoutes,
     geocodeAddresses,